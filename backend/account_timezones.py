@@ -0,0 +1,63 @@
+from datetime import date, datetime
+import threading
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Meta resolves date presets ('yesterday', 'last_7d'...) in the ad account's timezone,
+# so windows sent as time_range must be resolved with the account's date, not the server's.
+
+_timezones = {}  # ad_account_id -> timezone_name (kept for the life of the process)
+_lock = threading.Lock()
+
+
+def remember_timezone(ad_account_id, timezone_name):
+    """Cache a timezone_name read along with the account (e.g. in an account listing)"""
+    if timezone_name is not None:
+        with _lock:
+            _timezones[ad_account_id] = timezone_name
+
+
+def forget_timezones():
+    with _lock:
+        _timezones.clear()
+
+
+def account_timezone(api, ad_account_id):
+    """timezone_name of an ad account, fetched from Meta once per process"""
+    with _lock:
+        timezone_name = _timezones.get(ad_account_id)
+    if timezone_name is None:
+        from facebook_business.adobjects.adaccount import AdAccount
+        account = AdAccount(ad_account_id, api=api).api_get(fields=['timezone_name'])
+        timezone_name = account.get('timezone_name') or ''  # unknown: the server's date
+        remember_timezone(ad_account_id, timezone_name)
+    return timezone_name
+
+
+async def account_timezone_async(api, ad_account_id):
+    """account_timezone through the async Graph API client"""
+    with _lock:
+        timezone_name = _timezones.get(ad_account_id)
+    if timezone_name is None:
+        account = await api.get(ad_account_id, {'fields': 'timezone_name'})
+        timezone_name = account.get('timezone_name') or ''  # unknown: the server's date
+        remember_timezone(ad_account_id, timezone_name)
+    return timezone_name
+
+
+def today_in(timezone_name):
+    """Current date in an IANA timezone; the server's date when it is unknown"""
+    if timezone_name:
+        try:
+            return datetime.now(ZoneInfo(timezone_name)).date()
+        except ZoneInfoNotFoundError:
+            pass
+    return date.today()
+
+
+def account_today(api, ad_account_id):
+    """Today's date for an ad account, i.e. the day Meta's date presets are relative to"""
+    return today_in(account_timezone(api, ad_account_id))
+
+
+async def account_today_async(api, ad_account_id):
+    return today_in(await account_timezone_async(api, ad_account_id))
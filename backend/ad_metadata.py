@@ -0,0 +1,123 @@
+import calendar
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+
+from coalesce import coalesced
+from models import db, AdObject, AdObjectSync
+
+logger = logging.getLogger(__name__)
+
+# Seconds between delta syncs of an account (reads in between are served from the database)
+METADATA_SYNC_INTERVAL = int(os.environ.get('METADATA_SYNC_INTERVAL', 300))
+# Seconds between full listings, which also drop objects Meta no longer returns (deleted)
+METADATA_FULL_SYNC_INTERVAL = int(os.environ.get('METADATA_FULL_SYNC_INTERVAL', 24 * 3600))
+METADATA_PAGE_SIZE = int(os.environ.get('METADATA_PAGE_SIZE', 500))
+# Re-read objects updated slightly before the last one seen (clock skew, same-second updates)
+DELTA_OVERLAP = timedelta(minutes=1)
+
+OBJECT_FIELDS = {
+    'campaign': ['id', 'name', 'status', 'effective_status', 'objective', 'created_time', 'updated_time'],
+    'adset': ['id', 'name', 'status', 'effective_status', 'campaign_id', 'created_time', 'updated_time'],
+    'ad': ['id', 'name', 'status', 'effective_status', 'campaign_id', 'adset_id', 'creative',
+           'created_time', 'updated_time'],
+}
+
+# AdAccount methods listing each object type
+_EDGES = {
+    'campaign': 'get_campaigns',
+    'adset': 'get_ad_sets',
+    'ad': 'get_ads',
+}
+
+
+def parse_graph_time(value):
+    """Graph API timestamp ('2024-01-31T12:00:00+0000') as a naive UTC datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z').astimezone(timezone.utc).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def sync_ad_objects(api, ad_account_id, object_type, force=False):
+    """Bring the cached objects of one type up to date; returns how many were (re)written.
+
+    Fetches only objects with updated_time after the last one seen, except on
+    the first sync, when force is set or every METADATA_FULL_SYNC_INTERVAL.
+    """
+    now = datetime.utcnow()
+    sync = AdObjectSync.query.filter_by(ad_account_id=ad_account_id, object_type=object_type).first()
+    if not force and sync and sync.synced_at and sync.synced_at > now - timedelta(seconds=METADATA_SYNC_INTERVAL):
+        return 0
+
+    full = (force or not sync or not sync.full_synced_at or not sync.last_updated_time
+            or sync.full_synced_at < now - timedelta(seconds=METADATA_FULL_SYNC_INTERVAL))
+    params = {'limit': METADATA_PAGE_SIZE}
+    if not full:
+        since = sync.last_updated_time - DELTA_OVERLAP
+        params['filtering'] = [{'field': 'updated_time', 'operator': 'GREATER_THAN',
+                                'value': calendar.timegm(since.timetuple())}]
+
+    from facebook_business.adobjects.adaccount import AdAccount
+    ad_account = AdAccount(ad_account_id, api=api)
+    fetched = [obj.export_all_data() for obj in
+               getattr(ad_account, _EDGES[object_type])(fields=OBJECT_FIELDS[object_type], params=params)]
+
+    existing = {}
+    if full:
+        existing = {obj.object_id: obj for obj in AdObject.query.filter_by(
+            ad_account_id=ad_account_id, object_type=object_type)}
+    elif fetched:
+        existing = {obj.object_id: obj for obj in AdObject.query.filter(
+            AdObject.object_type == object_type,
+            AdObject.object_id.in_([data['id'] for data in fetched]))}
+
+    newest = sync.last_updated_time if sync and not full else None
+    for data in fetched:
+        obj = existing.pop(data['id'], None)
+        if obj is None:
+            obj = AdObject(ad_account_id=ad_account_id, object_type=object_type, object_id=data['id'])
+            db.session.add(obj)
+        obj.campaign_id = data.get('campaign_id')
+        obj.adset_id = data.get('adset_id')
+        obj.name = data.get('name')
+        obj.status = data.get('status')
+        obj.data = data
+        obj.updated_time = parse_graph_time(data.get('updated_time'))
+        obj.synced_at = now
+        if obj.updated_time and (newest is None or obj.updated_time > newest):
+            newest = obj.updated_time
+
+    # A full listing is authoritative: whatever it no longer returns was deleted
+    if full:
+        for obj in existing.values():
+            db.session.delete(obj)
+
+    if not sync:
+        sync = AdObjectSync(ad_account_id=ad_account_id, object_type=object_type)
+        db.session.add(sync)
+    sync.last_updated_time = newest
+    sync.synced_at = now
+    if full:
+        sync.full_synced_at = now
+    db.session.commit()
+
+    logger.info(f"Metadata sync {ad_account_id} {object_type}: {len(fetched)} "
+                f"{'listed' if full else 'changed'}{f', {len(existing)} removed' if full and existing else ''}")
+    return len(fetched)
+
+
+def get_ad_objects(api, ad_account_id, object_type, refresh=False, campaign_id=None):
+    """Cached objects of an account (optionally of one campaign), delta-synced first when due"""
+    # Concurrent loads of the same account share one sync
+    coalesced(f"ad_objects:{ad_account_id}:{object_type}",
+              lambda: sync_ad_objects(api, ad_account_id, object_type, force=refresh))
+
+    query = AdObject.query.filter_by(ad_account_id=ad_account_id, object_type=object_type)
+    if campaign_id:
+        query = query.filter_by(campaign_id=campaign_id)
+    # Newest first, like the Graph API listing
+    return sorted((obj.data for obj in query), key=lambda data: data.get('created_time') or '', reverse=True)
+
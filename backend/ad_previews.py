@@ -0,0 +1,205 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import threading
+import time
+
+from graph_batch import chunked, execute_batch
+
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 8))
+PREVIEW_BATCH_SIZE = int(os.environ.get('PREVIEW_BATCH_SIZE', 10))  # ads per Graph API batch call (max 50)
+PREVIEW_DEADLINE = float(os.environ.get('PREVIEW_DEADLINE', 8))  # seconds per /api/ads request
+PREVIEW_CACHE_TTL = int(os.environ.get('PREVIEW_CACHE_TTL', 6 * 3600))  # seconds
+PREVIEW_CACHE_MAX_ENTRIES = int(os.environ.get('PREVIEW_CACHE_MAX_ENTRIES', 2000))
+
+# Fields /api/ads reads from each ad
+AD_FIELDS = ['id', 'name', 'status', 'preview_shareable_link', 'creative']
+
+PREVIEW_PARAMS = {
+    'ad_format': 'DESKTOP_FEED_STANDARD',
+    'full_render': True
+}
+
+# Shared, bounded pool so a large limit cannot open unbounded connections
+_executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix='ad-preview')
+
+_cache = OrderedDict()  # (ad_id, creative_id) -> (expires_at, html)
+_cache_lock = threading.Lock()
+
+# asyncio serving mode: the same cap on concurrent batch calls, and the fetches outliving their request
+_async_slots = None
+_async_pending = set()
+
+
+def get_cached_preview(ad_id, creative_id):
+    """Return cached preview HTML, or None"""
+    key = (ad_id, creative_id)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if not entry:
+            return None
+        if entry[0] < time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+
+def store_cached_preview(ad_id, creative_id, html):
+    """Cache preview HTML, evicting the least recently used entries"""
+    with _cache_lock:
+        _cache[(ad_id, creative_id)] = (time.monotonic() + PREVIEW_CACHE_TTL, html)
+        _cache.move_to_end((ad_id, creative_id))
+        while len(_cache) > PREVIEW_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def ad_rows(ads_data):
+    """/api/ads rows of Graph API ads, and the [(ad_id, creative_id), ...] whose preview must be rendered"""
+    processed_ads = []
+    missing_previews = []
+    for ad_data in ads_data:
+        ad_info = {
+            'id': ad_data.get('id'),
+            'name': ad_data.get('name'),
+            'status': ad_data.get('status'),
+            'preview_link': ad_data.get('preview_shareable_link', '')
+        }
+
+        # Se não tiver link de prévia, gerar uma (fetch_previews)
+        if not ad_info['preview_link']:
+            creative = ad_data.get('creative') or {}
+            missing_previews.append((ad_info['id'], creative.get('id')))
+
+        processed_ads.append(ad_info)
+    return processed_ads, missing_previews
+
+
+def add_previews(processed_ads, previews):
+    """Merge the fields returned by fetch_previews/fetch_previews_async into the ad rows"""
+    for ad_info in processed_ads:
+        ad_info.update(previews.get(ad_info['id'], {}))
+    return processed_ads
+
+
+def fetch_preview_chunk(api, chunk):
+    """Render the previews of [(ad_id, creative_id), ...] in one Graph API batch call and cache them"""
+    from facebook_business.adobjects.ad import Ad
+    pending_requests = [Ad(ad_id, api=api).get_pre_views(params=PREVIEW_PARAMS, pending=True)
+                        for ad_id, _ in chunk]
+
+    results = {}
+    for (ad_id, creative_id), response in zip(chunk, execute_batch(api, pending_requests)):
+        if isinstance(response, Exception):
+            results[ad_id] = {'preview_error': str(response)}
+            continue
+
+        previews = response.get('data') or []
+        html = previews[0].get('body', '') if previews else ''
+        store_cached_preview(ad_id, creative_id, html)
+        results[ad_id] = {'preview_html': html}
+    return results
+
+
+def fetch_previews(api, ads, deadline=None):
+    """Fetch previews for [(ad_id, creative_id), ...] concurrently.
+
+    Uncached ads are split into batch calls of PREVIEW_BATCH_SIZE that run in
+    parallel. Returns a dict ad_id -> fields to merge into the ad:
+    'preview_html', 'preview_error', or 'preview_status': 'pending' when the
+    fetch did not finish before the deadline. Pending fetches keep running and
+    land in the cache, so the next request gets them.
+    """
+    deadline = PREVIEW_DEADLINE if deadline is None else deadline
+    results = {}
+    uncached = []
+
+    for ad_id, creative_id in ads:
+        html = get_cached_preview(ad_id, creative_id)
+        if html is not None:
+            results[ad_id] = {'preview_html': html}
+        else:
+            uncached.append((ad_id, creative_id))
+
+    futures = {_executor.submit(fetch_preview_chunk, api, chunk): chunk
+               for chunk in chunked(uncached, PREVIEW_BATCH_SIZE)}
+
+    done, not_done = wait(futures, timeout=deadline)
+
+    for future in done:
+        try:
+            results.update(future.result())
+        except Exception as preview_error:
+            for ad_id, _ in futures[future]:
+                results[ad_id] = {'preview_error': str(preview_error)}
+
+    for future in not_done:
+        for ad_id, _ in futures[future]:
+            results[ad_id] = {'preview_status': 'pending'}
+
+    return results
+
+
+async def fetch_preview_chunk_async(api, chunk):
+    """fetch_preview_chunk through an AsyncGraphApi (async_graph)"""
+    global _async_slots
+    if _async_slots is None:
+        _async_slots = asyncio.Semaphore(PREVIEW_WORKERS)
+    async with _async_slots:
+        responses = await api.batch([(f"{ad_id}/previews", PREVIEW_PARAMS) for ad_id, _ in chunk])
+
+    results = {}
+    for (ad_id, creative_id), response in zip(chunk, responses):
+        if isinstance(response, Exception):
+            results[ad_id] = {'preview_error': str(response)}
+            continue
+
+        previews = response.get('data') or []
+        html = previews[0].get('body', '') if previews else ''
+        store_cached_preview(ad_id, creative_id, html)
+        results[ad_id] = {'preview_html': html}
+    return results
+
+
+def _finish_pending_preview(task):
+    _async_pending.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Erro ao buscar prévias: {task.exception()}")
+
+
+async def fetch_previews_async(api, ads, deadline=None):
+    """fetch_previews for the asyncio serving mode: same cache, batching, deadline and results"""
+    deadline = PREVIEW_DEADLINE if deadline is None else deadline
+    results = {}
+    uncached = []
+
+    for ad_id, creative_id in ads:
+        html = get_cached_preview(ad_id, creative_id)
+        if html is not None:
+            results[ad_id] = {'preview_html': html}
+        else:
+            uncached.append((ad_id, creative_id))
+
+    tasks = {asyncio.ensure_future(fetch_preview_chunk_async(api, chunk)): chunk
+             for chunk in chunked(uncached, PREVIEW_BATCH_SIZE)}
+    if not tasks:
+        return results
+
+    done, not_done = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in done:
+        try:
+            results.update(task.result())
+        except Exception as preview_error:
+            for ad_id, _ in tasks[task]:
+                results[ad_id] = {'preview_error': str(preview_error)}
+
+    for task in not_done:
+        # Keep a reference so the fetch finishes (and fills the cache) after the response
+        _async_pending.add(task)
+        task.add_done_callback(_finish_pending_preview)
+        for ad_id, _ in tasks[task]:
+            results[ad_id] = {'preview_status': 'pending'}
+
+    return results
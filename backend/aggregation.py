@@ -0,0 +1,89 @@
+from date_ranges import iter_days
+from metrics import timed
+
+# Metrics summed across rows (reach/frequency are not additive across days)
+SUM_METRICS = ['spend', 'impressions', 'clicks']
+
+
+def insights_frame(rows):
+    """Parse processed insight rows once into a DataFrame with numeric metric columns"""
+    import pandas as pd  # imported on first use: pandas alone doubles worker startup
+
+    frame = pd.DataFrame.from_records(rows)
+    if frame.empty:
+        return frame
+
+    for column in SUM_METRICS:
+        if column not in frame:
+            frame[column] = 0
+    metric_columns = [column for column in frame.columns
+                      if column in SUM_METRICS or column in ('reach', 'frequency', 'cpc', 'ctr')
+                      or column.startswith('action_') or column.startswith('value_')]
+    frame[metric_columns] = frame[metric_columns].apply(pd.to_numeric, errors='coerce').fillna(0)
+    return frame
+
+
+def add_ratios(frame):
+    """Derive CPC, CTR (%) and CPM from summed spend/impressions/clicks"""
+    clicks = frame['clicks'].where(frame['clicks'] > 0)
+    impressions = frame['impressions'].where(frame['impressions'] > 0)
+    frame['cpc'] = (frame['spend'] / clicks).fillna(0).round(4)
+    frame['ctr'] = (frame['clicks'] / impressions * 100).fillna(0).round(4)
+    frame['cpm'] = (frame['spend'] / impressions * 1000).fillna(0).round(4)
+    frame['spend'] = frame['spend'].round(2)
+    return frame
+
+
+def to_columnar(frame, columns):
+    """Compact {column: [values...]} JSON-ready representation"""
+    return {column: frame[column].tolist() for column in columns}
+
+
+@timed('aggregate')
+def summarize_insights(rows, top_n=10, window=None):
+    """Daily totals, top-N campaigns by spend and overall totals of account insight rows.
+
+    window is the resolved (since, until) of the request; when given, days
+    without rows are filled with zeros so the series covers the whole range.
+    """
+    import pandas as pd
+
+    frame = insights_frame(rows)
+    ratio_columns = SUM_METRICS + ['cpc', 'ctr', 'cpm']
+
+    if frame.empty:
+        frame = pd.DataFrame({column: pd.Series(dtype='float64') for column in SUM_METRICS})
+        frame['date_start'] = pd.Series(dtype='object')
+        frame['campaign_id'] = pd.Series(dtype='object')
+        frame['campaign_name'] = pd.Series(dtype='object')
+
+    action_columns = [column for column in frame.columns
+                      if column.startswith('action_') or column.startswith('value_')]
+
+    # Daily totals
+    daily = frame.groupby('date_start')[SUM_METRICS].sum()
+    if window:
+        all_days = [day.isoformat() for day in iter_days(*window)]
+        daily = daily.reindex(all_days, fill_value=0)
+    daily = add_ratios(daily.sort_index().reset_index(names='date'))
+
+    # Top campaigns by spend
+    campaigns = frame.groupby('campaign_id', dropna=False).agg(
+        campaign_name=('campaign_name', 'last'),
+        **{metric: (metric, 'sum') for metric in SUM_METRICS}
+    )
+    campaigns = add_ratios(campaigns.nlargest(top_n, 'spend').reset_index())
+
+    # Overall totals (plus every action/value column)
+    totals_frame = add_ratios(frame[SUM_METRICS].sum().to_frame().T)
+    totals = {column: float(totals_frame[column].iloc[0]) for column in ratio_columns}
+    totals['impressions'] = int(totals['impressions'])
+    totals['clicks'] = int(totals['clicks'])
+    for column in action_columns:
+        totals[column] = round(float(frame[column].sum()), 2)
+
+    return {
+        'totals': totals,
+        'daily': to_columnar(daily, ['date'] + ratio_columns),
+        'top_campaigns': to_columnar(campaigns, ['campaign_id', 'campaign_name'] + ratio_columns)
+    }
@@ -1,52 +1,106 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Blueprint, current_app, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
-from facebook_business.api import FacebookAdsApi
-from facebook_business.adobjects.adaccount import AdAccount
-from facebook_business.adobjects.campaign import Campaign
-from facebook_business.adobjects.adsinsights import AdsInsights
 import os
 import json
-import pandas as pd
+import logging
 from datetime import datetime, timedelta
-import tempfile
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+from io import BytesIO
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import jwt
 import secrets
 from dotenv import load_dotenv
-from models import db, BusinessManager, Report, SharedLink
-import uuid
 
-# Load environment variables
+# Load environment variables (before the local modules read their settings)
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+from models import db, BusinessManager, Report, SharedLink, InsightsJob, PdfReport
+from insights_cache import (make_cache_key, cache_ttl, get_cached_insights,
+                            store_cached_insights, invalidate_cached_insights, wants_refresh)
+from date_ranges import resolve_date_window, custom_preset_label, parse_custom_preset
+from account_timezones import account_today, remember_timezone
+from daily_insights import sync_daily_insights, sync_daily_insights_batch
+from insights_requests import (apply_date_params, account_insights_params, account_cache_key, campaign_insights_params,
+                               campaign_cache_key, daily_range_params, lookup_cached_insights,
+                               save_account_insights, save_campaign_insights)
+from insights import (ACCOUNT_INSIGHT_FIELDS, CAMPAIGN_INSIGHT_FIELDS, fetch_insight_dicts, fetch_insight_dicts_batch,
+                      iter_insights, flatten_insight,
+                      normalize_rows, sum_insight_metrics, daily_insight_metrics)
+from coalesce import coalesced
+from prewarm import prewarm_all, start_prewarm_scheduler, PREWARM_PRESETS
+from aggregation import summarize_insights
+from insights_format import columnar_insights, wants_columnar, wants_ndjson
+from compression import init_compression
+from metrics import init_metrics
+from reports import (compact_reports, list_reports, hash_insights,
+                     REPORTS_PAGE_SIZE, REPORTS_MAX_PAGE_SIZE)
+from migrations import run_migrations
+from insights_jobs import create_insights_job, start_insights_job, expire_stale_jobs
+from graph_client import get_api, evict_api, init_default_api
+from rate_limits import (RateLimitError, tracker as usage_tracker, USAGE_SLOWDOWN_PCT, USAGE_PAUSE_PCT,
+                         MAX_RETRIES, MAX_WAIT)
+from bm_cache import get_bm, invalidate_bm
+from ad_previews import AD_FIELDS, ad_rows, add_previews, fetch_previews
+from ad_metadata import get_ad_objects
+from pdf_reports import (create_pdf_job, start_pdf_job, start_bulk_pdf_job, find_cached_pdf,
+                         expire_pdf_reports, report_section, PDF_SYNC_WAIT, PDF_BULK_MAX_ITEMS)
+import uuid
+import click
+
+logger = logging.getLogger(__name__)
 
 # Configuration
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 APP_SECRET = os.environ.get('APP_SECRET', secrets.token_hex(24))
 ACCESS_TOKEN = os.environ.get('META_ACCESS_TOKEN')
 APP_ID = os.environ.get('META_APP_ID')
 APP_SECRET_KEY = os.environ.get('META_APP_SECRET')
 
-# PostgreSQL configuration
-DB_URI = f"postgresql://{os.environ.get('POSTGRES_USER')}:{os.environ.get('POSTGRES_PASSWORD')}@{os.environ.get('POSTGRES_HOST')}/{os.environ.get('POSTGRES_DB')}"
-app.config['SQLALCHEMY_DATABASE_URI'] = DB_URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Browser/proxy cache lifetime of shared report snapshots (seconds)
+SHARED_REPORT_MAX_AGE = int(os.environ.get('SHARED_REPORT_MAX_AGE', 3600))
+
+# Cross-account insights (/api/bm-insights, /api/bulk-pdf): batch calls of up to 50 accounts run in parallel
+BM_INSIGHTS_CONCURRENCY = int(os.environ.get('BM_INSIGHTS_CONCURRENCY', 5))
+BM_INSIGHTS_TIMEOUT = float(os.environ.get('BM_INSIGHTS_TIMEOUT', 60))  # seconds
+
+# Optional Graph API base URL override (e.g. a local fake Graph API server for testing)
+GRAPH_URL = os.environ.get('META_GRAPH_URL')
 
-# Initialize SQLAlchemy with app
-db.init_app(app)
+# PostgreSQL configuration (DATABASE_URL overrides it, e.g. a scratch database for benchmarks)
+DB_URI = os.environ.get('DATABASE_URL') or f"postgresql://{os.environ.get('POSTGRES_USER')}:{os.environ.get('POSTGRES_PASSWORD')}@{os.environ.get('POSTGRES_HOST')}/{os.environ.get('POSTGRES_DB')}"
 
-# Initialize Meta API
-FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, ACCESS_TOKEN)
+# Every route and CLI command; create_app() registers them (commands stay top-level: flask init-db)
+routes = Blueprint('routes', __name__, cli_group=None)
 
-# Create database tables within the application context
-with app.app_context():
+@routes.cli.command('init-db')
+def init_db_command():
+    """Create the database tables and apply the migrations (run once per deploy, not per worker)"""
     db.create_all()
+    run_migrations()
+    click.echo("Database initialized")
 
-@app.route('/')
+@routes.cli.command('compact-reports')
+@click.option('--retention-days', type=int, default=None, help='Delete reports older than this (default REPORT_RETENTION_DAYS)')
+def compact_reports_command(retention_days):
+    """Prune duplicate and expired reports"""
+    deleted = compact_reports(retention_days)
+    click.echo(f"Deleted {deleted} reports")
+
+@routes.cli.command('prewarm-insights')
+@click.option('--preset', 'presets', multiple=True, help=f"Date preset to warm (repeatable, default {','.join(PREWARM_PRESETS)})")
+@click.option('--concurrency', type=int, default=None, help='Concurrent fetches per BM (default PREWARM_CONCURRENCY)')
+@click.option('--bm-id', default=None, help='Only warm this Business Manager')
+def prewarm_insights_command(presets, concurrency, bm_id):
+    """Fetch the common presets of every ad account into the insights cache (run off-peak)"""
+    prewarm_all(current_app._get_current_object(), prewarm_account_insights, list(presets) or None, concurrency, bm_id)
+
+def rate_limited(error):
+    """429 response for a call held back by the Meta API rate limits"""
+    retry_after = max(1, int(error.retry_after + 0.999))
+    response = jsonify({'error': str(error), 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+@routes.route('/')
 def index():
     """API documentation and information"""
     api_routes = {
@@ -54,15 +108,26 @@ def index():
         "/api/bm-accounts": "Get list of registered Business Managers (GET)",
         "/api/bm-accounts/<string:bm_id>": "Delete a Business Manager account (DELETE)",
         "/api/ad-accounts": "Get list of ad accounts for a Business Manager (GET)",
-        "/api/campaigns": "Get campaigns for a specific ad account (GET)",
+        "/api/campaigns": "Get campaigns for a specific ad account, from the synced metadata cache (GET, refresh=1 to relist)",
         "/api/campaign-insights": "Get insights for a specific campaign (GET)",
-        "/api/account-insights": "Get insights for a specific ad account (GET)",
-        "/api/generate-pdf": "Generate a PDF report (POST)",
+        "/api/account-insights": "Get insights for a specific ad account (GET, format=columnar for the compact encoding, format=ndjson to stream)",
+        "/api/account-insights/summary": "Get daily totals and top campaigns for an ad account (GET)",
+        "/api/bm-insights": "Get insights rolled up across all ad accounts of a Business Manager (GET)",
+        "/api/insights-jobs": "Start an asynchronous insights report for an ad account (POST)",
+        "/api/insights-jobs/<id>": "Get status, progress and result of an insights job (GET)",
+        "/api/generate-pdf": "Generate a PDF report (POST; 202 with the job if it takes longer than PDF_SYNC_WAIT)",
+        "/api/pdf-jobs": "Queue a PDF report (POST)",
+        "/api/bulk-pdf": "Queue a multi-section report of several accounts/campaigns, as a zip or merged PDF (POST)",
+        "/api/pdf-jobs/<id>": "Get the status of a PDF job (GET)",
+        "/api/pdf-jobs/<id>/download": "Download the PDF of a completed job (GET)",
         "/api/create-share-link": "Create a shareable link (POST)",
         "/api/validate-share-link": "Validate a share link token (GET)",
-        "/api/reports": "Get list of saved reports (GET)",
+        "/api/shared/<token>": "Get the pinned data of a share link (GET)",
+        "/api/reports": "Get a page of saved reports; supports limit, cursor, bm_id, include_data (GET)",
         "/api/reports/<id>": "Get a specific report by ID (GET)",
-        "/api/ads": "Get ads for a specific ad account or campaign (GET)"
+        "/api/ads": "Get ads for a specific ad account or campaign (GET)",
+        "/api/rate-limits": "Get the Meta API usage reported per app, BM and ad account (GET)",
+        "/metrics": "Prometheus metrics: request phases, Graph API calls and bytes (GET)"
     }
     
     html = """
@@ -100,7 +165,7 @@ def index():
     
     return html
 
-@app.route('/api/register-bm', methods=['POST'])
+@routes.route('/api/register-bm', methods=['POST'])
 def register_bm():
     """Register a new Business Manager account"""
     data = request.json
@@ -111,15 +176,14 @@ def register_bm():
         return jsonify({'error': 'BM ID and access token are required'}), 400
     
     try:
-        # Test the connection
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, access_token)
-        
         # Check if BM already exists
         existing_bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
         if existing_bm:
             # Update existing BM
             existing_bm.access_token = access_token
             db.session.commit()
+            invalidate_bm(bm_id)
+            evict_api(bm_id)
             return jsonify({'success': True, 'message': f'BM {bm_id} updated successfully'})
         
         # Create new BM
@@ -129,20 +193,20 @@ def register_bm():
         
         return jsonify({'success': True, 'message': f'BM {bm_id} registered successfully'})
     except Exception as e:
-        print(f"Erro ao registrar BM account: {str(e)}")
+        logger.exception("Erro ao registrar BM account")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bm-accounts', methods=['GET'])
+@routes.route('/api/bm-accounts', methods=['GET'])
 def get_bm_accounts():
     """Get list of registered Business Manager accounts"""
     try:
         bm_accounts = BusinessManager.query.all()
         return jsonify({'bm_accounts': [bm.bm_id for bm in bm_accounts]})
     except Exception as e:
-        print(f"Erro ao buscar BM accounts: {str(e)}")
+        logger.exception("Erro ao buscar BM accounts")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bm-accounts/<string:bm_id>', methods=['DELETE'])
+@routes.route('/api/bm-accounts/<string:bm_id>', methods=['DELETE'])
 def delete_bm_account(bm_id):
     """Delete a Business Manager account"""
     try:
@@ -155,13 +219,18 @@ def delete_bm_account(bm_id):
         # Remove the BM from the database
         db.session.delete(bm)
         db.session.commit()
+        invalidate_bm(bm_id)
+        evict_api(bm_id)
+        
+        # Cached insights were fetched with this BM's token
+        invalidate_cached_insights(bm_id)
         
         return jsonify({'success': True, 'message': f'Business Manager {bm_id} deleted successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/ad-accounts', methods=['GET'])
+@routes.route('/api/ad-accounts', methods=['GET'])
 def get_ad_accounts():
     """Get list of ad accounts for a specific Business Manager"""
     bm_id = request.args.get('bm_id')
@@ -171,26 +240,28 @@ def get_ad_accounts():
     
     try:
         # Retrieve BM from database
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Set up the API with the specific BM token
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, bm.access_token)
+        # Pooled API client for the specific BM token
+        api = get_api(bm)
         
         # Get ad accounts
         from facebook_business.adobjects.business import Business
-        business = Business(bm_id)
+        business = Business(bm_id, api=api)
         accounts = business.get_owned_ad_accounts(fields=['id', 'name', 'account_status'])
         
         return jsonify({
             'ad_accounts': [{'id': account['id'], 'name': account['name']} for account in accounts]
         })
+    except RateLimitError as e:
+        return rate_limited(e)
     except Exception as e:
-        print(f"Erro ao buscar anúncios: {str(e)}")
+        logger.exception("Erro ao buscar anúncios")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/campaigns', methods=['GET'])
+@routes.route('/api/campaigns', methods=['GET'])
 def get_campaigns():
     """Get campaigns for a specific ad account"""
     ad_account_id = request.args.get('ad_account_id')
@@ -204,29 +275,28 @@ def get_campaigns():
     
     try:
         # Retrieve BM from database
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Set up the API with the specific BM token
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, bm.access_token)
+        # Pooled API client for the specific BM token
+        api = get_api(bm)
         
-        # Get campaigns
-        ad_account = AdAccount(ad_account_id)
-        campaigns = ad_account.get_campaigns(fields=[
-            'id', 'name', 'status', 'objective', 'created_time'
-        ])
+        # Get campaigns (local metadata cache, delta-synced by updated_time)
+        campaigns = get_ad_objects(api, ad_account_id, 'campaign', refresh=wants_refresh(request.args))
         
         return jsonify({
             'campaigns': [{'id': campaign['id'], 'name': campaign['name'], 
                           'status': campaign['status'], 'objective': campaign.get('objective')} 
                          for campaign in campaigns]
         })
+    except RateLimitError as e:
+        return rate_limited(e)
     except Exception as e:
-        print(f"Erro ao buscar campaigns: {str(e)}")
+        logger.exception("Erro ao buscar campaigns")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/campaign-insights', methods=['GET'])
+@routes.route('/api/campaign-insights', methods=['GET'])
 def get_campaign_insights():
     """Get insights for a specific campaign"""
     campaign_id = request.args.get('campaign_id')
@@ -241,74 +311,44 @@ def get_campaign_insights():
     
     try:
         # Retrieve BM from database
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Set up the API with the specific BM token
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, bm.access_token)
-        
-        # Get insights
-        campaign = Campaign(campaign_id)
-        insights = campaign.get_insights(
-            fields=[
-                'campaign_name',
-                'spend',
-                'impressions',
-                'clicks',
-                'cpc',
-                'ctr',
-                'reach',
-                'frequency',
-                'actions',
-                'action_values'
-            ],
-            params={
-                'date_preset': date_preset,
-                'level': 'campaign'
-            }
-        )
+        params = campaign_insights_params(date_preset)
         
-        # Process insights
-        processed_insights = []
-        for insight in insights:
-            insight_data = {
-                'campaign_name': insight.get('campaign_name'),
-                'spend': insight.get('spend'),
-                'impressions': insight.get('impressions'),
-                'clicks': insight.get('clicks'),
-                'cpc': insight.get('cpc'),
-                'ctr': insight.get('ctr'),
-                'reach': insight.get('reach'),
-                'frequency': insight.get('frequency'),
-            }
+        # Serve from the local cache when possible
+        cache_key = campaign_cache_key(bm_id, campaign_id, params)
+        refresh = wants_refresh(request.args)
+        cached_insights = lookup_cached_insights(cache_key, refresh)
+        if cached_insights is not None:
+            return jsonify({'insights': cached_insights})
+        
+        def fetch():
+            # Pooled API client for the specific BM token
+            api = get_api(bm)
             
-            # Process actions
-            if 'actions' in insight:
-                for action in insight['actions']:
-                    action_type = action.get('action_type')
-                    value = action.get('value')
-                    insight_data[f"action_{action_type}"] = value
+            # Get insights
+            from facebook_business.adobjects.campaign import Campaign
+            campaign = Campaign(campaign_id, api=api)
+            processed_insights = fetch_campaign_insight_rows(campaign, params)
             
-            # Process action values
-            if 'action_values' in insight:
-                for action_value in insight['action_values']:
-                    action_type = action_value.get('action_type')
-                    value = action_value.get('value')
-                    insight_data[f"value_{action_type}"] = value
-                    
-            processed_insights.append(insight_data)
+            # Save to database
+            save_campaign_insights(cache_key, bm_id, campaign_id, params, processed_insights)
+            return processed_insights
         
-        # Save to database
-        report_name = f"Campaign Insights: {processed_insights[0].get('campaign_name', campaign_id)}"
-        save_report(report_name, 'campaign', bm_id, campaign_id, date_preset, processed_insights)
+        # Identical concurrent requests share one fetch
+        processed_insights = coalesced(cache_key, fetch,
+                                       recheck=None if refresh else lambda: get_cached_insights(cache_key))
         
         return jsonify({'insights': processed_insights})
+    except RateLimitError as e:
+        return rate_limited(e)
     except Exception as e:
-        print(f"Erro ao buscar campaign insights: {str(e)}")
+        logger.exception("Erro ao buscar campaign insights")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/account-insights', methods=['GET'])
+@routes.route('/api/account-insights', methods=['GET'])
 def get_account_insights():
     """Get insights for a specific ad account"""
     ad_account_id = request.args.get('ad_account_id')
@@ -325,266 +365,581 @@ def get_account_insights():
     
     try:
         # Retrieve BM from database
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
+        if not bm:
+            return jsonify({'error': 'Invalid BM ID'}), 400
+        
+        # Streamed straight from Meta, page by page, without holding the result
+        if wants_ndjson(request.args):
+            return stream_account_insights(bm, ad_account_id, date_preset, start_date, end_date,
+                                           refresh=wants_refresh(request.args))
+        
+        processed_insights = load_account_insight_rows(bm, ad_account_id, date_preset, start_date, end_date,
+                                                       refresh=wants_refresh(request.args))
+        
+        # Opt-in compact encoding for large windows
+        if wants_columnar(request.args):
+            return jsonify({'insights': columnar_insights(processed_insights)})
+        
+        return jsonify({'insights': processed_insights})
+    except RateLimitError as e:
+        return rate_limited(e)
+    except Exception as e:
+        logger.exception("Erro ao buscar account insights")
+        return jsonify({'error': str(e)}), 500
+
+def load_account_insight_rows(bm, ad_account_id, date_preset, start_date, end_date, refresh=False, ttl=None):
+    """Campaign-level daily rows of an ad account: from the cache, or fetched (daily store/Meta) and saved.
+    
+    ttl overrides the cache TTL of a fetch (prewarm keeps its entries until the morning peak).
+    """
+    # Prepare params based on date selection
+    params = account_insights_params(date_preset, start_date, end_date)
+    
+    # Serve from the local cache when possible
+    cache_key = account_cache_key(bm.bm_id, ad_account_id, params)
+    cached_insights = lookup_cached_insights(cache_key, refresh)
+    if cached_insights is not None:
+        return cached_insights
+    
+    def fetch():
+        # Pooled API client for the specific BM token
+        api = get_api(bm)
+        from facebook_business.adobjects.adaccount import AdAccount
+        ad_account = AdAccount(ad_account_id, api=api)
+        
+        processed_insights = fetch_account_insights(ad_account, params, start_date, end_date, refresh=refresh)
+        
+        # Save to database
+        save_account_insights(cache_key, bm.bm_id, ad_account_id, params, start_date, end_date, processed_insights,
+                              today=account_today(api, ad_account_id), ttl=ttl)
+        
+        return processed_insights
+    
+    # Identical concurrent requests (several screens, a shared link) share one fetch,
+    # across gunicorn workers through a Postgres advisory lock
+    return coalesced(cache_key, fetch, recheck=None if refresh else lambda: get_cached_insights(cache_key))
+
+def prewarm_account_insights(bm, ad_account_id, date_preset, ttl=None):
+    """Warm the cache and daily store for one account/preset, exactly as a dashboard load would"""
+    load_account_insight_rows(bm, ad_account_id, date_preset, None, None, ttl=ttl)
+
+def stream_account_insights(bm, ad_account_id, date_preset, start_date, end_date, refresh=False):
+    """NDJSON response of campaign-level daily rows, written as the Graph API pages arrive.
+    
+    Cached rows are streamed when available; otherwise rows are fetched lazily
+    and neither cached nor saved as a report, so memory stays bounded by one
+    page. A failure after the first row ends the stream with an {"error": ...} line.
+    """
+    params = account_insights_params(date_preset, start_date, end_date)
+    
+    cached_insights = lookup_cached_insights(account_cache_key(bm.bm_id, ad_account_id, params), refresh)
+    from facebook_business.adobjects.adaccount import AdAccount
+    ad_account = AdAccount(ad_account_id, api=get_api(bm))
+    
+    def generate():
+        try:
+            if cached_insights is not None:
+                for row in cached_insights:
+                    yield json.dumps(row) + '\n'
+                return
+            for insight in iter_insights(ad_account, ACCOUNT_INSIGHT_FIELDS, params):
+                yield json.dumps(flatten_insight(insight)) + '\n'
+        except Exception as e:
+            logger.exception("Erro no streaming de account insights")
+            yield json.dumps({'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@routes.route('/api/account-insights/summary', methods=['GET'])
+def get_account_insights_summary():
+    """Get daily totals, top campaigns and derived CPC/CTR/CPM for an ad account (columnar JSON)"""
+    ad_account_id = request.args.get('ad_account_id')
+    bm_id = request.args.get('bm_id')
+    date_preset = request.args.get('date_preset')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    if not ad_account_id:
+        return jsonify({'error': 'Ad account ID is required'}), 400
+    
+    if not bm_id:
+        return jsonify({'error': 'Missing BM ID'}), 400
+    
+    try:
+        top = int(request.args.get('top', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid top'}), 400
+    
+    try:
+        # Retrieve BM from database
+        bm = get_bm(bm_id)
+        if not bm:
+            return jsonify({'error': 'Invalid BM ID'}), 400
+        
+        processed_insights = load_account_insight_rows(bm, ad_account_id, date_preset, start_date, end_date,
+                                                       refresh=wants_refresh(request.args))
+        
+        window = resolve_date_window(date_preset if date_preset != 'custom' else None, start_date, end_date,
+                                     today=account_today(get_api(bm), ad_account_id))
+        return jsonify(summarize_insights(processed_insights, top_n=top, window=window))
+    except RateLimitError as e:
+        return rate_limited(e)
+    except Exception as e:
+        logger.exception("Erro ao resumir account insights")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/api/bm-insights', methods=['GET'])
+def get_bm_insights():
+    """Get insights rolled up across every ad account of a Business Manager"""
+    bm_id = request.args.get('bm_id')
+    date_preset = request.args.get('date_preset')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    refresh = wants_refresh(request.args)
+    
+    if not bm_id:
+        return jsonify({'error': 'Missing BM ID'}), 400
+    
+    try:
+        # Retrieve BM from database
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Set up the API with the specific BM token
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, bm.access_token)
+        api = get_api(bm)
+        
+        # List the accounts the same way /api/ad-accounts does
+        from facebook_business.adobjects.business import Business
+        business = Business(bm_id, api=api)
+        accounts = []
+        for account in business.get_owned_ad_accounts(fields=['id', 'name', 'account_status', 'timezone_name']):
+            remember_timezone(account['id'], account.get('timezone_name'))
+            accounts.append({'id': account['id'], 'name': account['name']})
+        
+        params = account_insights_params(date_preset, start_date, end_date)
+        
+        # Cached accounts first; the rest are fetched together in Graph API batch calls
+        cache_keys = {account['id']: account_cache_key(bm_id, account['id'], params) for account in accounts}
+        results = {}
+        for account in accounts:
+            cached_insights = lookup_cached_insights(cache_keys[account['id']], refresh)
+            if cached_insights is not None:
+                results[account['id']] = (cached_insights, None)
+        missing = [account['id'] for account in accounts if account['id'] not in results]
+        
+        def fetch():
+            fetched = fetch_accounts_insights(api, missing, params, start_date, end_date, refresh=refresh)
+            for ad_account_id, (rows, error) in zip(missing, fetched):
+                if error is None:
+                    ttl = cache_ttl(params.get('date_preset'), start_date, end_date,
+                                    today=account_today(api, ad_account_id))
+                    store_cached_insights(cache_keys[ad_account_id], 'ad_account', bm_id, ad_account_id, params,
+                                          rows, ttl)
+            return fetched
+        
+        def recheck():
+            cached = [get_cached_insights(cache_keys[ad_account_id]) for ad_account_id in missing]
+            if any(rows is None for rows in cached):
+                return None
+            return [(rows, None) for rows in cached]
+        
+        if missing:
+            # Identical concurrent requests share one fetch
+            fetch_key = make_cache_key('bm_insights', bm_id, bm_id, dict(params, ad_account_ids=missing))
+            results.update(zip(missing, coalesced(fetch_key, fetch, recheck=None if refresh else recheck)))
+        
+        account_summaries = []
+        errors = []
+        all_rows = []
+        for account in accounts:
+            rows, error = results[account['id']]
+            if error:
+                errors.append({'ad_account_id': account['id'], 'name': account['name'], 'error': error})
+                continue
+            all_rows.extend(rows)
+            account_summaries.append({
+                'ad_account_id': account['id'],
+                'name': account['name'],
+                'totals': sum_insight_metrics(rows)
+            })
+        
+        return jsonify({
+            'bm_id': bm_id,
+            'totals': sum_insight_metrics(all_rows),
+            'daily': daily_insight_metrics(all_rows),
+            'accounts': account_summaries,
+            'errors': errors,
+            'partial': bool(errors)
+        })
+    except RateLimitError as e:
+        return rate_limited(e)
+    except Exception as e:
+        logger.exception("Erro ao buscar BM insights")
+        return jsonify({'error': str(e)}), 500
+
+def fetch_campaign_insight_rows(campaign, params):
+    """Fetch insights for a campaign and flatten them into rows"""
+    return fetch_insight_dicts(campaign, CAMPAIGN_INSIGHT_FIELDS, params)
+
+def fetch_account_insights(ad_account, params, start_date=None, end_date=None, refresh=False):
+    """Fetch campaign-level daily rows for an ad account, through the daily store when the window is known.
+    
+    Presets are resolved with the account's date, as Meta resolves them in the account's timezone.
+    """
+    today = account_today(ad_account.get_api_assured(), ad_account.get_id())
+    window = resolve_date_window(params.get('date_preset'), start_date, end_date, today=today)
+    if not window:
+        return fetch_account_insight_rows(ad_account, params)
+    
+    # Fetch only the days that are missing locally or may still change
+    def fetch_rows(since, until):
+        return fetch_account_insight_rows(ad_account, daily_range_params(since, until))
+    
+    return sync_daily_insights(ad_account.get_id(), window[0], window[1], fetch_rows, force=refresh, today=today)
+
+def fetch_accounts_insights(api, ad_account_ids, params, start_date=None, end_date=None, refresh=False):
+    """fetch_account_insights for several ad accounts, through Graph API batch calls.
+    
+    Returns a list aligned with ad_account_ids of (rows, error); one failed
+    account doesn't sink the rest.
+    """
+    def fetch_batch(requests):
+        return fetch_insight_dicts_batch(api, requests, ACCOUNT_INSIGHT_FIELDS,
+                                         BM_INSIGHTS_CONCURRENCY, BM_INSIGHTS_TIMEOUT)
+    
+    if not resolve_date_window(params.get('date_preset'), start_date, end_date):
+        results = fetch_batch([(ad_account_id, params) for ad_account_id in ad_account_ids])
+        return [(None, str(result)) if isinstance(result, Exception) else (result, None) for result in results]
+    
+    # Each account's window is resolved with its own date (accounts may be in different timezones)
+    windows = []
+    for ad_account_id in ad_account_ids:
+        today = account_today(api, ad_account_id)
+        windows.append((ad_account_id,) + resolve_date_window(params.get('date_preset'), start_date, end_date,
+                                                               today=today) + (today,))
+    
+    # Missing/mutable days of every account in the same batch calls
+    def fetch_ranges(ranges):
+        return fetch_batch([(ad_account_id, daily_range_params(since, until))
+                            for ad_account_id, since, until in ranges])
+    
+    return sync_daily_insights_batch(windows, fetch_ranges, force=refresh)
+
+def fetch_account_insight_rows(ad_account, params):
+    """Fetch campaign-level insights for an ad account and flatten them into rows"""
+    return fetch_insight_dicts(ad_account, ACCOUNT_INSIGHT_FIELDS, params)
+
+@routes.route('/api/insights-jobs', methods=['POST'])
+def create_insights_job_route():
+    """Start an asynchronous insights report for a specific ad account"""
+    data = request.json
+    bm_id = data.get('bm_id')
+    ad_account_id = data.get('ad_account_id')
+    date_preset = data.get('date_preset')
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    level = data.get('level', 'campaign')
+    
+    if not ad_account_id:
+        return jsonify({'error': 'Ad account ID is required'}), 400
+    
+    if not bm_id:
+        return jsonify({'error': 'Missing BM ID'}), 400
+    
+    if level not in ('account', 'campaign'):
+        return jsonify({'error': "Level must be 'account' or 'campaign'"}), 400
+    
+    try:
+        # Retrieve BM from database
+        bm = get_bm(bm_id)
+        if not bm:
+            return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Prepare params based on date selection
         params = {
-            'level': 'account',
-            'time_increment': 1  # Solicitando breakdown por dia (diário)
+            'level': level,
+            'time_increment': 1
         }
+        apply_date_params(params, date_preset, start_date, end_date)
         
-        # Log date parameters for debugging
-        print(f"Date parameters received: preset={date_preset}, start_date={start_date}, end_date={end_date}")
-        
-        if date_preset and date_preset != 'custom':
-            # Use the pre-defined date preset
-            params['date_preset'] = date_preset
-            print(f"Using date preset: {date_preset}")
-        elif start_date and end_date:
-            # Use custom date range
-            params['time_range'] = json.dumps({
-                'since': start_date,
-                'until': end_date
-            })
-            print(f"Using custom date range: {start_date} to {end_date}")
+        # The job thread uses the BM's pooled client, never the process-wide default
+        api = get_api(bm)
+        
+        # Campaign-level daily rows also feed the daily insights store
+        window = None
+        if level == 'campaign':
+            window = resolve_date_window(params.get('date_preset'), start_date, end_date,
+                                         today=account_today(api, ad_account_id))
+        
+        job = create_insights_job(bm_id, ad_account_id, params)
+        start_insights_job(current_app._get_current_object(), job.id, api, window)
+        
+        return jsonify(job.to_dict()), 202
+    except RateLimitError as e:
+        db.session.rollback()
+        return rate_limited(e)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Erro ao criar insights job")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/api/insights-jobs/<string:job_id>', methods=['GET'])
+def get_insights_job(job_id):
+    """Get status, progress and (once completed) the result of an insights job"""
+    try:
+        expire_stale_jobs()
+        
+        job = InsightsJob.query.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify(job.to_dict(include_result=job.status == 'completed'))
+    except Exception as e:
+        logger.exception("Erro ao buscar insights job")
+        return jsonify({'error': str(e)}), 500
+
+# Fields of the single-row PDF reports
+PDF_METRIC_FIELDS = ['spend', 'impressions', 'clicks', 'cpc', 'ctr', 'reach', 'frequency', 'actions',
+                     'date_start', 'date_stop']
+PDF_CAMPAIGN_FIELDS = ['campaign_name'] + PDF_METRIC_FIELDS
+PDF_ACCOUNT_FIELDS = ['account_name'] + PDF_METRIC_FIELDS
+
+def submit_pdf(data, refresh=False):
+    """Validate a PDF request and queue its render job.
+    
+    Returns (report, future, error_response); future is None when an
+    identical PDF (same object, range and data) is already cached. That
+    shortcut needs the report's insights in the insights cache: once they
+    expire, a new job fetches them, and reuses the stored PDF only if the
+    data hash still matches (run_pdf_job), without rendering it again.
+    """
+    bm_id = data.get('bm_id')
+    ad_account_id = data.get('ad_account_id')
+    campaign_id = data.get('campaign_id')
+    date_preset = data.get('date_preset', 'last_7d')
+    
+    if not bm_id:
+        return None, None, (jsonify({'error': 'Missing BM ID'}), 400)
+    
+    if not ad_account_id and not campaign_id:
+        return None, None, (jsonify({'error': 'Either ad account ID or campaign ID is required'}), 400)
+    
+    # Retrieve BM from database
+    bm = get_bm(bm_id)
+    if not bm:
+        return None, None, (jsonify({'error': 'Invalid BM ID'}), 400)
+    
+    object_type = 'campaign' if campaign_id else 'ad_account'
+    object_id = campaign_id or ad_account_id
+    params = {'level': 'campaign' if campaign_id else 'account'}
+    
+    # Custom ranges come as custom:<start>:<end>
+    custom_range = parse_custom_preset(date_preset)
+    if custom_range:
+        date_range = custom_preset_label(*custom_range)
+        params['time_range'] = {'since': custom_range[0], 'until': custom_range[1]}
+    else:
+        date_range = date_preset
+        params['date_preset'] = date_preset
+    
+    expire_pdf_reports()
+    
+    # Same data as an already rendered PDF: serve it without a new job
+    cache_key = make_cache_key(f"pdf_{object_type}", bm_id, object_id, params)
+    cached_rows = lookup_cached_insights(cache_key, refresh)
+    if cached_rows is not None:
+        report = find_cached_pdf(object_type, object_id, date_range, hash_insights(cached_rows))
+        if report:
+            return report, None, None
+    
+    # Pooled API client for the specific BM token
+    api = get_api(bm)
+    
+    def fetch_rows():
+        """Fetch the report insights (runs in the PDF worker)"""
+        from facebook_business.adobjects.adaccount import AdAccount
+        from facebook_business.adobjects.campaign import Campaign
+        
+        if campaign_id:
+            rows = fetch_insight_dicts(Campaign(campaign_id, api=api), PDF_CAMPAIGN_FIELDS, params)
+            title = f"Campaign Report: {rows[0].get('campaign_name', campaign_id) if rows else campaign_id}"
         else:
-            # Default to last 7 days if no valid date parameters
-            params['date_preset'] = 'last_7d'
-            print("No valid date parameters, defaulting to last_7d")
-        
-        # Modificar para buscar insights no nível de campanhas
-        ad_account = AdAccount(ad_account_id)
-        # Buscar todas as campanhas da conta primeiro
-        campaigns = ad_account.get_campaigns(fields=[
-            'id',
-            'name',
-            'status',
-            'objective'
-        ])
-        
-        # Imprimir informações sobre as campanhas encontradas
-        print(f"Campanhas encontradas para a conta {ad_account_id}: {len(campaigns)}")
-        for i, campaign in enumerate(campaigns):
-            if i < 5:  # Limitar a exibição a 5 campanhas
-                print(f"Campanha {i+1}: ID={campaign['id']}, Nome={campaign['name']}, Status={campaign.get('status')}")
-        
-        # Modificar parâmetros para buscar insights no nível de campanha
-        params['level'] = 'campaign'
-        
-        # Adicionar campo de nome de campanha
-        insights = ad_account.get_insights(
-            fields=[
-                'account_id',
-                'account_name',
-                'campaign_id',
-                'campaign_name',  # Adicionado nome da campanha
-                'spend',
-                'impressions',
-                'clicks',
-                'cpc',
-                'ctr',
-                'reach',
-                'frequency',
-                'actions',
-                'action_values',
-                'date_start',
-                'date_stop'
-            ],
-            params=params
-        )
+            rows = fetch_insight_dicts(AdAccount(ad_account_id, api=api), PDF_ACCOUNT_FIELDS, params)
+            title = f"Ad Account Report: {rows[0].get('account_name', ad_account_id) if rows else ad_account_id}"
+        store_cached_insights(cache_key, f"pdf_{object_type}", bm_id, object_id, params, rows,
+                              cache_ttl(params.get('date_preset'), *(custom_range or (None, None))))
+        return title, rows
+    
+    report = create_pdf_job(bm_id, object_type, object_id, date_range)
+    return report, start_pdf_job(current_app._get_current_object(), report.id, fetch_rows), None
+
+def send_pdf_report(report):
+    """Download response of a completed PDF (revalidated by its data hash)"""
+    return send_file(
+        BytesIO(report.content),
+        as_attachment=True,
+        download_name=report.filename,
+        mimetype=report.mimetype,
+        etag=report.data_hash,
+        max_age=0
+    )
+
+@routes.route('/api/generate-pdf', methods=['POST'])
+def generate_pdf():
+    """Generate a PDF report for a specific ad account or campaign.
+    
+    Renders through the PDF queue and waits up to PDF_SYNC_WAIT seconds; if the
+    job is still running, returns 202 with the job (poll /api/pdf-jobs/<id>).
+    """
+    try:
+        report, future, error = submit_pdf(request.json, refresh=wants_refresh(request.args))
+        if error:
+            return error
         
-        # Process insights
-        processed_insights = []
-        for insight in insights:
-            insight_data = {
-                'account_id': insight.get('account_id'),
-                'account_name': insight.get('account_name'),
-                'campaign_id': insight.get('campaign_id'),
-                'campaign_name': insight.get('campaign_name'),  # Adicionado nome da campanha
-                'spend': insight.get('spend'),
-                'impressions': insight.get('impressions'),
-                'clicks': insight.get('clicks'),
-                'cpc': insight.get('cpc'),
-                'ctr': insight.get('ctr'),
-                'reach': insight.get('reach'),
-                'frequency': insight.get('frequency'),
-                'date_start': insight.get('date_start'),
-                'date_stop': insight.get('date_stop')
-            }
-            
-            # Process actions
-            if 'actions' in insight:
-                for action in insight['actions']:
-                    action_type = action.get('action_type')
-                    value = action.get('value')
-                    insight_data[f"action_{action_type}"] = value
-            
-            # Process action values
-            if 'action_values' in insight:
-                for action_value in insight['action_values']:
-                    action_type = action_value.get('action_type')
-                    value = action_value.get('value')
-                    insight_data[f"value_{action_type}"] = value
-                    
-            processed_insights.append(insight_data)
-            
-        # Save to database
-        report_name = f"Account Insights: {processed_insights[0].get('account_name', ad_account_id)}"
-        save_report(report_name, 'ad_account', bm_id, ad_account_id, date_preset, processed_insights)
+        if future:
+            try:
+                future.result(timeout=PDF_SYNC_WAIT)
+            except FutureTimeoutError:
+                pass
+            db.session.expire_all()
+            report = PdfReport.query.get(report.id)
         
-        return jsonify({'insights': processed_insights})
+        if report.status == 'completed':
+            return send_pdf_report(report)
+        if report.status == 'failed':
+            return jsonify({'error': report.error}), 500
+        return jsonify(report.to_dict()), 202
+    except RateLimitError as e:
+        db.session.rollback()
+        return rate_limited(e)
     except Exception as e:
-        print(f"Erro ao buscar account insights: {str(e)}")
+        db.session.rollback()
+        logger.exception("Erro ao gerar PDF")
         return jsonify({'error': str(e)}), 500
 
-def save_report(name, report_type, bm_id, object_id, date_preset, insights_data):
-    """Save report to database"""
+@routes.route('/api/pdf-jobs', methods=['POST'])
+def create_pdf_job_route():
+    """Queue a PDF report; returns the job (completed at once when an identical PDF is cached)"""
     try:
-        report = Report(
-            report_name=name,
-            report_type=report_type,
-            bm_id=bm_id,
-            object_id=object_id,
-            date_preset=date_preset,
-            insights_data=insights_data
-        )
-        db.session.add(report)
-        db.session.commit()
-        return report
+        report, future, error = submit_pdf(request.json, refresh=wants_refresh(request.args))
+        if error:
+            return error
+        
+        return jsonify(report.to_dict()), 202 if future else 200
     except Exception as e:
-        print(f"Error saving report: {str(e)}")
         db.session.rollback()
-        return None
+        logger.exception("Erro ao criar PDF job")
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/api/generate-pdf', methods=['POST'])
-def generate_pdf():
-    """Generate a PDF report for a specific ad account or campaign"""
+@routes.route('/api/bulk-pdf', methods=['POST'])
+def create_bulk_pdf():
+    """Queue a multi-section report of several ad accounts/campaigns (zip of PDFs or one merged PDF).
+    
+    Body: bm_id, date_preset (or custom:<start>:<end>), items: [{ad_account_id} or
+    {campaign_id}, ...], output: 'zip' (default) or 'merged'. Poll /api/pdf-jobs/<id>.
+    """
     data = request.json
     bm_id = data.get('bm_id')
-    ad_account_id = data.get('ad_account_id')
-    campaign_id = data.get('campaign_id')
     date_preset = data.get('date_preset', 'last_7d')
+    items = data.get('items') or []
+    output = data.get('output', 'zip')
     
     if not bm_id:
         return jsonify({'error': 'Missing BM ID'}), 400
     
-    if not ad_account_id and not campaign_id:
-        return jsonify({'error': 'Either ad account ID or campaign ID is required'}), 400
+    if (not isinstance(items, list) or not items
+            or any(not isinstance(item, dict) or not (item.get('ad_account_id') or item.get('campaign_id'))
+                   for item in items)):
+        return jsonify({'error': 'Items must each have an ad account ID or a campaign ID'}), 400
+    
+    if len(items) > PDF_BULK_MAX_ITEMS:
+        return jsonify({'error': f"At most {PDF_BULK_MAX_ITEMS} items per bulk report"}), 400
+    
+    if output not in ('zip', 'merged'):
+        return jsonify({'error': "Output must be 'zip' or 'merged'"}), 400
     
     try:
         # Retrieve BM from database
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Set up the API with the specific BM token
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, bm.access_token)
+        api = get_api(bm)
+        start_date, end_date = parse_custom_preset(date_preset) or (None, None)
+        date_range = custom_preset_label(start_date, end_date) if start_date else date_preset
+        params = {
+            'level': 'campaign',
+            'time_increment': 1
+        }
+        apply_date_params(params, None if start_date else date_preset, start_date, end_date)
         
-        # Get insights data
-        if campaign_id:
-            campaign = Campaign(campaign_id)
-            insights = campaign.get_insights(
-                fields=[
-                    'campaign_name',
-                    'spend',
-                    'impressions',
-                    'clicks',
-                    'cpc',
-                    'ctr',
-                    'reach',
-                    'frequency',
-                    'actions',
-                ],
-                params={
-                    'date_preset': date_preset,
-                    'level': 'campaign'
-                }
-            )
-            title = f"Campaign Report: {insights[0].get('campaign_name', campaign_id)}"
+        def load_sections():
+            """Fetch every item through Graph API batch calls; failed items get an error section"""
+            account_ids = list(dict.fromkeys(item['ad_account_id'] for item in items if not item.get('campaign_id')))
+            campaign_ids = list(dict.fromkeys(item['campaign_id'] for item in items if item.get('campaign_id')))
+            accounts = dict(zip(account_ids, fetch_accounts_insights(api, account_ids, params,
+                                                                     start_date, end_date)))
+            campaigns = dict(zip(campaign_ids, fetch_insight_dicts_batch(
+                api, [(campaign_id, params) for campaign_id in campaign_ids], ACCOUNT_INSIGHT_FIELDS,
+                BM_INSIGHTS_CONCURRENCY, BM_INSIGHTS_TIMEOUT)))
             
-        else:  # ad_account_id
-            ad_account = AdAccount(ad_account_id)
-            insights = ad_account.get_insights(
-                fields=[
-                    'account_name',
-                    'spend',
-                    'impressions',
-                    'clicks',
-                    'cpc',
-                    'ctr',
-                    'reach',
-                    'frequency',
-                    'actions',
-                ],
-                params={
-                    'date_preset': date_preset,
-                    'level': 'account'
-                }
-            )
-            title = f"Ad Account Report: {insights[0].get('account_name', ad_account_id)}"
-        
-        # Process insights for PDF
-        insights_data = {}
-        for insight in insights:
-            for key, value in insight.items():
-                if key not in ['actions', 'action_values']:
-                    insights_data[key] = value
-            
-            # Process actions
-            if 'actions' in insight:
-                for action in insight['actions']:
-                    action_type = action.get('action_type')
-                    value = action.get('value')
-                    insights_data[f"action_{action_type}"] = value
-        
-        # Create PDF
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        doc = SimpleDocTemplate(temp_file.name, pagesize=letter)
-        styles = getSampleStyleSheet()
-        
-        # Create content
-        content = []
-        content.append(Paragraph(title, styles['Title']))
-        content.append(Paragraph(f"Date Range: {date_preset}", styles['Heading2']))
-        
-        # Create table with insights data
-        table_data = []
-        table_data.append(['Metric', 'Value'])
-        for key, value in insights_data.items():
-            if key not in ['account_name', 'campaign_name']:
-                table_data.append([key, str(value)])
-        
-        table = Table(table_data, colWidths=[300, 200])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        content.append(table)
-        doc.build(content)
-        
-        # Return the PDF file
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=f"{title.replace(' ', '_')}.pdf",
-            mimetype='application/pdf'
-        )
+            sections = []
+            for item in items:
+                if item.get('campaign_id'):
+                    rows = campaigns[item['campaign_id']]
+                    rows, error = (None, str(rows)) if isinstance(rows, Exception) else (rows, None)
+                    title = f"Campaign Report: {rows[0].get('campaign_name') if rows else item['campaign_id']}"
+                else:
+                    rows, error = accounts[item['ad_account_id']]
+                    title = f"Ad Account Report: {rows[0].get('account_name') if rows else item['ad_account_id']}"
+                if error:
+                    object_id = item.get('campaign_id') or item.get('ad_account_id')
+                    sections.append(report_section(f"Report: {object_id}", date_range, [], error=error))
+                else:
+                    sections.append(report_section(title, date_range, rows))
+            return f"Bulk Report {date_range}", sections
+        
+        expire_pdf_reports()
+        object_id = hash_insights(items)
+        report = create_pdf_job(bm_id, f"bulk_{output}", object_id, date_range)
+        start_bulk_pdf_job(current_app._get_current_object(), report.id, load_sections, output)
+        
+        return jsonify(report.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Erro ao criar bulk PDF")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/api/pdf-jobs/<string:report_id>', methods=['GET'])
+def get_pdf_job(report_id):
+    """Get the status of a PDF job"""
+    try:
+        report = PdfReport.query.get(report_id)
+        if not report:
+            return jsonify({'error': 'PDF job not found'}), 404
+        
+        return jsonify(report.to_dict())
     except Exception as e:
-        print(f"Erro ao gerar PDF: {str(e)}")
+        logger.exception("Erro ao buscar PDF job")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/create-share-link', methods=['POST'])
+@routes.route('/api/pdf-jobs/<string:report_id>/download', methods=['GET'])
+def download_pdf(report_id):
+    """Download the PDF of a completed job"""
+    try:
+        report = PdfReport.query.get(report_id)
+        if not report or report.expires_at < datetime.utcnow():
+            return jsonify({'error': 'PDF job not found'}), 404
+        
+        if report.status != 'completed':
+            return jsonify({'error': f"PDF job is {report.status}"}), 409
+        
+        return send_pdf_report(report)
+    except Exception as e:
+        logger.exception("Erro ao baixar PDF")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/api/create-share-link', methods=['POST'])
 def create_share_link():
     """Create a shareable link for a specific report"""
     data = request.json
@@ -602,7 +957,7 @@ def create_share_link():
     
     try:
         # Check if BM exists
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
@@ -612,6 +967,11 @@ def create_share_link():
         # Calculate expiration time
         expires_at = datetime.now() + timedelta(hours=expiration)
         
+        # Custom ranges are stored under a normalized label
+        custom_range = parse_custom_preset(date_preset)
+        if custom_range:
+            date_preset = custom_preset_label(*custom_range)
+        
         # Find existing report
         object_id = campaign_id if campaign_id else ad_account_id
         report_type = 'campaign' if campaign_id else 'ad_account'
@@ -634,6 +994,9 @@ def create_share_link():
             expires_at=expires_at
         )
         
+        # Pin the data viewers will see
+        pin_share_snapshot(shared_link, bm, report)
+        
         db.session.add(shared_link)
         db.session.commit()
         
@@ -644,11 +1007,102 @@ def create_share_link():
             'share_link': share_link,
             'expires_in': f"{expiration} hours"
         })
+    except RateLimitError as e:
+        db.session.rollback()
+        return rate_limited(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/validate-share-link', methods=['GET'])
+def pin_share_snapshot(shared_link, bm, report=None):
+    """Pin the data viewers will see: the report's while it is still current, otherwise current data.
+    
+    A report is current for as long as a cache entry of its window would be
+    (a relative preset moves on); after that the insights cache is used, or
+    the data is fetched once.
+    """
+    api = get_api(bm)
+    start_date, end_date = parse_custom_preset(shared_link.date_preset) or (None, None)
+    date_preset = None if start_date else shared_link.date_preset
+    if shared_link.campaign_id:
+        today = None
+        cache_key = None if start_date else campaign_cache_key(bm.bm_id, shared_link.campaign_id,
+                                                               campaign_insights_params(date_preset))
+    else:
+        today = account_today(api, shared_link.ad_account_id)
+        params = account_insights_params(date_preset, start_date, end_date)
+        cache_key = account_cache_key(bm.bm_id, shared_link.ad_account_id, params)
+    
+    insights_data = None
+    if report is not None and report.insights_data is not None:
+        saved_at = report.updated_at or report.created_at
+        if saved_at and saved_at >= datetime.utcnow() - cache_ttl(date_preset, start_date, end_date, today=today):
+            insights_data = normalize_rows(report.insights_data)
+    if insights_data is None and cache_key:
+        insights_data = get_cached_insights(cache_key)
+    if insights_data is None:
+        from facebook_business.adobjects.adaccount import AdAccount
+        from facebook_business.adobjects.campaign import Campaign
+        
+        if shared_link.campaign_id:
+            params = {'level': 'campaign'}
+            if start_date:
+                params['time_range'] = {'since': start_date, 'until': end_date}
+            else:
+                params['date_preset'] = date_preset
+            insights_data = fetch_campaign_insight_rows(Campaign(shared_link.campaign_id, api=api), params)
+        else:
+            insights_data = fetch_account_insights(AdAccount(shared_link.ad_account_id, api=api), params,
+                                                   start_date, end_date)
+    
+    shared_link.snapshot = insights_data
+    shared_link.snapshot_hash = hash_insights(insights_data)
+    shared_link.snapshot_at = datetime.utcnow()
+    return shared_link
+
+@routes.route('/api/shared/<string:token>', methods=['GET'])
+def get_shared_report(token):
+    """Serve the pinned snapshot of a share link (no Meta API calls)"""
+    try:
+        shared_link = SharedLink.query.filter_by(token=token).first()
+        
+        if not shared_link:
+            return jsonify({'error': 'Invalid token'}), 401
+        
+        remaining = (shared_link.expires_at - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return jsonify({'error': 'Token has expired'}), 401
+        
+        # Links created before snapshots existed are pinned on their first view
+        if shared_link.snapshot_hash is None:
+            bm = get_bm(shared_link.bm_id)
+            if not bm:
+                return jsonify({'error': 'Invalid BM ID'}), 400
+            pin_share_snapshot(shared_link, bm, shared_link.report)
+            db.session.commit()
+        
+        response = jsonify({
+            'report_params': {
+                'bm_id': shared_link.bm_id,
+                'ad_account_id': shared_link.ad_account_id,
+                'campaign_id': shared_link.campaign_id,
+                'date_preset': shared_link.date_preset
+            },
+            'snapshot_at': shared_link.snapshot_at.isoformat(),
+            'insights': shared_link.snapshot
+        })
+        
+        # The snapshot never changes, so viewers can revalidate with If-None-Match
+        response.set_etag(shared_link.snapshot_hash)
+        response.cache_control.public = True
+        response.cache_control.max_age = int(min(remaining, SHARED_REPORT_MAX_AGE))
+        return response.make_conditional(request)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Erro ao buscar shared report")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/api/validate-share-link', methods=['GET'])
 def validate_share_link():
     """Validate a share link token"""
     token = request.args.get('token')
@@ -677,22 +1131,40 @@ def validate_share_link():
             }
         })
     except Exception as e:
-        print(f"Erro ao validar share link: {str(e)}")
+        logger.exception("Erro ao validar share link")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/reports', methods=['GET'])
+@routes.route('/api/reports', methods=['GET'])
 def get_reports():
-    """Get list of saved reports"""
+    """Get a page of saved reports (newest first).
+    
+    Query params: limit, cursor (from next_cursor), bm_id, include_data=1 to
+    also return the insights_data payload.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', REPORTS_PAGE_SIZE)), 1), REPORTS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    include_data = request.args.get('include_data', '').lower() in ('1', 'true', 'yes')
+    
     try:
-        reports = Report.query.order_by(Report.created_at.desc()).all()
+        reports, next_cursor = list_reports(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            bm_id=request.args.get('bm_id'),
+            include_data=include_data
+        )
         return jsonify({
-            'reports': [report.to_dict() for report in reports]
+            'reports': [report.to_dict() if include_data else report.to_summary_dict() for report in reports],
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Erro ao buscar reports: {str(e)}")
+        logger.exception("Erro ao buscar reports")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/reports/<int:report_id>', methods=['GET'])
+@routes.route('/api/reports/<int:report_id>', methods=['GET'])
 def get_report(report_id):
     """Get a specific report by ID"""
     try:
@@ -702,10 +1174,10 @@ def get_report(report_id):
         
         return jsonify(report.to_dict())
     except Exception as e:
-        print(f"Erro ao buscar report específico: {str(e)}")
+        logger.exception("Erro ao buscar report específico")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/ads', methods=['GET'])
+@routes.route('/api/ads', methods=['GET'])
 def get_ads():
     """Get ads for a specific ad account or campaign"""
     ad_account_id = request.args.get('ad_account_id')
@@ -724,71 +1196,90 @@ def get_ads():
         limit = int(limit)
         
         # Recuperar BM do banco de dados
-        bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+        bm = get_bm(bm_id)
         if not bm:
             return jsonify({'error': 'Invalid BM ID'}), 400
         
-        # Configurar a API com o token específico do BM
-        FacebookAdsApi.init(APP_ID, APP_SECRET_KEY, bm.access_token)
-        
-        ads = []
-        
-        # Importar o que precisamos
-        from facebook_business.adobjects.ad import Ad
-        from facebook_business.adobjects.adpreview import AdPreview
+        # Cliente da API (pool) com o token específico do BM
+        api = get_api(bm)
         
         # Definir parâmetros das requisições - evitar adicionar access_token explicitamente,
-        # pois o SDK do Facebook já inclui o token da inicialização
+        # pois o cliente do SDK já inclui o token do BM
         params = {'limit': limit, 'summary': True}
-        fields = ['id', 'name', 'status', 'preview_shareable_link', 'creative']
         
         if ad_account_id:
             # Obter anúncios da conta
-            ad_account = AdAccount(ad_account_id)
-            ads_data = ad_account.get_ads(
-                fields=fields,
-                params=params
-            )
+            from facebook_business.adobjects.adaccount import AdAccount
+            ad_account = AdAccount(ad_account_id, api=api)
+            ads_data = ad_account.get_ads(fields=AD_FIELDS, params=params)
         elif campaign_id:
             # Obter anúncios da campanha
-            campaign = Campaign(campaign_id)
-            ads_data = campaign.get_ads(
-                fields=fields,
-                params=params
-            )
-        
-        # Processar os anúncios e obter prévia
-        processed_ads = []
-        for ad_data in ads_data:
-            ad_info = {
-                'id': ad_data.get('id'),
-                'name': ad_data.get('name'),
-                'status': ad_data.get('status'),
-                'preview_link': ad_data.get('preview_shareable_link', '')
-            }
-            
-            # Se não tiver link de prévia, tentar gerar um
-            if not ad_info['preview_link']:
-                try:
-                    ad = Ad(ad_data.get('id'))
-                    # Não adicionar access_token explicitamente, SDK já inclui na inicialização
-                    preview = ad.get_previews(
-                        params={
-                            'ad_format': 'DESKTOP_FEED_STANDARD',
-                            'full_render': True
-                        }
-                    )
-                    if preview and len(preview) > 0:
-                        ad_info['preview_html'] = preview[0].get('body', '')
-                except Exception as preview_error:
-                    ad_info['preview_error'] = str(preview_error)
-            
-            processed_ads.append(ad_info)
+            from facebook_business.adobjects.campaign import Campaign
+            campaign = Campaign(campaign_id, api=api)
+            ads_data = campaign.get_ads(fields=AD_FIELDS, params=params)
+        
+        # Processar os anúncios
+        processed_ads, missing_previews = ad_rows(ads_data)
+        
+        # Buscar as prévias em paralelo, com prazo; as que não terminarem voltam como 'pending'
+        if missing_previews:
+            add_previews(processed_ads, fetch_previews(api, missing_previews))
         
         return jsonify({'ads': processed_ads})
+    except RateLimitError as e:
+        return rate_limited(e)
     except Exception as e:
-        print(f"Erro ao buscar anúncios: {str(e)}")
+        logger.exception("Erro ao buscar anúncios")
         return jsonify({'error': str(e)}), 500
 
+@routes.route('/api/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """Latest Meta API usage seen by this worker per app, BM and ad account"""
+    scopes = usage_tracker.snapshot()
+    delay, limiting_scope = usage_tracker.delay_for(list(scopes))
+    return jsonify({
+        'scopes': scopes,
+        'throttled': delay > 0,
+        'delay': round(delay, 1),
+        'limiting_scope': limiting_scope,
+        'settings': {
+            'slowdown_pct': USAGE_SLOWDOWN_PCT,
+            'pause_pct': USAGE_PAUSE_PCT,
+            'max_retries': MAX_RETRIES,
+            'max_wait': MAX_WAIT
+        }
+    })
+
+def create_app():
+    """Build the Flask app. Importing this module does no I/O; the schema is
+    created by `flask init-db`, not by every worker on startup.
+    """
+    # A no-op when the server (e.g. gunicorn) already configured logging
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    app = Flask(__name__)
+    CORS(app)
+    init_metrics(app)  # before compression, so request timings include it
+    init_compression(app)
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = DB_URI
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Initialize SQLAlchemy with app
+    db.init_app(app)
+    
+    # Initialize Meta API
+    init_default_api(APP_ID, APP_SECRET_KEY, ACCESS_TOKEN, GRAPH_URL)
+    
+    app.register_blueprint(routes)
+    
+    # Optional daily pre-warm of the insights cache (PREWARM_HOUR)
+    start_prewarm_scheduler(app, prewarm_account_insights)
+    return app
+
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        run_migrations()
     app.run(debug=True, host='0.0.0.0', port=5000)
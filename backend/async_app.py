@@ -0,0 +1,409 @@
+"""asyncio serving mode (aiohttp).
+
+The read endpoints that spend their time waiting on Meta (/api/account-insights,
+/api/campaign-insights and /api/ads) run as coroutines here: their Graph API
+calls go through the pooled async client of async_graph, so one process serves
+hundreds of concurrent dashboard requests instead of one per thread. Their
+database work runs on a small thread pool. Every other route is the Flask app,
+served in the same process through WSGI on worker threads.
+
+    flask --app wsgi init-db
+    gunicorn async_app:create_async_app --worker-class aiohttp.GunicornWebWorker -w 2 -b 0.0.0.0:5000
+    python async_app.py --port 5000
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from functools import partial
+import io
+import json
+import os
+import sys
+from urllib.parse import unquote_to_bytes
+
+from aiohttp import web
+from werkzeug.http import parse_accept_header
+
+from account_timezones import account_today_async
+from app import create_app
+from async_graph import get_async_api, close_session
+from bm_cache import get_bm
+from coalesce import async_coalesced
+from compression import choose_encoding, compress_body, COMPRESS_MIN_SIZE
+from concurrency import gather_until
+from daily_insights import daily_ranges_to_fetch, store_daily_ranges
+from date_ranges import resolve_date_window
+from ad_previews import AD_FIELDS, ad_rows, add_previews, fetch_previews_async
+from insights import (ACCOUNT_INSIGHT_FIELDS, CAMPAIGN_INSIGHT_FIELDS, INSIGHTS_PAGE_SIZE,
+                      fetch_insight_dicts_async, flatten_insight)
+from insights_cache import get_cached_insights, wants_refresh
+from insights_format import columnar_insights, wants_columnar, wants_ndjson
+from insights_requests import (account_insights_params, account_cache_key, campaign_insights_params,
+                               campaign_cache_key, daily_range_params, lookup_cached_insights,
+                               save_account_insights, save_campaign_insights)
+from metrics import start_request, finish_request
+from rate_limits import RateLimitError
+
+ASYNC_FLASK_THREADS = int(os.environ.get('ASYNC_FLASK_THREADS', 16))  # threads serving the Flask routes
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 8))  # database work of the async routes (<= DB pool size)
+NDJSON_CHUNK_ROWS = 500  # rows per write when streaming cached insights
+# Seconds the date ranges of one account insights fetch may take (the threaded routes rely on the worker timeout)
+ASYNC_INSIGHTS_TIMEOUT = float(os.environ.get('ASYNC_INSIGHTS_TIMEOUT', 60))
+
+
+class FlaskBridge:
+    """Runs the Flask side from the event loop: database calls in an app context, and whole WSGI requests"""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._db_executor = ThreadPoolExecutor(max_workers=ASYNC_DB_THREADS, thread_name_prefix='async-db')
+        self._wsgi_executor = ThreadPoolExecutor(max_workers=ASYNC_FLASK_THREADS, thread_name_prefix='async-flask')
+
+    def _in_app_context(self, fn, args, kwargs):
+        with self.app.app_context():
+            return fn(*args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking (database) function on the pool, in an app context and the request's metrics context"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._db_executor, partial(context.run, self._in_app_context, fn, args, kwargs))
+
+    async def handle(self, request):
+        """Serve a request with the Flask app; streamed responses are relayed chunk by chunk"""
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(request, await request.read())
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = status, headers
+
+        result = await loop.run_in_executor(self._wsgi_executor, self.app, environ, start_response)
+        try:
+            chunks = iter(result)
+            first = await loop.run_in_executor(self._wsgi_executor, next, chunks, None)
+            code, _, reason = started['status'].partition(' ')
+            response = web.StreamResponse(status=int(code), reason=reason)
+            for name, value in started['headers']:
+                response.headers.add(name, value)
+            await response.prepare(request)
+
+            chunk = first
+            while chunk is not None:
+                if chunk:
+                    await response.write(chunk)
+                chunk = await loop.run_in_executor(self._wsgi_executor, next, chunks, None)
+            await response.write_eof()
+            return response
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self._wsgi_executor, result.close)
+
+    def shutdown(self):
+        self._db_executor.shutdown(wait=False)
+        self._wsgi_executor.shutdown(wait=False)
+
+
+FLASK_BRIDGE = web.AppKey('flask_bridge', FlaskBridge)
+
+
+def wsgi_environ(request, body):
+    """PEP 3333 environ of an aiohttp request"""
+    path, _, query = request.raw_path.partition('?')
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': request.url.host or 'localhost',
+        'SERVER_PORT': str(request.url.port or ''),
+        'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in request.headers.items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+            continue
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def json_response(request, data, status=200):
+    """JSON response encoded like Flask's jsonify, compressed like init_compression does"""
+    body = request.app[FLASK_BRIDGE].app.json.dumps(data, separators=(',', ':')).encode('utf-8')
+    response = web.Response(body=body, status=status, content_type='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    encoding = choose_encoding(parse_accept_header(request.headers.get('Accept-Encoding')))
+    if status == 200 and encoding and len(body) >= COMPRESS_MIN_SIZE:
+        response.body = compress_body(body, encoding)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def rate_limited(request, error):
+    """429 response for a call held back by the Meta API rate limits"""
+    retry_after = max(1, int(error.retry_after + 0.999))
+    response = json_response(request, {'error': str(error), 'retry_after': retry_after}, 429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@web.middleware
+async def request_metrics(request, handler):
+    """Time the async routes like init_metrics times the Flask ones (which do it themselves)"""
+    if request.match_info.route.name == 'flask':
+        return await handler(request)
+
+    current, token = start_request(request.match_info.route.resource.canonical)
+    try:
+        response = await handler(request)
+    except Exception:
+        finish_request(current, token, request.method, 500, dict(request.query))
+        raise
+    server_timing = finish_request(current, token, request.method, response.status, dict(request.query))
+    if not response.prepared:
+        response.headers['Server-Timing'] = server_timing
+    return response
+
+
+async def add_cors_header(request, response):
+    # Flask-CORS handles the Flask routes
+    if request.match_info.route.name != 'flask':
+        response.headers.setdefault('Access-Control-Allow-Origin', '*')
+
+
+async def get_account_insights(request):
+    """Get insights for a specific ad account"""
+    args = request.query
+    ad_account_id = args.get('ad_account_id')
+    bm_id = args.get('bm_id')
+    date_preset = args.get('date_preset')
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    bridge = request.app[FLASK_BRIDGE]
+
+    if not ad_account_id:
+        return json_response(request, {'error': 'Ad account ID is required'}, 400)
+
+    if not bm_id:
+        return json_response(request, {'error': 'Missing BM ID'}, 400)
+
+    try:
+        bm = await bridge.run(get_bm, bm_id)
+        if not bm:
+            return json_response(request, {'error': 'Invalid BM ID'}, 400)
+
+        # Streamed straight from Meta, page by page, without holding the result
+        if wants_ndjson(args):
+            return await stream_account_insights(request, bm, ad_account_id, date_preset, start_date, end_date,
+                                                 refresh=wants_refresh(args))
+
+        processed_insights = await load_account_insight_rows(bridge, bm, ad_account_id, date_preset,
+                                                             start_date, end_date, refresh=wants_refresh(args))
+
+        # Opt-in compact encoding for large windows
+        if wants_columnar(args):
+            return json_response(request, {'insights': columnar_insights(processed_insights)})
+
+        return json_response(request, {'insights': processed_insights})
+    except RateLimitError as e:
+        return rate_limited(request, e)
+    except Exception as e:
+        print(f"Erro ao buscar account insights: {str(e)}")
+        return json_response(request, {'error': str(e)}, 500)
+
+
+async def load_account_insight_rows(bridge, bm, ad_account_id, date_preset, start_date, end_date, refresh=False):
+    """app.load_account_insight_rows, with the Graph API calls awaited"""
+    params = account_insights_params(date_preset, start_date, end_date)
+
+    cache_key = account_cache_key(bm.bm_id, ad_account_id, params)
+    cached_insights = await bridge.run(lookup_cached_insights, cache_key, refresh)
+    if cached_insights is not None:
+        return cached_insights
+
+    async def fetch():
+        api = get_async_api(bm)
+        processed_insights = await fetch_account_insights(bridge, api, ad_account_id, params,
+                                                          start_date, end_date, refresh=refresh)
+
+        await bridge.run(save_account_insights, cache_key, bm.bm_id, ad_account_id, params, start_date, end_date,
+                         processed_insights, today=await account_today_async(api, ad_account_id))
+        return processed_insights
+
+    # Identical concurrent requests share one fetch, across workers through a Postgres advisory lock
+    return await async_coalesced(cache_key, fetch, bridge.run,
+                                 recheck=None if refresh else partial(bridge.run, get_cached_insights, cache_key))
+
+
+async def fetch_account_insights(bridge, api, ad_account_id, params, start_date=None, end_date=None, refresh=False):
+    """app.fetch_account_insights: only the days missing from the daily store are fetched, concurrently.
+
+    The ranges run under ASYNC_INSIGHTS_TIMEOUT and fail on their own: the
+    ones fetched are stored even if another one failed, then the first error is raised.
+    """
+    today = await account_today_async(api, ad_account_id)
+    window = resolve_date_window(params.get('date_preset'), start_date, end_date, today=today)
+    if not window:
+        return await fetch_insight_dicts_async(api, ad_account_id, ACCOUNT_INSIGHT_FIELDS, params)
+
+    windows = [(ad_account_id, window[0], window[1], today)]
+    ranges = await bridge.run(daily_ranges_to_fetch, windows, force=refresh)
+    results = await gather_until([
+        fetch_insight_dicts_async(api, ad_account_id, ACCOUNT_INSIGHT_FIELDS, daily_range_params(since, until))
+        for _, since, until in ranges
+    ], timeout=ASYNC_INSIGHTS_TIMEOUT)
+
+    [(rows, error)] = await bridge.run(store_daily_ranges, windows, ranges, results)
+    if error is not None:
+        raise error
+    return rows
+
+
+async def stream_account_insights(request, bm, ad_account_id, date_preset, start_date, end_date, refresh=False):
+    """app.stream_account_insights: NDJSON rows written as the Graph API pages arrive"""
+    params = account_insights_params(date_preset, start_date, end_date)
+
+    cached_insights = await request.app[FLASK_BRIDGE].run(
+        lookup_cached_insights, account_cache_key(bm.bm_id, ad_account_id, params), refresh)
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    try:
+        if cached_insights is not None:
+            for start in range(0, len(cached_insights), NDJSON_CHUNK_ROWS):
+                await response.write(''.join(json.dumps(row) + '\n' for row in
+                                             cached_insights[start:start + NDJSON_CHUNK_ROWS]).encode('utf-8'))
+        else:
+            page_params = dict(params, fields=','.join(ACCOUNT_INSIGHT_FIELDS), limit=INSIGHTS_PAGE_SIZE)
+            async for insight in get_async_api(bm).iter_pages(f"{ad_account_id}/insights", page_params):
+                await response.write((json.dumps(flatten_insight(insight)) + '\n').encode('utf-8'))
+    except Exception as e:
+        print(f"Erro no streaming de account insights: {str(e)}")
+        await response.write((json.dumps({'error': str(e)}) + '\n').encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
+async def get_campaign_insights(request):
+    """Get insights for a specific campaign"""
+    args = request.query
+    campaign_id = args.get('campaign_id')
+    bm_id = args.get('bm_id')
+    date_preset = args.get('date_preset', 'last_7d')
+    bridge = request.app[FLASK_BRIDGE]
+
+    if not campaign_id:
+        return json_response(request, {'error': 'Campaign ID is required'}, 400)
+
+    if not bm_id:
+        return json_response(request, {'error': 'Missing BM ID'}, 400)
+
+    try:
+        bm = await bridge.run(get_bm, bm_id)
+        if not bm:
+            return json_response(request, {'error': 'Invalid BM ID'}, 400)
+
+        params = campaign_insights_params(date_preset)
+
+        # Serve from the local cache when possible
+        cache_key = campaign_cache_key(bm_id, campaign_id, params)
+        refresh = wants_refresh(args)
+        cached_insights = await bridge.run(lookup_cached_insights, cache_key, refresh)
+        if cached_insights is not None:
+            return json_response(request, {'insights': cached_insights})
+
+        async def fetch():
+            processed_insights = await fetch_insight_dicts_async(get_async_api(bm), campaign_id,
+                                                                 CAMPAIGN_INSIGHT_FIELDS, params)
+
+            await bridge.run(save_campaign_insights, cache_key, bm_id, campaign_id, params, processed_insights)
+            return processed_insights
+
+        # Identical concurrent requests share one fetch
+        processed_insights = await async_coalesced(
+            cache_key, fetch, bridge.run,
+            recheck=None if refresh else partial(bridge.run, get_cached_insights, cache_key))
+
+        return json_response(request, {'insights': processed_insights})
+    except RateLimitError as e:
+        return rate_limited(request, e)
+    except Exception as e:
+        print(f"Erro ao buscar campaign insights: {str(e)}")
+        return json_response(request, {'error': str(e)}, 500)
+
+
+async def get_ads(request):
+    """Get ads for a specific ad account or campaign"""
+    args = request.query
+    ad_account_id = args.get('ad_account_id')
+    campaign_id = args.get('campaign_id')
+    bm_id = args.get('bm_id')
+    limit = args.get('limit', '10')
+
+    if not bm_id:
+        return json_response(request, {'error': 'Missing BM ID'}, 400)
+
+    if not ad_account_id and not campaign_id:
+        return json_response(request, {'error': 'Either Ad account ID or Campaign ID is required'}, 400)
+
+    try:
+        limit = int(limit)
+
+        bm = await request.app[FLASK_BRIDGE].run(get_bm, bm_id)
+        if not bm:
+            return json_response(request, {'error': 'Invalid BM ID'}, 400)
+
+        api = get_async_api(bm)
+        params = {'limit': limit, 'summary': True, 'fields': ','.join(AD_FIELDS)}
+        processed_ads, missing_previews = ad_rows([ad_data async for ad_data in
+                                                   api.iter_pages(f"{ad_account_id or campaign_id}/ads", params)])
+
+        # Prévias em paralelo, com prazo; as que não terminarem voltam como 'pending'
+        if missing_previews:
+            add_previews(processed_ads, await fetch_previews_async(api, missing_previews))
+
+        return json_response(request, {'ads': processed_ads})
+    except RateLimitError as e:
+        return rate_limited(request, e)
+    except Exception as e:
+        print(f"Erro ao buscar anúncios: {str(e)}")
+        return json_response(request, {'error': str(e)}, 500)
+
+
+async def create_async_app(flask_app=None):
+    """aiohttp application: the async routes first, everything else through the Flask app"""
+    bridge = FlaskBridge(flask_app or create_app())
+
+    app = web.Application(middlewares=[request_metrics])
+    app[FLASK_BRIDGE] = bridge
+    app.router.add_get('/api/account-insights', get_account_insights)
+    app.router.add_get('/api/campaign-insights', get_campaign_insights)
+    app.router.add_get('/api/ads', get_ads)
+    app.router.add_route('*', '/{path:.*}', bridge.handle, name='flask')
+    app.on_response_prepare.append(add_cors_header)
+
+    async def shutdown(app):
+        await close_session()
+        bridge.shutdown()
+
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the API in asyncio mode')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_async_app(), host=args.host, port=args.port, access_log=None)
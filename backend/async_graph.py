@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+from facebook_business.api import FacebookAdsApi
+from facebook_business.exceptions import FacebookRequestError
+from facebook_business.session import FacebookSession
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from yarl import URL
+
+from graph_client import REQUEST_TIMEOUT
+from metrics import record_graph_call, record_phase
+from rate_limits import async_scheduled_call
+
+# Open connections to the Graph API per process, shared by every BM and request
+GRAPH_ASYNC_POOL_SIZE = int(os.environ.get('GRAPH_ASYNC_POOL_SIZE', 100))
+
+_session = None
+
+
+async def open_session():
+    """Create the pooled HTTP session of this process (call from the running event loop)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=GRAPH_ASYNC_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            headers=FacebookAdsApi.HTTP_DEFAULT_HEADERS
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def encode_params(params):
+    """Graph API query values: mappings, lists and booleans JSON-encoded, as the SDK sends them"""
+    encoded = {}
+    for key, value in (params or {}).items():
+        if isinstance(value, (dict, list, tuple, bool)):
+            value = json.dumps(value, separators=(',', ':'))
+        encoded[key] = str(value)
+    return encoded
+
+
+class GraphResponse:
+    """Parsed response of an async call (the parts of FacebookResponse the scheduler reads)"""
+
+    __slots__ = ('_json', '_headers')
+
+    def __init__(self, body, headers):
+        self._json = body
+        self._headers = headers
+
+    def json(self):
+        return self._json
+
+    def headers(self):
+        return self._headers
+
+
+class AsyncGraphApi:
+    """Non-blocking Graph API client for one BM token.
+
+    Calls share the process-wide connection pool and go through the same rate
+    limit scheduler as the SDK client of graph_client.get_api (usage headers,
+    throttle backoff, 429s), without holding a thread while they wait.
+    """
+
+    def __init__(self, access_token, bm_id=None):
+        self.access_token = access_token
+        self.bm_id = bm_id
+        self._auth = {'access_token': access_token}
+        app_secret = os.environ.get('META_APP_SECRET')
+        if app_secret:
+            self._auth['appsecret_proof'] = hmac.new(app_secret.encode('utf-8'), access_token.encode('utf-8'),
+                                                     hashlib.sha256).hexdigest()
+
+    def url(self, path):
+        """Full URL of a path ('act_1/insights', or a paging URL returned by Meta)"""
+        if path.startswith('http'):
+            return URL(path, encoded=True)
+        return URL(f"{FacebookSession.GRAPH}/{FacebookAdsApi.API_VERSION}/{path}")
+
+    async def get(self, path, params=None):
+        """GET path and return the parsed JSON body"""
+        response = await async_scheduled_call(self._call, self.bm_id, 'GET', str(self.url(path)), params=params)
+        return response.json()
+
+    async def post(self, path, params=None, idempotent=False):
+        response = await async_scheduled_call(self._call, self.bm_id, 'POST', str(self.url(path)), params=params,
+                                              idempotent=idempotent)
+        return response.json()
+
+    async def iter_pages(self, path, params=None):
+        """Yield the rows of every page of an edge, following paging.next"""
+        response = await self.get(path, params)
+        while True:
+            for row in response.get('data', []):
+                yield row
+            next_page = (response.get('paging') or {}).get('next')
+            if not next_page:
+                return
+            response = await self.get(next_page)
+
+    async def batch(self, requests):
+        """Run [(path, params), ...] GETs in one batch call; returns parsed bodies or FacebookRequestErrors, in order"""
+        relative_urls = [f"{path}?{urlencode(encode_params(params))}" if params else path for path, params in requests]
+        batch = [{'method': 'GET', 'relative_url': relative_url} for relative_url in relative_urls]
+        # Only GETs inside: the batch call can be retried like one
+        responses = await self.post('', {'batch': batch, 'include_headers': False}, idempotent=True)
+
+        results = []
+        for relative_url, response in zip(relative_urls, responses):
+            if not response:
+                results.append(FacebookRequestError('No response for request in batch',
+                                                    {'method': 'GET', 'path': relative_url}, None, {}, None))
+                continue
+            body = response.get('body') or ''
+            if response.get('code') != 200:
+                results.append(FacebookRequestError('Call was not successful',
+                                                    {'method': 'GET', 'path': relative_url},
+                                                    response.get('code'), {}, body))
+                continue
+            results.append(json.loads(body) if body else {})
+        return results
+
+    async def _call(self, method, url, params=None):
+        session = await open_session()
+        started = time.perf_counter()
+        request_url = URL(url, encoded=True)
+        if method == 'GET':
+            request_url, data = request_url.update_query(encode_params(params)), None
+        else:
+            data = encode_params(params)
+        try:
+            async with session.request(method, request_url.update_query(self._auth), data=data) as response:
+                body = await response.text()
+                status, headers = response.status, response.headers
+        except asyncio.TimeoutError as e:
+            raise Timeout(f"Graph API call timed out: {method} {url}") from e
+        except aiohttp.ClientConnectionError as e:
+            raise RequestsConnectionError(str(e)) from e
+        finally:
+            record_phase('graph_api', time.perf_counter() - started)
+
+        record_graph_call(method, status, len(body), time.perf_counter() - started)
+        if status >= 400:
+            raise FacebookRequestError('Call was not successful', {'method': method, 'path': url, 'params': params},
+                                       status, headers, body)
+        return GraphResponse(json.loads(body) if body else {}, headers)
+
+
+def get_async_api(bm):
+    """Async client of a BusinessManager (cheap: the connection pool is shared)"""
+    return AsyncGraphApi(bm.access_token, bm.bm_id)
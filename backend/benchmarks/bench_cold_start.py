@@ -0,0 +1,112 @@
+"""Measure worker cold start: a fresh interpreter importing wsgi and serving its first request.
+
+Each run is a new process (what a gunicorn worker or a restarted container
+pays), timing `import wsgi` and the first GET / through the test client, with
+the peak RSS of the process. --ref measures a git revision instead of the
+working tree (exported to a temporary directory), to compare before/after:
+
+    python benchmarks/bench_cold_start.py --runs 10
+    python benchmarks/bench_cold_start.py --runs 10 --ref HEAD~1
+    python benchmarks/bench_cold_start.py --top 15    # slowest imports of app (python -X importtime)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, resource, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+status = wsgi.app.test_client().get('/').status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': status,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+'''
+
+
+def export_ref(ref, workdir):
+    """Extract backend/ at a git revision into workdir; returns the backend directory"""
+    top_dir = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=BACKEND_DIR, text=True).strip()
+    prefix = os.path.relpath(BACKEND_DIR, top_dir)
+    archive = subprocess.check_output(['git', 'archive', '--format=tar', f"{ref}:{prefix}"], cwd=top_dir)
+    archive_path = os.path.join(workdir, 'backend.tar')
+    with open(archive_path, 'wb') as archive_file:
+        archive_file.write(archive)
+    target = os.path.join(workdir, 'backend')
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(target)
+    return target
+
+
+def child_env(workdir):
+    # Scratch SQLite database: older revisions create the schema on import
+    return dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'cold.db')}",
+                METRICS_LOG='0', PREWARM_HOUR='')
+
+
+def run_once(backend_dir, env):
+    started = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', CHILD], cwd=backend_dir, env=env, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    result = json.loads(output.strip().splitlines()[-1])
+    result['wall_ms'] = wall_ms
+    return result
+
+
+def slowest_imports(backend_dir, env, top):
+    """(cumulative ms, module) of the slowest modules imported by wsgi and app, from one cold import"""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import wsgi'], cwd=backend_dir, env=env,
+                             capture_output=True, text=True, check=True)
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # importtime indents 2 spaces per level
+        if not cumulative.strip().isdigit() or not 1 <= depth <= 2:
+            continue  # header, wsgi itself, or a nested import (counted in its parent)
+        imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold start (import + first request)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--ref', default=None, help='git revision to measure instead of the working tree')
+    parser.add_argument('--top', type=int, default=0, help='also list the N slowest imports of wsgi/app')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='cold-start-')
+    backend_dir = export_ref(args.ref, workdir) if args.ref else BACKEND_DIR
+    env = child_env(workdir)
+
+    run_once(backend_dir, env)  # warm the OS page cache and __pycache__
+    runs = [run_once(backend_dir, env) for _ in range(args.runs)]
+
+    print(f"{args.ref or 'working tree'}: {args.runs} runs, median (min-max)")
+    for key, label in (('import_ms', 'import wsgi ms'), ('first_request_ms', 'first request ms'),
+                       ('wall_ms', 'process wall ms'), ('rss_mb', 'peak RSS MB')):
+        values = [run[key] for run in runs]
+        print(f"{label:<20}{statistics.median(values):>10.1f}   ({min(values):.1f}-{max(values):.1f})")
+
+    if args.top:
+        print("\nslowest imports of wsgi/app (cumulative ms)")
+        for milliseconds, name in slowest_imports(backend_dir, env, args.top):
+            print(f"{milliseconds:>10.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""Load-test the API against a local fake Graph API.
+
+Starts benchmarks/fake_graph.py in this process, serves the app in a child
+process (gunicorn with threads or the aiohttp worker, or the threaded Werkzeug server) on a scratch SQLite
+database, drives each scenario with a pool of HTTP clients and reports
+p50/p99 latency, requests per second, peak RSS of the server and upstream
+Graph API calls per scenario. Results are saved as JSON under
+benchmarks/results/ (named after the current commit) to compare across commits:
+
+    python benchmarks/bench_endpoints.py --requests 200 --concurrency 8 --latency 0.05
+    python benchmarks/bench_endpoints.py --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from fake_graph import FakeGraph, FakeGraphConfig  # noqa: E402
+
+BM_ID = 'bench-bm'
+PRESETS = ['last_7d', 'last_30d']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def tree_rss_kb(root_pid):
+    """Resident memory (KB) of a process and its descendants, from /proc (Linux); None elsewhere"""
+    if not os.path.isdir('/proc'):
+        return None
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                parents[int(entry)] = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    pids = {root_pid}
+    changed = True
+    while changed:
+        children = {pid for pid, parent in parents.items() if parent in pids and pid not in pids}
+        pids |= children
+        changed = bool(children)
+
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """Peak RSS of the server process tree while a scenario runs"""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = tree_rss_kb(self.pid)
+            if rss is not None:
+                self.peak_kb = max(self.peak_kb or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(args, graph_url, database_url, log_file):
+    """Serve the app in a child process; returns (process, base_url)"""
+    port = free_port()
+    env = dict(os.environ, META_GRAPH_URL=graph_url, DATABASE_URL=database_url, METRICS_LOG='0',
+               GRAPH_BACKOFF_BASE='0.05', PYTHONUNBUFFERED='1')
+
+    # Create the schema first, as a deploy would (importing the app does no database I/O)
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'init-db'], cwd=BACKEND_DIR, env=env,
+                   stdout=log_file, stderr=subprocess.STDOUT, check=True)
+
+    if args.server == 'gunicorn':
+        # --preload: import once, before forking the workers
+        command = [sys.executable, '-m', 'gunicorn', '--preload', '-w', str(args.workers),
+                   '-k', 'gthread', '--threads', str(args.threads), '-b', f'127.0.0.1:{port}',
+                   '--timeout', '120', 'wsgi:app']
+    elif args.server == 'aiohttp':
+        # asyncio serving mode: one event loop per worker, no request threads
+        command = [sys.executable, '-m', 'gunicorn', '--preload', '-w', str(args.workers),
+                   '-k', 'aiohttp.GunicornWebWorker', '-b', f'127.0.0.1:{port}', '--timeout', '120',
+                   'async_app:create_async_app']
+    else:
+        command = [sys.executable, '-c',
+                   'import sys; from wsgi import app; '
+                   'app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True, use_reloader=False)',
+                   str(port)]
+
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}, see {log_file.name}")
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"Server did not start, see {log_file.name}")
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def scenario_requests(name, accounts, count):
+    """(method, path, json body) of each request of a scenario, cycling accounts and presets"""
+    calls = []
+    for position in range(count):
+        account_id = accounts[position % len(accounts)]
+        preset = PRESETS[(position // len(accounts)) % len(PRESETS)]
+        if name == 'account-insights':
+            calls.append(('GET', f"/api/account-insights?bm_id={BM_ID}&ad_account_id={account_id}"
+                                 f"&date_preset={preset}&refresh=1", None))
+        elif name == 'account-insights-cached':
+            calls.append(('GET', f"/api/account-insights?bm_id={BM_ID}&ad_account_id={account_id}"
+                                 f"&date_preset={preset}", None))
+        elif name == 'ads':
+            calls.append(('GET', f"/api/ads?bm_id={BM_ID}&ad_account_id={account_id}&limit=25", None))
+        elif name == 'generate-pdf':
+            calls.append(('POST', '/api/generate-pdf?refresh=1',
+                          {'bm_id': BM_ID, 'ad_account_id': account_id, 'date_preset': preset}))
+        else:
+            raise ValueError(f"Unknown scenario {name}")
+    return calls
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(name, base_url, server_pid, graph, accounts, args):
+    calls = scenario_requests(name, accounts, args.requests)
+    local = threading.local()
+
+    def send(call):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, body = call
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=args.timeout)
+            response.content
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        return time.perf_counter() - started, status
+
+    # Warm-up (caches, connections) outside the measurement
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send, calls[:args.warmup]))
+
+    graph.reset_stats()
+    with RssSampler(server_pid) as sampler, ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(send, calls))
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, status in results if status and status < 400]
+    upstream = graph.stats()
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status in results if not status or status >= 400),
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 1) if latencies else None,
+        'peak_rss_mb': round(sampler.peak_kb / 1024, 1) if sampler.peak_kb else None,
+        'upstream_calls': upstream['total'],
+        'upstream_calls_per_request': round(upstream['total'] / len(results), 2),
+        'upstream_bytes': upstream['bytes'],
+        'upstream_by_endpoint': upstream['calls'],
+    }
+
+
+def print_results(results, baseline=None):
+    columns = ['requests', 'errors', 'rps', 'p50_ms', 'p99_ms', 'peak_rss_mb', 'upstream_calls_per_request']
+    print(f"{'scenario':<26}" + ''.join(f"{column:>14}" for column in ['req', 'err', 'rps', 'p50 ms', 'p99 ms',
+                                                                        'peak RSS MB', 'upstream/req']))
+    for name, result in results['scenarios'].items():
+        print(f"{name:<26}" + ''.join(f"{_cell(result.get(column)):>14}" for column in columns))
+        previous = (baseline or {}).get('scenarios', {}).get(name)
+        if previous:
+            print(f"{'  vs ' + baseline['commit']:<26}" + ''.join(
+                f"{_delta(result.get(column), previous.get(column)):>14}" for column in columns))
+
+
+def _cell(value):
+    return '-' if value is None else str(value)
+
+
+def _delta(value, previous):
+    if value is None or previous in (None, 0):
+        return '-'
+    return f"{(value - previous) / previous * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API endpoints against a local fake Graph API')
+    parser.add_argument('--scenarios', default='account-insights,account-insights-cached,ads,generate-pdf')
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--warmup', type=int, default=8, help='unmeasured requests before each scenario')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--campaigns', type=int, default=20, help='campaigns per account')
+    parser.add_argument('--page-size', type=int, default=25, help='fake Graph API default page size')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every Graph API call')
+    parser.add_argument('--server', choices=['gunicorn', 'aiohttp', 'werkzeug'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--database-url', default=None, help='default: a scratch SQLite file')
+    parser.add_argument('--output', default=None, help='results file (default benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='earlier results file to diff against')
+    args = parser.parse_args()
+
+    graph = FakeGraph(FakeGraphConfig(accounts=args.accounts, campaigns=args.campaigns,
+                                      page_size=args.page_size, latency=args.latency))
+    graph_url = graph.start()
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    log_path = os.path.join(workdir, 'server.log')
+
+    results = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'compare', 'database_url')},
+        'scenarios': {}
+    }
+
+    with open(log_path, 'w') as log_file:
+        process, base_url = start_server(args, graph_url, database_url, log_file)
+        try:
+            response = requests.post(base_url + '/api/register-bm', json={'bm_id': BM_ID, 'access_token': 'bench'})
+            response.raise_for_status()
+            for name in args.scenarios.split(','):
+                print(f"Running {name}...", file=sys.stderr)
+                results['scenarios'][name] = run_scenario(name, base_url, process.pid, graph,
+                                                          graph.account_ids(), args)
+        finally:
+            stop_server(process)
+    graph.stop()
+
+    results['server_max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Saved {output} (server log: {log_path})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare the previous insights flattening with the insights module.
+
+Before: the SDK cursor built an AdsInsights object per row, then the
+per-endpoint loop flattened it into a dict of strings. Now insight_dicts
+converts the raw JSON pages directly. Measures conversion time and retained
+memory per row on synthetic insights (string metrics, actions/action_values lists).
+
+    python benchmarks/bench_insight_rows.py [rows]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facebook_business.adobjects.adsinsights import AdsInsights
+from facebook_business.adobjects.objectparser import ObjectParser
+
+from insights import insight_dicts
+
+ACTION_TYPES = ['link_click', 'landing_page_view', 'post_engagement', 'page_engagement',
+                'video_view', 'add_to_cart', 'initiate_checkout', 'purchase', 'lead', 'omni_purchase']
+
+
+def raw_insights(count):
+    """Graph API shaped insights: every metric a string"""
+    random.seed(7)
+    insights = []
+    for position in range(count):
+        impressions = random.randint(1000, 50000)
+        clicks = random.randint(10, 1000)
+        spend = random.uniform(5, 500)
+        action_types = random.sample(ACTION_TYPES, random.randint(2, len(ACTION_TYPES)))
+        insights.append({
+            'account_id': '1234567890',
+            'account_name': 'Benchmark Account',
+            'campaign_id': str(120200000000000000 + position % 200),
+            'campaign_name': f'Campaign {position % 200} - Conversions - Broad Audience',
+            'spend': f'{spend:.2f}',
+            'impressions': str(impressions),
+            'clicks': str(clicks),
+            'cpc': f'{spend / clicks:.6f}',
+            'ctr': f'{clicks / impressions * 100:.6f}',
+            'reach': str(int(impressions * 0.8)),
+            'frequency': '1.250000',
+            'date_start': '2026-01-01',
+            'date_stop': '2026-01-01',
+            'actions': [{'action_type': action_type, 'value': str(random.randint(1, 500))}
+                        for action_type in action_types],
+            'action_values': [{'action_type': action_type, 'value': f'{random.uniform(10, 5000):.2f}'}
+                              for action_type in action_types if 'purchase' in action_type]
+        })
+    return insights
+
+
+def legacy_flatten(insight):
+    """The per-endpoint loop insight_dicts replaced"""
+    insight_data = {field: insight.get(field) for field in (
+        'account_id', 'account_name', 'campaign_id', 'campaign_name', 'spend', 'impressions', 'clicks',
+        'cpc', 'ctr', 'reach', 'frequency', 'date_start', 'date_stop')}
+    if 'actions' in insight:
+        for action in insight['actions']:
+            insight_data[f"action_{action.get('action_type')}"] = action.get('value')
+    if 'action_values' in insight:
+        for action_value in insight['action_values']:
+            insight_data[f"value_{action_value.get('action_type')}"] = action_value.get('value')
+    return insight_data
+
+
+def measure(convert, insights):
+    """(seconds, retained bytes) of converting insights"""
+    started = time.perf_counter()
+    convert(insights)
+    seconds = time.perf_counter() - started
+    
+    tracemalloc.start()
+    result = convert(insights)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return seconds, retained
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    insights = raw_insights(count)
+    
+    print(f"{count} insights")
+    parser = ObjectParser(target_class=AdsInsights, reuse_object=None)
+    print(f"{'variant':<28} {'ms':>8} {'bytes/row':>10}")
+    for name, convert in (
+        ('SDK objects + legacy dicts', lambda items: [legacy_flatten(parser.parse_single(insight))
+                                                      for insight in items]),
+        ('legacy dicts only', lambda items: [legacy_flatten(insight) for insight in items]),
+        ('insight_dicts', insight_dicts),
+    ):
+        seconds, retained = measure(convert, insights)
+        print(f"{name:<28} {seconds * 1000:8.1f} {retained / count:10.0f}")
+
+
+if __name__ == '__main__':
+    main()
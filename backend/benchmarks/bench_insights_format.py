@@ -0,0 +1,92 @@
+"""Compare the row and columnar encodings of account insights.
+
+Measures JSON payload size (raw, gzip and brotli when installed) and jsonify
+time on synthetic campaign-level daily rows.
+
+    python benchmarks/bench_insights_format.py [campaigns] [days]
+"""
+import gzip
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from compression import COMPRESS_LEVEL, brotli
+from insights_format import columnar_insights
+
+ACTION_TYPES = ['link_click', 'landing_page_view', 'post_engagement', 'page_engagement',
+                'video_view', 'add_to_cart', 'initiate_checkout', 'purchase', 'lead', 'omni_purchase']
+
+
+def synthetic_rows(campaigns, days):
+    """Rows shaped like insight_dicts output (numeric metrics, sparse actions)"""
+    random.seed(42)
+    first_day = date.today() - timedelta(days=days)
+    rows = []
+    for campaign in range(campaigns):
+        for offset in range(days):
+            day = (first_day + timedelta(days=offset)).isoformat()
+            impressions = random.randint(1000, 50000)
+            clicks = random.randint(10, 1000)
+            spend = random.uniform(5, 500)
+            row = {
+                'account_id': '1234567890',
+                'account_name': 'Benchmark Account',
+                'campaign_id': str(120200000000000000 + campaign),
+                'campaign_name': f'Campaign {campaign} - Conversions - Broad Audience',
+                'spend': round(spend, 2),
+                'impressions': impressions,
+                'clicks': clicks,
+                'cpc': round(spend / clicks, 6),
+                'ctr': round(clicks / impressions * 100, 6),
+                'reach': int(impressions * 0.8),
+                'frequency': 1.25,
+                'date_start': day,
+                'date_stop': day
+            }
+            for action_type in random.sample(ACTION_TYPES, random.randint(2, len(ACTION_TYPES))):
+                row[f'action_{action_type}'] = random.randint(1, 500)
+                if action_type in ('purchase', 'omni_purchase', 'add_to_cart'):
+                    row[f'value_{action_type}'] = round(random.uniform(10, 5000), 2)
+            rows.append(row)
+    return rows
+
+
+def timed(func, repeat=3):
+    """(best seconds of repeat runs, result)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    campaigns = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    rows = synthetic_rows(campaigns, days)
+    app = Flask(__name__)
+    
+    print(f"{len(rows)} rows ({campaigns} campaigns x {days} days)")
+    print(f"{'format':<10} {'encode ms':>10} {'jsonify ms':>11} {'gzip ms':>8} {'total ms':>9} "
+          f"{'raw KB':>9} {'gzip KB':>9} {'br KB':>9}")
+    for name, encode in (('rows', lambda: rows), ('columnar', lambda: columnar_insights(rows))):
+        encode_time, insights = timed(encode)
+        with app.app_context():
+            jsonify_time, body = timed(lambda: jsonify({'insights': insights}).get_data())
+        gzip_time, gzipped = timed(lambda: gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+        br_size = f"{len(brotli.compress(body, quality=4)) / 1024:9.1f}" if brotli else f"{'n/a':>9}"
+        total = encode_time + jsonify_time + gzip_time
+        print(f"{name:<10} {encode_time * 1000:10.1f} {jsonify_time * 1000:11.1f} {gzip_time * 1000:8.1f} "
+              f"{total * 1000:9.1f} {len(body) / 1024:9.1f} {len(gzipped) / 1024:9.1f} {br_size}")
+
+
+if __name__ == '__main__':
+    main()
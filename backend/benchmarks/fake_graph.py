@@ -0,0 +1,414 @@
+"""Local stand-in for the Graph API endpoints the backend calls.
+
+Serves synthetic ad accounts, campaigns, ad sets, ads, previews and insights
+(sync, async report runs and batch calls) with Meta's paging and usage
+headers, configurable sizes, injected latency and injected errors. Used by
+bench_endpoints.py; it can also run on its own for manual testing:
+
+    python benchmarks/fake_graph.py --port 8765 --accounts 3 --campaigns 50 --latency 0.05
+    META_GRAPH_URL=http://127.0.0.1:8765 flask --app wsgi run
+
+GET /__stats returns the calls served per endpoint; POST /__reset clears them.
+"""
+import argparse
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+from zoneinfo import ZoneInfo
+
+ACCOUNT_BASE = 100001  # ad account numbers: act_100001, act_100002...
+ACTION_TYPES = ['link_click', 'landing_page_view', 'post_engagement', 'add_to_cart', 'purchase']
+
+
+class FakeGraphConfig:
+    """Shape of the fake data and behaviour of the server"""
+
+    def __init__(self, accounts=3, campaigns=20, adsets_per_campaign=2, ads_per_adset=2,
+                 page_size=25, latency=0.0, async_polls=2, async_result='Job Completed', preview_links=False,
+                 timezone_name=None):
+        self.accounts = accounts
+        self.campaigns = campaigns  # per account
+        self.adsets_per_campaign = adsets_per_campaign
+        self.ads_per_adset = ads_per_adset
+        self.page_size = page_size  # default page size when the request has no limit (Meta: 25)
+        self.latency = latency  # seconds added to every call
+        self.async_polls = async_polls  # polls before an async report run finishes
+        self.async_result = async_result  # its final async_status ('Job Failed' to simulate a failure)
+        self.preview_links = preview_links  # ads carry preview_shareable_link (no preview calls needed)
+        self.timezone_name = timezone_name  # of every ad account; presets resolve in it (None: the server's date)
+        # Usage reported in the rate limit headers (%)
+        self.app_usage = {'call_count': 5, 'total_cputime': 5, 'total_time': 5}
+        self.business_usage = {'call_count': 5, 'total_cputime': 5, 'total_time': 5,
+                               'estimated_time_to_regain_access': 0}
+        self.account_usage = {'acc_id_util_pct': 5, 'reset_time_duration': 0}
+
+
+def resolve_window(params, today=None):
+    """(since, until) of a date_preset / time_range, defaulting to last_30d like Meta"""
+    today = today or date.today()
+    if params.get('time_range'):
+        time_range = json.loads(params['time_range'])
+        return date.fromisoformat(time_range['since']), date.fromisoformat(time_range['until'])
+
+    preset = params.get('date_preset', 'last_30d')
+    if preset == 'today':
+        return today, today
+    if preset == 'yesterday':
+        return today - timedelta(days=1), today - timedelta(days=1)
+    if preset == 'this_month':
+        return today.replace(day=1), today
+    if preset == 'last_month':
+        until = today.replace(day=1) - timedelta(days=1)
+        return until.replace(day=1), until
+    if preset == 'maximum':
+        return today - timedelta(days=365), today
+    match = re.match(r'last_(\d+)d$', preset)
+    days = int(match.group(1)) if match else 30
+    return today - timedelta(days=days), today - timedelta(days=1)
+
+
+def _graph_time(day):
+    return f"{day.isoformat()}T00:00:00+0000"
+
+
+class FakeGraph:
+    """Threaded HTTP server answering like the Graph API, with per-endpoint call counts"""
+
+    def __init__(self, config=None):
+        self.config = config or FakeGraphConfig()
+        self.calls = Counter()
+        self.bytes_sent = 0
+        self._failures = []  # (status, code) answered by the next calls
+        self._jobs = {}
+        self._rows = OrderedDict()  # generated insight rows, keyed by request
+        self._lock = threading.Lock()
+        self._server = None
+
+    # Data -----------------------------------------------------------------
+
+    def account_ids(self):
+        return [f"act_{ACCOUNT_BASE + position}" for position in range(self.config.accounts)]
+
+    def campaigns(self, account_id):
+        number = account_id.replace('act_', '')
+        return [{
+            'id': f"{number}{position:05d}",
+            'name': f"Campaign {position}",
+            'status': 'ACTIVE' if position % 4 else 'PAUSED',
+            'effective_status': 'ACTIVE' if position % 4 else 'PAUSED',
+            'objective': 'OUTCOME_SALES',
+            'created_time': _graph_time(date(2024, 1, 1) + timedelta(days=position)),
+            'updated_time': _graph_time(date(2024, 6, 1) + timedelta(days=position % 90)),
+        } for position in range(self.config.campaigns)]
+
+    def adsets(self, account_id):
+        return [{
+            'id': f"{campaign['id']}{position:02d}",
+            'name': f"{campaign['name']} / Ad set {position}",
+            'status': campaign['status'],
+            'effective_status': campaign['effective_status'],
+            'campaign_id': campaign['id'],
+            'created_time': campaign['created_time'],
+            'updated_time': campaign['updated_time'],
+        } for campaign in self.campaigns(account_id) for position in range(self.config.adsets_per_campaign)]
+
+    def ads(self, account_id, campaign_id=None):
+        ads = []
+        for adset in self.adsets(account_id):
+            if campaign_id and adset['campaign_id'] != campaign_id:
+                continue
+            for position in range(self.config.ads_per_adset):
+                ad_id = f"{adset['id']}{position:02d}"
+                ads.append({
+                    'id': ad_id,
+                    'name': f"Ad {ad_id}",
+                    'status': adset['status'],
+                    'effective_status': adset['effective_status'],
+                    'campaign_id': adset['campaign_id'],
+                    'adset_id': adset['id'],
+                    'creative': {'id': f"9{ad_id}"},
+                    'preview_shareable_link': f"https://fb.me/{ad_id}" if self.config.preview_links else '',
+                    'created_time': adset['created_time'],
+                    'updated_time': adset['updated_time'],
+                })
+        return ads
+
+    def insight_rows(self, account_id, params, campaign_id=None):
+        """Synthetic insights of an account (or one of its campaigns) for the requested window/level"""
+        key = (account_id, campaign_id, params.get('level'), str(params.get('time_increment')),
+               params.get('date_preset'), params.get('time_range'), self.config.timezone_name)
+        with self._lock:
+            rows = self._rows.get(key)
+            if rows is not None:
+                self._rows.move_to_end(key)
+                return rows
+
+        today = datetime.now(ZoneInfo(self.config.timezone_name)).date() if self.config.timezone_name else None
+        since, until = resolve_window(params, today)
+        daily = str(params.get('time_increment', '')) == '1'
+        days = [since + timedelta(days=offset) for offset in range((until - since).days + 1)] if daily else [None]
+        campaigns = self.campaigns(account_id)
+        if campaign_id:
+            campaigns = [campaign for campaign in campaigns if campaign['id'] == campaign_id]
+        elif params.get('level') not in ('campaign', 'adset', 'ad'):
+            campaigns = [None]
+
+        number = account_id.replace('act_', '')
+        rows = []
+        for day in days:
+            for position, campaign in enumerate(campaigns):
+                seed = (day.toordinal() if day else 1) * 31 + position * 7
+                impressions = 1000 + seed % 5000
+                clicks = 10 + seed % 90
+                spend = 5 + (seed % 500) / 10
+                row = {
+                    'account_id': number,
+                    'account_name': f"Account {number}",
+                    'spend': f"{spend:.2f}",
+                    'impressions': str(impressions),
+                    'clicks': str(clicks),
+                    'cpc': f"{spend / clicks:.6f}",
+                    'ctr': f"{clicks / impressions * 100:.6f}",
+                    'reach': str(impressions * 9 // 10),
+                    'frequency': '1.111111',
+                    'actions': [{'action_type': action_type, 'value': str(clicks // (offset + 1))}
+                                for offset, action_type in enumerate(ACTION_TYPES[:2 + seed % 4])],
+                    'action_values': [{'action_type': 'purchase', 'value': f"{spend * 3:.2f}"}],
+                    'date_start': (day or since).isoformat(),
+                    'date_stop': (day or until).isoformat(),
+                }
+                if campaign:
+                    row['campaign_id'] = campaign['id']
+                    row['campaign_name'] = campaign['name']
+                rows.append(row)
+
+        with self._lock:
+            self._rows[key] = rows
+            while len(self._rows) > 256:
+                self._rows.popitem(last=False)
+        return rows
+
+    # Control --------------------------------------------------------------
+
+    def fail_next(self, status=400, code=17, count=1):
+        """Answer the next count calls with a Graph API error (e.g. 17 = user request limit)"""
+        with self._lock:
+            self._failures.extend([(status, code)] * count)
+
+    def stats(self):
+        with self._lock:
+            # Sub-requests of batch calls are listed (batch:<endpoint>) but are not HTTP calls
+            total = sum(count for label, count in self.calls.items() if not label.startswith('batch:'))
+            return {'calls': dict(self.calls), 'total': total, 'bytes': self.bytes_sent}
+
+    def reset_stats(self):
+        """Zero the call counts and drop injected errors not answered yet"""
+        with self._lock:
+            self.calls.clear()
+            self.bytes_sent = 0
+            self._failures.clear()
+
+    def start(self, port=0, host='127.0.0.1'):
+        """Serve on a daemon thread; returns the base URL to use as META_GRAPH_URL"""
+        self._server = ThreadingHTTPServer((host, port), _handler_class(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-graph', daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # Routing --------------------------------------------------------------
+
+    def _count(self, label):
+        with self._lock:
+            self.calls[label] += 1
+
+    def _take_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def _account_of(self, object_id):
+        """Ad account of a campaign/ad set/ad id (ids embed the account number)"""
+        for account_id in self.account_ids():
+            if object_id.startswith(account_id.replace('act_', '')):
+                return account_id
+        return None
+
+    def route(self, method, parts, params, page_url):
+        """Answer one call (parts: path tokens after the version). Returns (label, status, body)"""
+        if method == 'POST' and len(parts) == 2 and parts[1] == 'insights':
+            report_run_id = str(900000000 + len(self._jobs))
+            with self._lock:
+                self._jobs[report_run_id] = {'account_id': parts[0], 'params': params, 'polls': 0}
+            return 'insights_async', 200, {'report_run_id': report_run_id}
+
+        if len(parts) == 1 and parts[0] in self._jobs:
+            job = self._jobs[parts[0]]
+            job['polls'] += 1
+            done = job['polls'] >= self.config.async_polls
+            return 'report_run', 200, {'id': parts[0],
+                                       'async_status': self.config.async_result if done else 'Job Running',
+                                       'async_percent_completion': 100 if done else 50}
+
+        if len(parts) == 2 and parts[0] in self._jobs and parts[1] == 'insights':
+            job = self._jobs[parts[0]]
+            return 'insights', 200, self._page(self.insight_rows(job['account_id'], job['params']), params, page_url)
+
+        if len(parts) == 2:
+            node, edge = parts
+            if edge == 'owned_ad_accounts':
+                accounts = [dict(self._account(account_id), name=f"Account {account_id}", account_status=1)
+                            for account_id in self.account_ids()]
+                return edge, 200, self._page(accounts, params, page_url)
+            if edge == 'insights':
+                if node.startswith('act_'):
+                    return edge, 200, self._page(self.insight_rows(node, params), params, page_url)
+                rows = self.insight_rows(self._account_of(node) or self.account_ids()[0], params, campaign_id=node)
+                return edge, 200, self._page(rows, params, page_url)
+            if edge in ('campaigns', 'adsets', 'ads'):
+                account_id = node if node.startswith('act_') else self._account_of(node)
+                if edge == 'campaigns':
+                    objects = self.campaigns(account_id)
+                elif edge == 'adsets':
+                    objects = self.adsets(account_id)
+                else:
+                    objects = self.ads(account_id, None if node.startswith('act_') else node)
+                return edge, 200, self._page(self._filter(objects, params), params, page_url)
+            if edge == 'previews':
+                return edge, 200, {'data': [{'body': f'<iframe src="https://fake.preview/{node}"></iframe>'}]}
+
+        if parts and parts[0].startswith('act_'):
+            return 'object', 200, self._account(parts[0])
+        if parts:
+            return 'object', 200, {'id': parts[0]}
+        return 'other', 404, {'error': {'message': 'Unknown path', 'code': 803}}
+
+    def _account(self, account_id):
+        if self.config.timezone_name:
+            return {'id': account_id, 'timezone_name': self.config.timezone_name}
+        return {'id': account_id}
+
+    def _filter(self, objects, params):
+        """The updated_time GREATER_THAN filter used by the metadata delta sync"""
+        if not params.get('filtering'):
+            return objects
+        for condition in json.loads(params['filtering']):
+            if condition.get('field') == 'updated_time' and condition.get('operator') == 'GREATER_THAN':
+                since = datetime.utcfromtimestamp(int(condition['value']))
+                objects = [obj for obj in objects
+                           if datetime.strptime(obj['updated_time'][:19], '%Y-%m-%dT%H:%M:%S') > since]
+        return objects
+
+    def _page(self, rows, params, page_url):
+        limit = int(params.get('limit') or self.config.page_size)
+        offset = int(params.get('after') or 0)
+        page = {'data': rows[offset:offset + limit]}
+        if offset + limit < len(rows):
+            page['paging'] = {'cursors': {'after': str(offset + limit)},
+                              'next': f"{page_url}?{urlencode(dict(params, after=offset + limit))}"}
+        return page
+
+
+def _handler_class(graph):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/__stats':
+                return self._send(200, graph.stats(), usage=False)
+            self._dispatch('GET', url.path, {key: values[0] for key, values in parse_qs(url.query).items()})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+            if url.path == '/__reset':
+                graph.reset_stats()
+                return self._send(200, graph.stats(), usage=False)
+            params = {key: values[0] for key, values in parse_qs(body).items()}
+            params.update({key: values[0] for key, values in parse_qs(url.query).items()})
+            self._dispatch('POST', url.path, params)
+
+        def _dispatch(self, method, path, params):
+            if graph.config.latency:
+                time.sleep(graph.config.latency)
+
+            failure = graph._take_failure()
+            if failure:
+                graph._count('error')
+                status, code = failure
+                return self._send(status, {'error': {'message': f"Injected error {code}", 'code': code,
+                                                     'is_transient': code in (1, 2)}}, path=path)
+
+            parts = path.strip('/').split('/')[1:]  # drop the API version
+            host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+            if method == 'POST' and not parts and 'batch' in params:
+                graph._count('batch')
+                answers = []
+                for sub_request in json.loads(params['batch']):
+                    relative = urlparse('/v0/' + sub_request['relative_url'].lstrip('/'))
+                    sub_params = {key: values[0] for key, values in parse_qs(relative.query).items()}
+                    sub_parts = relative.path.strip('/').split('/')[1:]
+                    label, status, body = graph.route(sub_request.get('method', 'GET'), sub_parts, sub_params,
+                                                      host + relative.path)
+                    graph._count(f"batch:{label}")
+                    answers.append({'code': status, 'headers': [], 'body': json.dumps(body)})
+                return self._send(200, answers, path=path)
+
+            label, status, body = graph.route(method, parts, params, host + path)
+            graph._count(label)
+            self._send(status, body, path=path)
+
+        def _send(self, status, body, path='', usage=True):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            if usage:
+                config = graph.config
+                self.send_header('X-App-Usage', json.dumps(config.app_usage))
+                self.send_header('X-Business-Use-Case-Usage',
+                                 json.dumps({'0': [dict(config.business_usage, type='ads_insights')]}))
+                if '/act_' in path:
+                    self.send_header('X-Ad-Account-Usage', json.dumps(config.account_usage))
+            self.end_headers()
+            self.wfile.write(payload)
+            with graph._lock:
+                graph.bytes_sent += len(payload)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--campaigns', type=int, default=20, help='campaigns per account')
+    parser.add_argument('--page-size', type=int, default=25, help='rows per page when the call sets no limit')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    args = parser.parse_args()
+
+    graph = FakeGraph(FakeGraphConfig(accounts=args.accounts, campaigns=args.campaigns,
+                                      page_size=args.page_size, latency=args.latency))
+    url = graph.start(args.port)
+    print(f"Fake Graph API on {url} (accounts: {', '.join(graph.account_ids())})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        graph.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+from collections import namedtuple
+import os
+import threading
+import time
+
+from metrics import timed
+from models import BusinessManager
+
+# Seconds a BM/token stays cached in this process. Invalidation is per process,
+# so other gunicorn workers pick up token changes/deletions after at most this long.
+BM_CACHE_TTL = int(os.environ.get('BM_CACHE_TTL', 300))
+
+CachedBM = namedtuple('CachedBM', ['bm_id', 'access_token'])
+
+_cache = {}  # bm_id -> (expires_at, CachedBM)
+_lock = threading.Lock()
+
+
+@timed('bm_lookup')
+def get_bm(bm_id):
+    """Return the (bm_id, access_token) of a registered BM, or None.
+
+    Served from memory when possible so hot paths skip the database lookup.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(bm_id)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    bm = BusinessManager.query.filter_by(bm_id=bm_id).first()
+    if not bm:
+        return None
+
+    cached = CachedBM(bm.bm_id, bm.access_token)
+    with _lock:
+        _cache[bm_id] = (now + BM_CACHE_TTL, cached)
+    return cached
+
+
+def invalidate_bm(bm_id):
+    """Forget a cached BM (after register_bm updates it or delete_bm_account removes it)"""
+    with _lock:
+        _cache.pop(bm_id, None)
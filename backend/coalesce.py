@@ -0,0 +1,237 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+import hashlib
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
+
+from models import db
+
+# Seconds a caller waits on someone else's fetch before fetching on its own
+COALESCE_WAIT = float(os.environ.get('COALESCE_WAIT', 120))
+ADVISORY_LOCK_POLL = 0.1  # seconds between pg_try_advisory_lock attempts
+
+# Connections per process for advisory locks (one per fetch in progress), and how long to wait for one
+ADVISORY_LOCK_POOL_SIZE = int(os.environ.get('ADVISORY_LOCK_POOL_SIZE', 5))
+ADVISORY_LOCK_POOL_TIMEOUT = float(os.environ.get('ADVISORY_LOCK_POOL_TIMEOUT', 1))  # seconds
+
+
+class _Flight:
+    """One in-progress fetch and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}  # key -> _Flight
+_lock = threading.Lock()
+_async_flights = {}  # key -> asyncio.Task (asyncio serving mode, one event loop per process)
+_lock_engines = {}  # database URL -> engine of the advisory lock connections
+
+
+def single_flight(key, fn):
+    """Run fn() once per key for concurrent callers in this process; the others wait and share its result.
+
+    A waiter that is still waiting after COALESCE_WAIT seconds runs fn() itself.
+    """
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if flight.done.wait(COALESCE_WAIT):
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        return fn()
+
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+async def async_single_flight(key, fn):
+    """single_flight for a coroutine function: concurrent awaiters in this event loop share one fn() call.
+
+    The call is shielded, so a client that disconnects does not cancel it for the others.
+    """
+    flight = _async_flights.get(key)
+    if flight is None:
+        flight = _async_flights[key] = asyncio.ensure_future(fn())
+        flight.add_done_callback(lambda task: _finish_async_flight(key, task))
+        return await asyncio.shield(flight)
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(flight), COALESCE_WAIT)
+    except asyncio.TimeoutError:
+        return await fn()
+
+
+def _finish_async_flight(key, task):
+    if _async_flights.get(key) is task:
+        del _async_flights[key]
+    if not task.cancelled():
+        task.exception()  # retrieved: the awaiters that are left re-raise it
+
+
+def advisory_lock_id(key):
+    """Signed 64-bit Postgres advisory lock id of a key"""
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+def lock_engine():
+    """Engine of the advisory lock connections, or None off Postgres.
+
+    A lock is held on its own connection for the whole fetch (seconds of
+    Graph API calls), so the lock connections get their own small pool
+    instead of taking them from the request pool (5 + 10 by default).
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    url = db.engine.url
+    with _lock:
+        engine = _lock_engines.get(url)
+        if engine is None:
+            engine = _lock_engines[url] = create_engine(url, pool_size=ADVISORY_LOCK_POOL_SIZE, max_overflow=0,
+                                                        pool_timeout=ADVISORY_LOCK_POOL_TIMEOUT,
+                                                        pool_pre_ping=True)
+        return engine
+
+
+def _lock_connection(engine):
+    """A connection of the lock pool, or None when every one holds a lock"""
+    try:
+        return engine.connect()
+    except SQLAlchemyTimeoutError:
+        print(f"Advisory lock pool exhausted ({ADVISORY_LOCK_POOL_SIZE}), fetching without the lock")
+        return None
+
+
+def _try_lock(connection, lock_id):
+    acquired = connection.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': lock_id}).scalar()
+    connection.commit()
+    return acquired
+
+
+def _release(connection, lock_id=None):
+    """Unlock lock_id (when held) and return the connection to the lock pool"""
+    try:
+        if lock_id is not None:
+            connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': lock_id})
+            connection.commit()
+    finally:
+        connection.close()
+
+
+@contextmanager
+def advisory_lock(key, timeout=None):
+    """Hold a Postgres advisory lock on key, shared by every worker process.
+
+    Yields True once acquired, or False after timeout seconds or when the
+    lock pool is exhausted (the caller then proceeds without it). A no-op
+    that yields True on other databases.
+    """
+    engine = lock_engine()
+    if engine is None:
+        yield True
+        return
+
+    # Session-level lock on a dedicated connection: it outlives the commits of the fetch
+    connection = _lock_connection(engine)
+    if connection is None:
+        yield False
+        return
+
+    timeout = COALESCE_WAIT if timeout is None else timeout
+    lock_id = advisory_lock_id(key)
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = _try_lock(connection, lock_id)
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(ADVISORY_LOCK_POLL)
+        yield acquired
+    finally:
+        _release(connection, lock_id if acquired else None)
+
+
+@asynccontextmanager
+async def async_advisory_lock(key, run, timeout=None):
+    """advisory_lock for the asyncio serving mode: waits with asyncio.sleep.
+
+    run(fn, *args) runs the blocking database calls off the event loop, in an
+    app context (FlaskBridge.run).
+    """
+    engine = await run(lock_engine)
+    if engine is None:
+        yield True
+        return
+
+    connection = await run(_lock_connection, engine)
+    if connection is None:
+        yield False
+        return
+
+    timeout = COALESCE_WAIT if timeout is None else timeout
+    lock_id = advisory_lock_id(key)
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = await run(_try_lock, connection, lock_id)
+            if acquired or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(ADVISORY_LOCK_POLL)
+        yield acquired
+    finally:
+        await run(_release, connection, lock_id if acquired else None)
+
+
+def coalesced(key, fetch, recheck=None):
+    """Fetch once per key: in-process through single_flight, across workers through an advisory lock.
+
+    recheck() runs once the lock is held and returns what another worker stored
+    meanwhile (e.g. a cache lookup), or None to fetch.
+    """
+    def lead():
+        with advisory_lock(key):
+            if recheck:
+                result = recheck()
+                if result is not None:
+                    return result
+            return fetch()
+
+    return single_flight(key, lead)
+
+
+async def async_coalesced(key, fetch, run, recheck=None):
+    """coalesced for coroutine functions: in-process through async_single_flight, across workers
+    (and the Flask routes) through the same advisory lock.
+
+    run is as in async_advisory_lock; recheck is a coroutine function.
+    """
+    async def lead():
+        async with async_advisory_lock(key, run):
+            if recheck:
+                result = await recheck()
+                if result is not None:
+                    return result
+            return await fetch()
+
+    return await async_single_flight(key, lead)
@@ -0,0 +1,57 @@
+import gzip
+import os
+
+from metrics import timed
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 3))  # gzip level; low levels suit dynamic JSON (brotli uses quality 4)
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/html', 'text/csv')
+
+
+def choose_encoding(accept_encodings):
+    """Pick br or gzip from the request's Accept-Encoding, or None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+@timed('compress')
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=4)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+
+def init_compression(app):
+    """Compress large JSON/text responses with brotli or gzip, per Accept-Encoding"""
+    from flask import request
+    
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESS_MIMETYPES):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if not encoding or (response.content_length or 0) < COMPRESS_MIN_SIZE:
+            return response
+        
+        response.set_data(compress_body(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        
+        # The encoded bytes differ from the identity representation
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+    
+    return app
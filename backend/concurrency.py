@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import time
+
+# time.monotonic() by which the current fan_out call must be done (None: no limit)
+_deadline = contextvars.ContextVar('fan_out_deadline', default=None)
+
+
+def check_deadline():
+    """Raise TimeoutError once the deadline of the enclosing fan_out call has passed.
+
+    Long calls run by fan_out check it between steps (Graph API pages, date
+    ranges) so they stop soon after the caller has given up on them.
+    """
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError('Deadline exceeded')
+
+
+def _effective_deadline(timeout):
+    """(deadline, timeout message) of a call given timeout seconds inside the current deadline"""
+    deadline = _deadline.get()
+    message = 'Deadline exceeded'  # the enclosing call's
+    if timeout is not None:
+        ends = time.monotonic() + timeout
+        if deadline is None or ends <= deadline:
+            deadline, message = ends, f'Timed out after {timeout}s'
+    return deadline, message
+
+
+def _run_until(deadline, func, item):
+    _deadline.set(deadline)
+    return func(item)
+
+
+def fan_out(func, items, max_workers, timeout=None):
+    """Run func(item) for every item on a bounded thread pool.
+
+    Returns a list aligned with items of (result, error) tuples, where error is
+    None on success or a message when the call raised or missed the timeout.
+
+    Python threads can't be interrupted: a call still running at the timeout
+    keeps its thread until it reaches check_deadline() (or finishes), while
+    calls that had not started are dropped. Each fan_out call starts at most
+    min(max_workers, len(items)) threads; nested calls keep the earliest deadline.
+    """
+    if not items:
+        return []
+
+    deadline, message = _effective_deadline(timeout)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    try:
+        # Each call runs in a copy of the caller's context (request metrics follow it)
+        futures = [executor.submit(contextvars.copy_context().run, _run_until, deadline, func, item)
+                   for item in items]
+        done, _ = wait(futures, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        results = []
+        for future in futures:
+            if future not in done:
+                results.append((None, message))
+                continue
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, str(e)))
+        return results
+    finally:
+        # Drop the calls that never started; running ones stop at their next check_deadline()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def gather_until(coroutines, timeout=None):
+    """fan_out for coroutines: run them concurrently, each one's failure kept to itself.
+
+    Returns a list aligned with coroutines of each result, or the exception it
+    raised. Unlike threads, coroutines can be stopped: the ones still running
+    at the timeout (or the enclosing deadline, whichever comes first) are
+    cancelled and get a TimeoutError with fan_out's message.
+    """
+    if not coroutines:
+        return []
+
+    deadline, message = _effective_deadline(timeout)
+    # Tasks copy the current context, so check_deadline() sees the deadline inside them
+    token = _deadline.set(deadline)
+    try:
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    finally:
+        _deadline.reset(token)
+
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=None if deadline is None
+                                        else max(0.0, deadline - time.monotonic()))
+    finally:
+        for task in tasks:
+            task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = []
+    for task in tasks:
+        if task.cancelled():
+            results.append(TimeoutError(message))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
@@ -0,0 +1,207 @@
+from datetime import date, datetime, timedelta
+import os
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+
+from concurrency import check_deadline
+from date_ranges import MUTABLE_DAYS, contiguous_ranges, iter_days
+from insights import normalize_rows
+from metrics import timed
+from models import db, DailyInsight, DailyInsightDay
+
+# Seconds a fetched mutable day (last MUTABLE_DAYS) is served before it is fetched again
+MUTABLE_REFRESH_AFTER = int(os.environ.get('INSIGHTS_MUTABLE_REFRESH_AFTER', 900))
+
+# Rows per INSERT statement (keeps the bound parameters under SQLite's limit)
+UPSERT_CHUNK_ROWS = 500
+
+# INSERT ... ON CONFLICT DO UPDATE of the databases the app runs on (others select, then update or insert)
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def days_to_fetch(ad_account_id, since, until, today=None, force=False, now=None):
+    """Return the days in [since, until] that are missing or may still change.
+
+    Mutable days fetched less than MUTABLE_REFRESH_AFTER seconds ago (e.g. by
+    the prewarm run, or another window of the same account) are not fetched again.
+    """
+    today = today or date.today()
+    window = list(iter_days(since, until))
+    if force:
+        return window
+
+    mutable_from = today - timedelta(days=MUTABLE_DAYS)
+    fresh_after = (now or datetime.utcnow()) - timedelta(seconds=MUTABLE_REFRESH_AFTER)
+    stored = {row.date: row.fetched_at for row in DailyInsightDay.query
+              .with_entities(DailyInsightDay.date, DailyInsightDay.fetched_at)
+              .filter(DailyInsightDay.ad_account_id == ad_account_id,
+                      DailyInsightDay.date >= since,
+                      DailyInsightDay.date <= until)}
+
+    return [day for day in window
+            if day not in stored or (day >= mutable_from and (stored[day] or datetime.min) < fresh_after)]
+
+
+def _upsert(model, values, key_columns):
+    """Insert rows, updating the ones whose key_columns already exist.
+
+    Rows are written in key order, so concurrent writers of overlapping
+    ranges lock them in the same order instead of deadlocking.
+    """
+    insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+    values = sorted(values, key=lambda row: tuple(row[column] for column in key_columns))
+    if insert is None:
+        _select_and_write(model, values, key_columns)
+        return
+
+    for start in range(0, len(values), UPSERT_CHUNK_ROWS):
+        statement = insert(model.__table__).values(values[start:start + UPSERT_CHUNK_ROWS])
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: statement.excluded[column] for column in values[0] if column not in key_columns}
+        )
+        db.session.execute(statement)
+
+
+def _select_and_write(model, values, key_columns):
+    """_upsert for databases without ON CONFLICT: select the existing keys, then
+    update those rows and insert the others, in the caller's transaction.
+
+    Unlike ON CONFLICT, a concurrent writer inserting the same keys in between
+    makes the insert fail (unique constraint) instead of updating.
+    """
+    table = model.__table__
+    if not values:
+        return
+    set_columns = [column for column in values[0] if column not in key_columns]
+    update = table.update().where(and_(*[table.c[column] == bindparam(f"key_{column}") for column in key_columns]))
+    update = update.values({column: bindparam(f"set_{column}") for column in set_columns})
+
+    for start in range(0, len(values), UPSERT_CHUNK_ROWS):
+        chunk = values[start:start + UPSERT_CHUNK_ROWS]
+        # Rows matching every key column's values: a superset of the chunk's keys, narrowed below
+        existing = {tuple(row) for row in db.session.execute(
+            table.select().with_only_columns(*[table.c[column] for column in key_columns]).where(
+                *[table.c[column].in_({row[column] for row in chunk}) for column in key_columns]))}
+        updates = [row for row in chunk if tuple(row[column] for column in key_columns) in existing]
+        inserts = [row for row in chunk if tuple(row[column] for column in key_columns) not in existing]
+        if updates:
+            db.session.execute(update, [
+                dict({f"key_{column}": row[column] for column in key_columns},
+                     **{f"set_{column}": row[column] for column in set_columns})
+                for row in updates])
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+
+
+@timed('db_write')
+def store_daily_rows(ad_account_id, since, until, rows):
+    """Replace the stored rows for [since, until] with freshly fetched ones.
+
+    Upserts rather than delete + insert: requests with different windows (so
+    not coalesced) can store the same days at the same time, and the second
+    insert would break the unique constraints.
+    """
+    now = datetime.utcnow()
+
+    # Later rows of the same campaign and day win, as they did with one insert per row
+    by_key = {}
+    for row in rows:
+        day = date.fromisoformat(row['date_start'])
+        by_key[(day, row.get('campaign_id') or '')] = row
+    _upsert(DailyInsight, [{
+        'ad_account_id': ad_account_id,
+        'date': day,
+        'campaign_id': campaign_id,
+        'insight_data': row,
+        'fetched_at': now
+    } for (day, campaign_id), row in by_key.items()], ['ad_account_id', 'date', 'campaign_id'])
+
+    # Campaigns the new fetch no longer returns for these days (rows a concurrent, newer fetch wrote are kept)
+    DailyInsight.query.filter(
+        DailyInsight.ad_account_id == ad_account_id,
+        DailyInsight.date >= since,
+        DailyInsight.date <= until,
+        DailyInsight.fetched_at < now
+    ).delete(synchronize_session=False)
+
+    # Days without delivery produce no rows but still count as fetched
+    _upsert(DailyInsightDay, [{'ad_account_id': ad_account_id, 'date': day, 'fetched_at': now}
+                              for day in iter_days(since, until)], ['ad_account_id', 'date'])
+
+    db.session.commit()
+
+
+@timed('db_read')
+def load_daily_rows(ad_account_id, since, until):
+    """Load stored rows for [since, until], ordered by day and campaign (metrics as numbers)"""
+    rows = DailyInsight.query.filter(
+        DailyInsight.ad_account_id == ad_account_id,
+        DailyInsight.date >= since,
+        DailyInsight.date <= until
+    ).order_by(DailyInsight.date.asc(), DailyInsight.campaign_id.asc()).all()
+    return normalize_rows([row.insight_data for row in rows])
+
+
+def sync_daily_insights(ad_account_id, since, until, fetch_rows, force=False, today=None):
+    """Fetch only the missing/mutable days through fetch_rows(since, until) and
+    return the merged rows for the whole window.
+
+    fetch_rows must return processed daily rows (time_increment=1) for the range.
+    today is the account's current date (see account_timezones).
+    """
+    for range_since, range_until in contiguous_ranges(days_to_fetch(ad_account_id, since, until, today=today,
+                                                                    force=force)):
+        check_deadline()
+        rows = fetch_rows(range_since, range_until)
+        store_daily_rows(ad_account_id, range_since, range_until, rows)
+        print(f"Daily insights synced for {ad_account_id}: {range_since} to {range_until} ({len(rows)} rows)")
+
+    return load_daily_rows(ad_account_id, since, until)
+
+
+def daily_ranges_to_fetch(windows, force=False):
+    """The missing/mutable (ad_account_id, since, until) ranges of several accounts' windows.
+
+    windows is a list of (ad_account_id, since, until, today): accounts in
+    different timezones resolve the same preset to different days.
+    """
+    return [(ad_account_id, range_since, range_until) for ad_account_id, since, until, today in windows
+            for range_since, range_until in contiguous_ranges(days_to_fetch(ad_account_id, since, until,
+                                                                            today=today, force=force))]
+
+
+def store_daily_ranges(windows, ranges, results):
+    """Store the fetched ranges and return the merged rows of every window.
+
+    results is aligned with ranges: processed daily rows, or the exception the
+    range failed with. Ranges that were fetched are stored even when another
+    range of the same account failed. Returns a list aligned with windows of
+    (rows, error), error being the account's first exception.
+    """
+    errors = {}
+    for (ad_account_id, range_since, range_until), rows in zip(ranges, results):
+        if isinstance(rows, Exception):
+            errors.setdefault(ad_account_id, rows)
+            continue
+        store_daily_rows(ad_account_id, range_since, range_until, rows)
+        print(f"Daily insights synced for {ad_account_id}: {range_since} to {range_until} ({len(rows)} rows)")
+
+    return [(None, errors[ad_account_id]) if ad_account_id in errors
+            else (load_daily_rows(ad_account_id, since, until), None)
+            for ad_account_id, since, until, today in windows]
+
+
+def sync_daily_insights_batch(windows, fetch_ranges, force=False):
+    """sync_daily_insights for several accounts, fetching the ranges of all of them in one go.
+
+    windows is a list of (ad_account_id, since, until, today).
+    fetch_ranges([(ad_account_id, since, until), ...]) returns a list aligned
+    with its argument of processed daily rows, or the exception the range
+    failed with (e.g. one Graph API batch). Returns a list aligned with
+    windows of (rows, error message).
+    """
+    ranges = daily_ranges_to_fetch(windows, force=force)
+    results = store_daily_ranges(windows, ranges, fetch_ranges(ranges) if ranges else [])
+    return [(rows, None if error is None else str(error)) for rows, error in results]
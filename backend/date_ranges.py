@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+import os
+import re
+
+# Meta keeps re-attributing conversions for up to 28 days after the event,
+# so only days older than this are considered closed.
+ATTRIBUTION_WINDOW_DAYS = 28
+
+# Most late revisions land in the last few days, so these are re-fetched (see days_to_fetch).
+MUTABLE_DAYS = int(os.environ.get('INSIGHTS_MUTABLE_DAYS', 3))
+
+
+def resolve_date_window(date_preset=None, start_date=None, end_date=None, today=None):
+    """Translate a Meta date_preset or a custom range into concrete (since, until) dates.
+
+    Returns None when the window cannot be resolved locally (e.g. 'maximum').
+    """
+    today = today or date.today()
+
+    if (not date_preset or date_preset == 'custom') and start_date and end_date:
+        try:
+            return date.fromisoformat(start_date), date.fromisoformat(end_date)
+        except ValueError:
+            return None
+
+    if not date_preset or date_preset == 'custom':
+        date_preset = 'last_7d'
+
+    if date_preset == 'today':
+        return today, today
+    if date_preset == 'yesterday':
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday
+
+    # last_3d, last_7d, last_14d, last_28d, last_30d, last_90d (today not included)
+    match = re.fullmatch(r'last_(\d+)d', date_preset)
+    if match:
+        days = int(match.group(1))
+        return today - timedelta(days=days), today - timedelta(days=1)
+
+    if date_preset == 'this_month':
+        return today.replace(day=1), today
+    if date_preset == 'last_month':
+        last_day = today.replace(day=1) - timedelta(days=1)
+        return last_day.replace(day=1), last_day
+    if date_preset == 'this_week_mon_today':
+        return today - timedelta(days=today.weekday()), today
+    if date_preset == 'this_week_sun_today':
+        return today - timedelta(days=(today.weekday() + 1) % 7), today
+    if date_preset == 'last_week_mon_sun':
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6)
+    if date_preset == 'last_week_sun_sat':
+        start = today - timedelta(days=(today.weekday() + 1) % 7 + 7)
+        return start, start + timedelta(days=6)
+    if date_preset == 'this_quarter':
+        first_month = 3 * ((today.month - 1) // 3) + 1
+        return today.replace(month=first_month, day=1), today
+    if date_preset == 'last_quarter':
+        first_month = 3 * ((today.month - 1) // 3) + 1
+        last_day = today.replace(month=first_month, day=1) - timedelta(days=1)
+        start_month = 3 * ((last_day.month - 1) // 3) + 1
+        return last_day.replace(month=start_month, day=1), last_day
+    if date_preset == 'this_year':
+        return today.replace(month=1, day=1), today
+    if date_preset == 'last_year':
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+
+    return None
+
+
+def iter_days(since, until):
+    """Yield every date from since to until (inclusive)"""
+    for offset in range((until - since).days + 1):
+        yield since + timedelta(days=offset)
+
+
+def contiguous_ranges(days):
+    """Collapse a collection of dates into sorted (since, until) runs"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(since, until) for since, until in ranges]
+
+
+def custom_preset_label(start_date, end_date):
+    """Label stored as date_preset for custom ranges, e.g. 'custom:2024-01-01:2024-01-31'"""
+    return f"custom:{str(start_date)[:10]}:{str(end_date)[:10]}"
+
+
+def parse_custom_preset(date_preset):
+    """Extract (start_date, end_date) strings from a 'custom:...' label, or None.
+
+    Accepts both custom_preset_label output and the dashboard's
+    'custom:<ISO datetime>:<ISO datetime>' form.
+    """
+    if not date_preset or not date_preset.startswith('custom:'):
+        return None
+    dates = re.findall(r'\d{4}-\d{2}-\d{2}', date_preset)
+    if len(dates) != 2:
+        return None
+    return dates[0], dates[1]
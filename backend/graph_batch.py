@@ -0,0 +1,140 @@
+from functools import partial
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from facebook_business.api import FacebookAdsApiBatch
+from facebook_business.exceptions import FacebookError
+
+from concurrency import check_deadline, fan_out
+from graph_client import ScheduledFacebookAdsApi
+
+# Graph API accepts at most 50 sub-requests per batch call
+MAX_BATCH_SIZE = 50
+
+_MISSING = object()
+
+_VERSION_PATTERN = re.compile(r'v\d+(\.\d+)?')
+
+# Credentials of paging URLs; the batch call carries its own
+_CREDENTIAL_PARAMS = ('access_token', 'appsecret_proof')
+
+
+def _on_success(results, index, response):
+    results[index] = response.json()
+
+
+def _on_failure(results, index, response):
+    results[index] = response.error()
+
+
+def _relative_url(url):
+    """Batch relative_url of an absolute Graph API URL (a paging 'next' link)"""
+    parts = urlsplit(url)
+    path = parts.path.lstrip('/')
+    version, _, rest = path.partition('/')
+    if _VERSION_PATTERN.fullmatch(version):
+        path = rest
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if key not in _CREDENTIAL_PARAMS])
+    return f"{path}?{query}" if query else path
+
+
+class _IdempotentCalls:
+    """The api of a batch made only of GETs: its POST is retried on transient errors like a GET"""
+
+    def __init__(self, api):
+        self._api = api
+
+    def call(self, *args, **kwargs):
+        return self._api.call(*args, idempotent=True, **kwargs)
+
+
+def _is_get(request):
+    return isinstance(request, tuple) or request._method == 'GET'
+
+
+def execute_batch(api, requests, batch_size=MAX_BATCH_SIZE, max_retries=1):
+    """Execute requests through Graph API batch calls.
+
+    A request is either a pending SDK request (pending=True) or a GET given as
+    (relative_path, params): path tokens, a relative URL or a paging 'next'
+    URL, and params or None. Requests are packed into batches of up to
+    batch_size (max 50). Returns a list aligned with requests holding either
+    the parsed JSON body of each sub-request or the FacebookRequestError it
+    failed with. Sub-requests Meta did not answer (null entries) are retried
+    max_retries times. A batch of GETs only is retried on transient errors
+    like a single GET.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    results = [_MISSING] * len(requests)
+
+    for start in range(0, len(requests), batch_size):
+        chunk = requests[start:start + batch_size]
+        if isinstance(api, ScheduledFacebookAdsApi) and all(_is_get(request) for request in chunk):
+            # The unanswered calls' batch (execute() returns) keeps the same api
+            batch = FacebookAdsApiBatch(_IdempotentCalls(api))
+        else:
+            batch = api.new_batch()
+        for index, pending_request in enumerate(chunk, start):
+            success = partial(_on_success, results, index)
+            failure = partial(_on_failure, results, index)
+            if isinstance(pending_request, tuple):
+                relative_path, params = pending_request
+                if isinstance(relative_path, str) and '://' in relative_path:
+                    relative_path = _relative_url(relative_path)
+                batch.add('GET', relative_path, params, success=success, failure=failure)
+            else:
+                batch.add_request(pending_request, success=success, failure=failure)
+
+        # execute() returns a new batch with the unanswered calls, or None
+        attempts = 0
+        while batch is not None and attempts <= max_retries:
+            batch = batch.execute()
+            attempts += 1
+
+    return [FacebookError('No response for request in batch') if result is _MISSING else result
+            for result in results]
+
+
+def _fetch_pages(api, requests):
+    """Every page of one chunk of list requests: one batch call per round of next pages"""
+    rows = [[] for _ in requests]
+    errors = [None] * len(requests)
+    pending = list(enumerate(requests))
+    while pending:
+        responses = execute_batch(api, [request for _, request in pending])
+        next_pending = []
+        for (index, _), response in zip(pending, responses):
+            if isinstance(response, Exception):
+                errors[index] = response
+                continue
+            rows[index].extend(response.get('data', []))
+            next_page = (response.get('paging') or {}).get('next')
+            if next_page:
+                next_pending.append((index, (next_page, None)))
+        pending = next_pending
+        if pending:
+            check_deadline()
+    return [data if error is None else error for data, error in zip(rows, errors)]
+
+
+def execute_batch_pages(api, requests, batch_size=MAX_BATCH_SIZE, max_workers=1, timeout=None):
+    """Fetch every page of list requests (e.g. insights edges) through batch calls.
+
+    requests are as in execute_batch. Each chunk of batch_size requests is one
+    batch call per round; the next pages of its requests go in the following
+    rounds. Chunks run on up to max_workers threads (fan_out). Returns a list
+    aligned with requests of the concatenated 'data' rows or the error the
+    request failed with.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    chunks = chunked(list(requests), batch_size)
+    results = []
+    for chunk, (rows, error) in zip(chunks, fan_out(partial(_fetch_pages, api), chunks, max_workers, timeout)):
+        results.extend(rows if error is None else [FacebookError(error)] * len(chunk))
+    return results
+
+
+def chunked(items, size):
+    """Split a list into consecutive chunks of at most size items"""
+    return [items[start:start + size] for start in range(0, len(items), size)]
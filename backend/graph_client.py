@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
+from requests.adapters import HTTPAdapter
+
+from facebook_business.exceptions import FacebookRequestError
+
+from metrics import phase, record_graph_call
+from rate_limits import scheduled_call
+
+# Keep-alive connections per BM session (roughly the concurrent calls per BM)
+POOL_MAXSIZE = int(os.environ.get('GRAPH_POOL_MAXSIZE', 10))
+REQUEST_TIMEOUT = float(os.environ.get('GRAPH_REQUEST_TIMEOUT', 120))  # seconds
+
+_clients = {}  # bm_id -> (access_token, FacebookAdsApi)
+_lock = threading.Lock()
+
+
+class ScheduledFacebookAdsApi(FacebookAdsApi):
+    """FacebookAdsApi whose calls (SDK cursors, batches, raw paging) go through the rate limit scheduler"""
+
+    def __init__(self, session, bm_id=None, api_version=None):
+        super().__init__(session, api_version)
+        self.bm_id = bm_id
+
+    def call(self, method, path, params=None, headers=None, files=None, url_override=None, api_version=None,
+             idempotent=None):
+        return scheduled_call(self._timed_call, self.bm_id, method, path, params=params, headers=headers,
+                              files=files, url_override=url_override, api_version=api_version,
+                              idempotent=idempotent)
+
+    def _timed_call(self, method, path, **kwargs):
+        started = time.perf_counter()
+        with phase('graph_api'):
+            try:
+                response = FacebookAdsApi.call(self, method, path, **kwargs)
+            except FacebookRequestError as e:
+                body = e.body()
+                record_graph_call(method, e.http_status(), len(body) if isinstance(body, str) else 0,
+                                  time.perf_counter() - started)
+                raise
+        record_graph_call(method, response.status(), len(response.body() or ''), time.perf_counter() - started)
+        return response
+
+
+def build_api(access_token, bm_id=None):
+    """Create a FacebookAdsApi with its own pooled keep-alive HTTP session.
+
+    bm_id scopes the Business Use Case usage Meta reports back to that BM.
+    """
+    session = FacebookSession(
+        os.environ.get('META_APP_ID'),
+        os.environ.get('META_APP_SECRET'),
+        access_token,
+        timeout=REQUEST_TIMEOUT
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+    session.requests.mount('https://', adapter)
+    session.requests.mount('http://', adapter)
+    return ScheduledFacebookAdsApi(session, bm_id)
+
+
+def init_default_api(app_id, app_secret, access_token, graph_url=None):
+    """Set the SDK's process-wide default API (the app's own token) and, optionally,
+    the Graph API base URL of every client (e.g. a local fake Graph API server).
+    """
+    if graph_url:
+        FacebookSession.GRAPH = graph_url.rstrip('/')
+    FacebookAdsApi.init(app_id, app_secret, access_token)
+
+
+def get_api(bm):
+    """Return the pooled API client for a BusinessManager, rebuilding it if the token changed.
+
+    Pass the result explicitly (api=...) to SDK objects; the process-wide default
+    API is never swapped, so concurrent requests for different BMs are safe.
+    """
+    with _lock:
+        entry = _clients.get(bm.bm_id)
+        if entry and entry[0] == bm.access_token:
+            return entry[1]
+
+        api = build_api(bm.access_token, bm.bm_id)
+        _clients[bm.bm_id] = (bm.access_token, api)
+        return api
+
+
+def evict_api(bm_id):
+    """Drop the pooled client of a BM (token updated or BM deleted).
+
+    The session is not closed here since other threads may still be using it.
+    """
+    with _lock:
+        _clients.pop(bm_id, None)
@@ -0,0 +1,257 @@
+import os
+import sys
+
+from concurrency import check_deadline
+from graph_batch import execute_batch_pages
+from metrics import timed
+
+# Fields requested for campaign-level account insights
+ACCOUNT_INSIGHT_FIELDS = [
+    'account_id',
+    'account_name',
+    'campaign_id',
+    'campaign_name',  # Adicionado nome da campanha
+    'spend',
+    'impressions',
+    'clicks',
+    'cpc',
+    'ctr',
+    'reach',
+    'frequency',
+    'actions',
+    'action_values',
+    'date_start',
+    'date_stop'
+]
+
+# Rows per Graph API insights page
+INSIGHTS_PAGE_SIZE = int(os.environ.get('INSIGHTS_PAGE_SIZE', 500))
+
+# Fields requested for single-campaign insights
+CAMPAIGN_INSIGHT_FIELDS = [
+    'campaign_name',
+    'spend',
+    'impressions',
+    'clicks',
+    'cpc',
+    'ctr',
+    'reach',
+    'frequency',
+    'actions',
+    'action_values'
+]
+
+# Meta returns every metric as a string; rows hold them parsed
+INT_METRICS = ('impressions', 'clicks', 'reach')
+FLOAT_METRICS = ('spend', 'cpc', 'ctr', 'frequency')
+
+# Lists of {'action_type', 'value'} flattened into action_<type> / value_<type> keys
+ACTION_LISTS = (('actions', 'action'), ('action_values', 'value'))
+
+
+def parse_number(value, cast):
+    """Parse a Graph API metric string with cast (int/float; None returns value as is).
+    
+    None when empty or invalid. An int metric with a fraction (the odd modelled
+    action count) is kept as a float.
+    """
+    if cast is None or value is None:
+        return value
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if cast is int and number.is_integer() else number
+
+
+_action_keys = {'action': {}, 'value': {}}  # prefix -> {action_type: interned row key}
+_field_plans = {}  # requested fields -> (field names, ((field, cast), ...))
+
+
+def _action_key(prefix, action_type):
+    keys = _action_keys[prefix]
+    key = keys.get(action_type)
+    if key is None:
+        key = keys[action_type] = sys.intern(f"{prefix}_{action_type}")
+    return key
+
+
+def _field_plan(fields):
+    """Names and (field, cast) pairs of the requested non-action fields, computed once per field list"""
+    fields = tuple(fields)
+    plan = _field_plans.get(fields)
+    if plan is None:
+        casts = []
+        for field in fields:
+            if field in INT_METRICS:
+                casts.append((field, int))
+            elif field in FLOAT_METRICS:
+                casts.append((field, float))
+            elif field not in ('actions', 'action_values'):
+                casts.append((field, None))
+        plan = _field_plans[fields] = (tuple(field for field, _ in casts), tuple(casts))
+    return plan
+
+
+def _flatten_actions(insight, data):
+    """Add the actions/action_values lists of an insight to data as action_<type>/value_<type>"""
+    for list_name, prefix in ACTION_LISTS:
+        entries = insight.get(list_name)
+        if not entries:
+            continue
+        keys = _action_keys[prefix]
+        cast = int if prefix == 'action' else float
+        for entry in entries:
+            action_type = entry.get('action_type')
+            key = keys.get(action_type) or _action_key(prefix, action_type)
+            data[key] = parse_number(entry.get('value'), cast)
+    return data
+
+
+def _build_dict(insight, plan):
+    get = insight.get
+    data = {field: parse_number(get(field), cast) for field, cast in plan[1]}
+    return _flatten_actions(insight, data)
+
+
+def flatten_insight(insight, fields=ACCOUNT_INSIGHT_FIELDS):
+    """Flat API row of one insight: requested fields, metrics parsed, action_<type>/value_<type> keys"""
+    return _build_dict(insight, _field_plan(fields))
+
+
+def iter_insights(node, fields=None, params=None):
+    """Yield the raw insight dicts of an SDK node (AdAccount, Campaign...) page by page.
+    
+    Reads the Graph API JSON pages directly instead of going through the SDK
+    cursor, which builds a full AdsInsights object per row.
+    """
+    api = node.get_api_assured()
+    params = dict(params or {})
+    params.setdefault('limit', INSIGHTS_PAGE_SIZE)
+    if fields:
+        params['fields'] = ','.join(fields)
+    response = api.call('GET', (node.get_id(), 'insights'), params=params).json()
+    while True:
+        yield from response.get('data', [])
+        next_page = (response.get('paging') or {}).get('next')
+        if not next_page:
+            return
+        check_deadline()
+        response = api.call('GET', next_page).json()
+
+
+def fetch_insight_dicts(node, fields, params):
+    """Fetch the insights of an SDK node and flatten them into API rows"""
+    return insight_dicts(iter_insights(node, fields, params), fields)
+
+
+def fetch_insight_dicts_batch(api, requests, fields, max_workers=1, timeout=None):
+    """fetch_insight_dicts for several [(object_id, params), ...] through Graph API batch calls.
+    
+    Returns a list aligned with requests of flat rows, or the exception the
+    request failed with (one failure doesn't sink the rest).
+    """
+    batch_requests = []
+    for object_id, params in requests:
+        params = dict(params or {})
+        params.setdefault('limit', INSIGHTS_PAGE_SIZE)
+        params['fields'] = ','.join(fields)
+        batch_requests.append(((object_id, 'insights'), params))
+    
+    results = execute_batch_pages(api, batch_requests, max_workers=max_workers, timeout=timeout)
+    return [result if isinstance(result, Exception) else insight_dicts(result, fields) for result in results]
+
+
+async def fetch_insight_dicts_async(api, object_id, fields, params):
+    """fetch_insight_dicts through an AsyncGraphApi (async_graph): the pages are awaited, not blocking a thread"""
+    params = dict(params or {})
+    params.setdefault('limit', INSIGHTS_PAGE_SIZE)
+    params['fields'] = ','.join(fields)
+    insights = [insight async for insight in api.iter_pages(f"{object_id}/insights", params)]
+    return insight_dicts(insights, fields)
+
+
+@timed('normalize')
+def insight_dicts(insights, fields=ACCOUNT_INSIGHT_FIELDS):
+    """Bulk path: convert insights straight into the flat rows served by the API"""
+    plan = _field_plan(fields)
+    return [_build_dict(insight, plan) for insight in insights]
+
+
+def _metric_cast(key):
+    """parse_number cast of a flat row key (None for text fields)"""
+    if key in INT_METRICS or key.startswith('action_'):
+        return int
+    if key in FLOAT_METRICS or key.startswith('value_'):
+        return float
+    return None
+
+
+def normalize_row(row):
+    """Row with its metrics parsed to numbers.
+    
+    Rows stored before metrics were parsed (daily store, cache and report
+    entries) still hold Meta's strings; returns row itself when nothing needs parsing.
+    """
+    if not isinstance(row, dict):
+        return row
+    stale = [key for key, value in row.items() if isinstance(value, str) and _metric_cast(key)]
+    if not stale:
+        return row
+    row = dict(row)
+    for key in stale:
+        row[key] = parse_number(row[key], _metric_cast(key))
+    return row
+
+
+def normalize_rows(rows):
+    """normalize_row for every row of a stored list (anything else is returned as is)"""
+    if not isinstance(rows, list):
+        return rows
+    return [normalize_row(row) for row in rows]
+
+
+# Metrics that can be summed across rows
+ADDITIVE_METRICS = ['spend', 'impressions', 'clicks']
+
+
+def _to_number(value):
+    """Metric as float (None, empty or invalid count as 0)"""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def derive_ratios(totals):
+    """Add CPC, CTR and CPM computed from summed spend/impressions/clicks"""
+    spend, impressions, clicks = totals['spend'], totals['impressions'], totals['clicks']
+    totals['cpc'] = round(spend / clicks, 4) if clicks else 0
+    totals['ctr'] = round(clicks / impressions * 100, 4) if impressions else 0
+    totals['cpm'] = round(spend / impressions * 1000, 4) if impressions else 0
+    return totals
+
+
+def sum_insight_metrics(rows):
+    """Sum the additive metrics of processed rows and derive the ratios"""
+    totals = {metric: 0.0 for metric in ADDITIVE_METRICS}
+    for row in rows:
+        for metric in ADDITIVE_METRICS:
+            totals[metric] += _to_number(row.get(metric))
+    totals['spend'] = round(totals['spend'], 2)
+    totals['impressions'] = int(totals['impressions'])
+    totals['clicks'] = int(totals['clicks'])
+    return derive_ratios(totals)
+
+
+def daily_insight_metrics(rows):
+    """Group processed daily rows by date_start and sum them, ordered by date"""
+    by_date = {}
+    for row in rows:
+        by_date.setdefault(row.get('date_start'), []).append(row)
+    return [dict(sum_insight_metrics(day_rows), date=day)
+            for day, day_rows in sorted(by_date.items(), key=lambda item: item[0] or '')]
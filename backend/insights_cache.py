@@ -0,0 +1,112 @@
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import os
+
+from date_ranges import ATTRIBUTION_WINDOW_DAYS, MUTABLE_DAYS, resolve_date_window
+from insights import normalize_rows
+from metrics import timed
+from models import db, InsightsCache
+
+# Maximum number of cached insight payloads kept in the database
+CACHE_MAX_ENTRIES = int(os.environ.get('INSIGHTS_CACHE_MAX_ENTRIES', 5000))
+
+TTL_LIVE = timedelta(minutes=5)          # window includes today
+TTL_RECENT = timedelta(minutes=15)       # window ends in the last few days
+TTL_ATTRIBUTION = timedelta(hours=6)     # window ends inside the attribution window
+TTL_CLOSED = timedelta(days=30)          # window is fully closed
+TTL_UNKNOWN = timedelta(minutes=15)      # window could not be resolved (e.g. 'maximum')
+
+
+def make_cache_key(report_type, bm_id, object_id, params):
+    """Build a stable cache key from the Graph API request parameters"""
+    payload = json.dumps({
+        'report_type': report_type,
+        'bm_id': bm_id,
+        'object_id': object_id,
+        'params': params
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_ttl(date_preset=None, start_date=None, end_date=None, today=None):
+    """Pick a TTL based on how likely the date window is to still change"""
+    today = today or date.today()
+    window = resolve_date_window(date_preset, start_date, end_date, today=today)
+    if not window:
+        return TTL_UNKNOWN
+
+    _, until = window
+    age = (today - until).days
+    if age <= 0:
+        return TTL_LIVE
+    if age <= MUTABLE_DAYS:
+        return TTL_RECENT
+    if age <= ATTRIBUTION_WINDOW_DAYS:
+        return TTL_ATTRIBUTION
+    return TTL_CLOSED
+
+
+@timed('cache_lookup')
+def get_cached_insights(cache_key):
+    """Return the cached insights for a key (metrics as numbers), or None if missing or expired"""
+    entry = InsightsCache.query.filter_by(cache_key=cache_key).first()
+    if not entry or entry.expires_at < datetime.utcnow():
+        return None
+    return normalize_rows(entry.insights_data)
+
+
+@timed('db_write')
+def store_cached_insights(cache_key, report_type, bm_id, object_id, params, insights_data, ttl):
+    """Insert or refresh a cache entry and keep the table within its size bound"""
+    try:
+        now = datetime.utcnow()
+        entry = InsightsCache.query.filter_by(cache_key=cache_key).first()
+        if not entry:
+            entry = InsightsCache(cache_key=cache_key)
+            db.session.add(entry)
+
+        entry.report_type = report_type
+        entry.bm_id = bm_id
+        entry.object_id = object_id
+        entry.params = params
+        entry.insights_data = insights_data
+        entry.created_at = now
+        entry.expires_at = now + ttl
+        db.session.commit()
+
+        evict_cached_insights()
+    except Exception as e:
+        print(f"Error caching insights: {str(e)}")
+        db.session.rollback()
+
+
+def evict_cached_insights(max_entries=None):
+    """Drop expired entries, then the oldest ones beyond max_entries"""
+    max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+
+    InsightsCache.query.filter(InsightsCache.expires_at < datetime.utcnow()).delete()
+
+    excess = InsightsCache.query.count() - max_entries
+    if excess > 0:
+        oldest_ids = [row.id for row in InsightsCache.query
+                      .with_entities(InsightsCache.id)
+                      .order_by(InsightsCache.created_at.asc())
+                      .limit(excess)]
+        InsightsCache.query.filter(InsightsCache.id.in_(oldest_ids)).delete(synchronize_session=False)
+
+    db.session.commit()
+
+
+def invalidate_cached_insights(bm_id, object_id=None):
+    """Remove cached entries for a BM (and optionally a single object)"""
+    query = InsightsCache.query.filter_by(bm_id=bm_id)
+    if object_id:
+        query = query.filter_by(object_id=object_id)
+    query.delete()
+    db.session.commit()
+
+
+def wants_refresh(args):
+    """True when the request asks to bypass the cache (?refresh=1)"""
+    return args.get('refresh', '').lower() in ('1', 'true', 'yes')
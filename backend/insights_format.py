@@ -0,0 +1,90 @@
+from insights import INT_METRICS, FLOAT_METRICS, parse_number
+from metrics import timed
+
+# Numeric fields of processed insight rows (strings in rows cached before they were parsed)
+INT_FIELDS = list(INT_METRICS)
+FLOAT_FIELDS = list(FLOAT_METRICS)
+
+# Per-campaign fields stored once in the campaign table
+CAMPAIGN_FIELDS = ['campaign_id', 'campaign_name', 'account_id', 'account_name']
+
+# Everything else in a row is an action_*/value_* column
+ROW_FIELDS = frozenset(INT_FIELDS + FLOAT_FIELDS + CAMPAIGN_FIELDS + ['date_start', 'date_stop'])
+
+
+def _number_column(values, cast):
+    """Convert a column of metrics, with a fast path for well-formed values"""
+    try:
+        return [None if value is None or value == '' else cast(value) for value in values]
+    except (TypeError, ValueError):
+        return [parse_number(value, cast) for value in values]
+
+
+def _as_number(value):
+    return value if isinstance(value, (int, float)) else float(value)
+
+
+def wants_columnar(args):
+    """True when the request asked for format=columnar"""
+    return args.get('format', '').lower() == 'columnar'
+
+
+def wants_ndjson(args):
+    """True when the request asked for format=ndjson (streamed, one row per line)"""
+    return args.get('format', '').lower() == 'ndjson'
+
+
+@timed('serialize')
+def columnar_insights(rows):
+    """Encode processed insight rows as a compact columnar payload.
+    
+    campaigns and dates are dictionary-encoded (rows hold indexes into them),
+    metrics are numeric arrays (null when missing) and action_*/value_* keys
+    become sparse columns of {'rows': [row index...], 'values': [...]}.
+    """
+    campaigns = {field: [] for field in CAMPAIGN_FIELDS}
+    campaign_index = {}
+    date_index = {}
+    campaign_column = []
+    date_start_column = []
+    date_stop_column = []
+    sparse = {}
+    
+    for position, row in enumerate(rows):
+        campaign_id = row.get('campaign_id')
+        index = campaign_index.get(campaign_id)
+        if index is None:
+            index = campaign_index[campaign_id] = len(campaign_index)
+            for field in CAMPAIGN_FIELDS:
+                campaigns[field].append(row.get(field))
+        campaign_column.append(index)
+        date_start_column.append(date_index.setdefault(row.get('date_start'), len(date_index)))
+        date_stop_column.append(date_index.setdefault(row.get('date_stop'), len(date_index)))
+        
+        for field in row:
+            if field not in ROW_FIELDS:
+                column = sparse.get(field)
+                if column is None:
+                    column = sparse[field] = ([], [])
+                column[0].append(position)
+                column[1].append(row[field])
+    
+    columns = {
+        'campaign': campaign_column,
+        'date_start': date_start_column,
+        'date_stop': date_stop_column
+    }
+    for field in INT_FIELDS:
+        columns[field] = _number_column([row.get(field) for row in rows], int)
+    for field in FLOAT_FIELDS:
+        columns[field] = _number_column([row.get(field) for row in rows], float)
+    
+    return {
+        'format': 'columnar',
+        'length': len(rows),
+        'campaigns': campaigns,
+        'dates': list(date_index),
+        'columns': columns,
+        'actions': {field: {'rows': positions, 'values': _number_column(values, _as_number)}
+                    for field, (positions, values) in sorted(sparse.items())}
+    }
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import time
+import uuid
+
+from daily_insights import store_daily_rows
+from insights import ACCOUNT_INSIGHT_FIELDS, flatten_insight, iter_insights
+from models import db, InsightsJob
+
+JOB_POLL_INTERVAL = float(os.environ.get('INSIGHTS_JOB_POLL_INTERVAL', 5))  # seconds
+JOB_TIMEOUT = int(os.environ.get('INSIGHTS_JOB_TIMEOUT', 3600))  # seconds
+JOB_PAGE_SIZE = 500
+
+# Report runs are polled off the request thread, a few at a time per worker
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('INSIGHTS_JOB_WORKERS', 4)),
+                               thread_name_prefix='insights-job')
+
+
+def create_insights_job(bm_id, ad_account_id, params):
+    """Persist a new pending job"""
+    job = InsightsJob(
+        id=str(uuid.uuid4()),
+        bm_id=bm_id,
+        ad_account_id=ad_account_id,
+        params=params,
+        status='pending'
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def start_insights_job(app, job_id, api, window=None):
+    """Run the job in the background.
+
+    window is the resolved (since, until) of a daily report; when given, the
+    rows are also written to the daily insights store.
+    """
+    return _executor.submit(run_insights_job, app, job_id, api, window)
+
+
+def run_insights_job(app, job_id, api, window=None):
+    """Submit an async report run, poll it until it finishes and store the rows"""
+    with app.app_context():
+        job = InsightsJob.query.get(job_id)
+        if not job:
+            return
+
+        try:
+            job.status = 'running'
+            db.session.commit()
+
+            # Submit the async report run
+            from facebook_business.adobjects.adaccount import AdAccount
+            from facebook_business.adobjects.adreportrun import AdReportRun
+            ad_account = AdAccount(job.ad_account_id, api=api)
+            report_run = ad_account.get_insights(fields=ACCOUNT_INSIGHT_FIELDS, params=job.params, is_async=True)
+            job.report_run_id = report_run.get_id()
+            db.session.commit()
+
+            # Poll until Meta finishes building the report
+            deadline = time.monotonic() + JOB_TIMEOUT
+            while True:
+                report_run = report_run.api_get(fields=[
+                    AdReportRun.Field.async_status,
+                    AdReportRun.Field.async_percent_completion
+                ])
+                status = report_run[AdReportRun.Field.async_status]
+                job.progress = int(report_run.get(AdReportRun.Field.async_percent_completion) or 0)
+                db.session.commit()
+
+                if status == 'Job Completed':
+                    break
+                if status in ('Job Failed', 'Job Skipped'):
+                    raise RuntimeError(f"Report run {job.report_run_id} finished with status '{status}'")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Report run {job.report_run_id} did not finish in {JOB_TIMEOUT}s")
+                time.sleep(JOB_POLL_INTERVAL)
+
+            # Download the result page by page
+            rows = []
+            for insight in iter_insights(report_run, params={'limit': JOB_PAGE_SIZE}):
+                rows.append(flatten_insight(insight))
+                if len(rows) % JOB_PAGE_SIZE == 0:
+                    job.row_count = len(rows)
+                    db.session.commit()
+            job.row_count = len(rows)
+
+            if window:
+                store_daily_rows(job.ad_account_id, window[0], window[1], rows)
+
+            job.result = rows
+            job.progress = 100
+            job.status = 'completed'
+            db.session.commit()
+            print(f"Insights job {job.id} completed with {len(rows)} rows")
+        except Exception as e:
+            print(f"Erro no insights job {job_id}: {str(e)}")
+            db.session.rollback()
+            job = InsightsJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            db.session.commit()
+
+
+def expire_stale_jobs():
+    """Mark jobs that stopped updating (e.g. the worker restarted) as failed"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_TIMEOUT + JOB_POLL_INTERVAL * 2)
+    InsightsJob.query.filter(
+        InsightsJob.status.in_(['pending', 'running']),
+        InsightsJob.updated_at < cutoff
+    ).update({'status': 'failed', 'error': 'Job timed out'}, synchronize_session=False)
+    db.session.commit()
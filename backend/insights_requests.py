@@ -0,0 +1,89 @@
+"""What the insights routes do around their Graph API calls, shared by app.py and async_app.py.
+
+Both serving modes build the params and cache keys and save the results
+here; they only differ in how they fetch (SDK calls on threads, or awaited
+async_graph calls) and run the database work.
+"""
+import json
+
+from date_ranges import custom_preset_label
+from insights_cache import make_cache_key, cache_ttl, get_cached_insights, store_cached_insights
+from reports import save_report
+
+
+def apply_date_params(params, date_preset, start_date, end_date):
+    """Add date_preset or time_range to Graph API insights params (the request log line has the raw args)"""
+    if date_preset and date_preset != 'custom':
+        # Use the pre-defined date preset
+        params['date_preset'] = date_preset
+    elif start_date and end_date:
+        # Use custom date range
+        params['time_range'] = json.dumps({
+            'since': start_date,
+            'until': end_date
+        })
+    else:
+        # Default to last 7 days if no valid date parameters
+        params['date_preset'] = 'last_7d'
+
+    return params
+
+
+def account_insights_params(date_preset, start_date, end_date):
+    """Params of an ad account's insights: campaign-level rows, one per day (the names come in the rows)"""
+    params = {
+        'level': 'campaign',
+        'time_increment': 1  # Solicitando breakdown por dia (diário)
+    }
+    return apply_date_params(params, date_preset, start_date, end_date)
+
+
+def account_cache_key(bm_id, ad_account_id, params):
+    return make_cache_key('ad_account', bm_id, ad_account_id, params)
+
+
+def campaign_insights_params(date_preset):
+    return {
+        'date_preset': date_preset,
+        'level': 'campaign'
+    }
+
+
+def campaign_cache_key(bm_id, campaign_id, params):
+    return make_cache_key('campaign', bm_id, campaign_id, params)
+
+
+def daily_range_params(since, until):
+    """Insights params of the campaign-level daily rows stored for [since, until]"""
+    return {
+        'level': 'campaign',
+        'time_increment': 1,
+        'time_range': {'since': since.isoformat(), 'until': until.isoformat()}
+    }
+
+
+def lookup_cached_insights(cache_key, refresh=False):
+    """Cached rows for a key, or None when missing, expired or the request asked for a refresh"""
+    if refresh:
+        return None
+    return get_cached_insights(cache_key)
+
+
+def save_account_insights(cache_key, bm_id, ad_account_id, params, start_date, end_date, rows, today=None, ttl=None):
+    """Save fetched account rows as a report and cache them.
+
+    today is the account's date (for the TTL); ttl overrides it (prewarm keeps
+    its entries until the morning peak).
+    """
+    report_name = f"Account Insights: {rows[0].get('account_name', ad_account_id) if rows else ad_account_id}"
+    report_date_preset = params.get('date_preset') or custom_preset_label(start_date, end_date)
+    save_report(report_name, 'ad_account', bm_id, ad_account_id, report_date_preset, rows)
+    store_cached_insights(cache_key, 'ad_account', bm_id, ad_account_id, params, rows,
+                          ttl or cache_ttl(params.get('date_preset'), start_date, end_date, today=today))
+
+
+def save_campaign_insights(cache_key, bm_id, campaign_id, params, rows):
+    """Save fetched campaign rows as a report and cache them"""
+    report_name = f"Campaign Insights: {rows[0].get('campaign_name', campaign_id) if rows else campaign_id}"
+    save_report(report_name, 'campaign', bm_id, campaign_id, params['date_preset'], rows)
+    store_cached_insights(cache_key, 'campaign', bm_id, campaign_id, params, rows, cache_ttl(params['date_preset']))
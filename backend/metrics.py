@@ -0,0 +1,265 @@
+from contextlib import contextmanager
+import contextvars
+import cProfile
+from functools import wraps
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+METRICS_LOG = os.environ.get('METRICS_LOG', '1').lower() in ('1', 'true', 'yes')  # one JSON line per request
+METRICS_LOG_MIN_MS = float(os.environ.get('METRICS_LOG_MIN_MS', 0))  # only log requests at least this slow
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')  # allow ?profile=1
+PROFILE_TOP = 40  # functions listed in a profile
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Registry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, value=1.0):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(DURATION_BUCKETS) + [0.0, 0]
+            for position, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[position] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self, gauges=()):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), histogram in histograms:
+            header(name)
+            for bound, count in zip(DURATION_BUCKETS, histogram):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(histogram[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram[-1]}")
+        for name, labels, value in gauges:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+registry = _Registry()
+registry.describe('http_requests_total', 'counter', 'HTTP requests by route, method and status')
+registry.describe('http_request_duration_seconds', 'histogram', 'HTTP request duration by route')
+registry.describe('http_request_phase_seconds_total', 'counter', 'Time spent per route in each phase (self time)')
+registry.describe('http_request_phase_calls_total', 'counter', 'Phase executions per route')
+registry.describe('graph_api_calls_total', 'counter', 'Graph API calls by method and HTTP status')
+registry.describe('graph_api_response_bytes_total', 'counter', 'Graph API response body bytes')
+registry.describe('graph_api_call_duration_seconds', 'histogram', 'Graph API call duration')
+registry.describe('graph_api_usage_pct', 'gauge', 'Latest Meta usage reported per scope (%)')
+
+
+class RequestMetrics:
+    """Phase timings and Graph API totals of one request (shared with its fan_out threads)"""
+
+    __slots__ = ('route', 'started', 'phases', 'graph_calls', 'graph_bytes', 'lock')
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.graph_calls = 0
+        self.graph_bytes = 0
+        self.lock = threading.Lock()
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_local = threading.local()
+
+
+def _phase_stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def phase(name):
+    """Time a block as phase name; nested phases are subtracted, so each phase counts its self time"""
+    stack = _phase_stack()
+    entry = [time.perf_counter(), 0.0]
+    stack.append(entry)
+    try:
+        yield
+    finally:
+        stack.pop()
+        total = time.perf_counter() - entry[0]
+        if stack:
+            stack[-1][1] += total
+        record_phase(name, total - entry[1])
+
+
+def timed(name):
+    """Decorator: run the function as phase name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_phase(name, seconds):
+    """Add seconds to phase name of the current request (asyncio code, where a
+    phase() block spanning an await would interleave with other tasks, calls this directly)
+    """
+    current = _current.get()
+    route = current.route if current else 'background'
+    if current:
+        with current.lock:
+            current.phases[name] = current.phases.get(name, 0.0) + seconds
+    registry.inc('http_request_phase_seconds_total', (('route', route), ('phase', name)), seconds)
+    registry.inc('http_request_phase_calls_total', (('route', route), ('phase', name)))
+
+
+def record_graph_call(method, status, size, seconds):
+    """Count one Graph API call (also attributed to the current request)"""
+    current = _current.get()
+    if current:
+        with current.lock:
+            current.graph_calls += 1
+            current.graph_bytes += size
+    registry.inc('graph_api_calls_total', (('method', method), ('status', str(status))))
+    registry.inc('graph_api_response_bytes_total', (), size)
+    registry.observe('graph_api_call_duration_seconds', (), seconds)
+
+
+def render_metrics():
+    """Prometheus exposition of this process' metrics"""
+    from rate_limits import tracker
+
+    gauges = [('graph_api_usage_pct', (('scope', scope),), usage['usage_pct'])
+              for scope, usage in sorted(tracker.snapshot().items()) if not usage['stale']]
+    return registry.render(gauges)
+
+
+def start_request(route):
+    """Start timing a request; returns (RequestMetrics, token for finish_request)"""
+    current = RequestMetrics(route)
+    return current, _current.set(current)
+
+
+def finish_request(current, token, method, status, args):
+    """Record a finished request and log it; returns its Server-Timing header value"""
+    _current.reset(token)
+    elapsed = time.perf_counter() - current.started
+
+    labels = (('route', current.route), ('method', method))
+    registry.inc('http_requests_total', labels + (('status', str(status)),))
+    registry.observe('http_request_duration_seconds', labels, elapsed)
+
+    if METRICS_LOG and elapsed * 1000 >= METRICS_LOG_MIN_MS:
+        print(json.dumps({
+            'event': 'request',
+            'method': method,
+            'route': current.route,
+            'status': status,
+            'ms': round(elapsed * 1000, 1),
+            'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in current.phases.items()},
+            'graph_calls': current.graph_calls,
+            'graph_bytes': current.graph_bytes,
+            'args': args
+        }), flush=True)
+
+    return ', '.join([f"{name};dur={seconds * 1000:.1f}" for name, seconds in current.phases.items()]
+                     + [f"total;dur={elapsed * 1000:.1f}"])
+
+
+def init_metrics(app):
+    """Time every request by phase, log it as a JSON line and serve /metrics.
+
+    Register before init_compression so the timing covers compression too.
+    """
+    from flask import Response, g, request
+    from flask.json.provider import DefaultJSONProvider
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            with phase('serialize'):
+                return super().dumps(obj, **kwargs)
+
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_metrics():
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.request_metrics, g.request_metrics_token = start_request(route)
+        if PROFILING_ENABLED and request.args.get('profile') == '1':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        current = g.pop('request_metrics', None)
+        if current is None:
+            return response
+        response.headers['Server-Timing'] = finish_request(current, g.pop('request_metrics_token'), request.method,
+                                                           response.status_code, request.args.to_dict())
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            return Response(output.getvalue(), mimetype='text/plain')
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics of this worker process"""
+        return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
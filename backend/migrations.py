@@ -0,0 +1,37 @@
+from sqlalchemy import inspect, text
+
+from models import db
+
+# Columns added after the first release; db.create_all() only creates missing tables
+# (and skips indexes of tables that already exist)
+ADDED_COLUMNS = [
+    ('reports', 'content_hash', 'VARCHAR(64)'),
+    ('reports', 'updated_at', 'TIMESTAMP'),
+    ('shared_links', 'snapshot', 'JSON'),
+    ('shared_links', 'snapshot_hash', 'VARCHAR(64)'),
+    ('shared_links', 'snapshot_at', 'TIMESTAMP'),
+    ('pdf_reports', 'updated_at', 'TIMESTAMP'),
+]
+
+
+def run_migrations():
+    """Bring an existing database up to date with models.py (idempotent)"""
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+
+    for table, column, ddl in ADDED_COLUMNS:
+        if table not in tables:
+            continue
+        existing = {col['name'] for col in inspector.get_columns(table)}
+        if column not in existing:
+            print(f"Migrating: adding {table}.{column}")
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+    db.session.commit()
+
+    # Indexes declared in models.py on tables that already existed
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -31,12 +31,23 @@ class Report(db.Model):
     object_id = db.Column(db.String(100), nullable=False)  # campaign_id or ad_account_id
     date_preset = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True)
     insights_data = db.Column(db.JSON, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of insights_data
+    
+    __table_args__ = (
+        # Keyset pagination of /api/reports (optionally filtered by BM)
+        db.Index('ix_reports_created_at_id', created_at.desc(), id.desc()),
+        db.Index('ix_reports_bm_created_at_id', bm_id, created_at.desc(), id.desc()),
+        # Latest report for a set of parameters (create_share_link, save_report)
+        db.Index('ix_reports_lookup', bm_id, object_id, report_type, date_preset, created_at.desc()),
+    )
     
     def __repr__(self):
         return f'<Report {self.report_name}>'
     
-    def to_dict(self):
+    def to_summary_dict(self):
+        """Report metadata without the insights_data payload"""
         return {
             'id': self.id,
             'report_name': self.report_name,
@@ -45,8 +56,14 @@ class Report(db.Model):
             'object_id': self.object_id,
             'date_preset': self.date_preset,
             'created_at': self.created_at.isoformat(),
-            'insights_data': self.insights_data
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+    
+    def to_dict(self):
+        from insights import normalize_rows  # reports saved before metrics were parsed hold strings
+        data = self.to_summary_dict()
+        data['insights_data'] = normalize_rows(self.insights_data)
+        return data
 
 class SharedLink(db.Model):
     __tablename__ = 'shared_links'
@@ -58,8 +75,12 @@ class SharedLink(db.Model):
     ad_account_id = db.Column(db.String(100), nullable=True)
     campaign_id = db.Column(db.String(100), nullable=True)
     date_preset = db.Column(db.String(50), nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Immutable copy of the insights served to viewers (reports are updated in place)
+    snapshot = db.Column(db.JSON, nullable=True)
+    snapshot_hash = db.Column(db.String(64), nullable=True)  # sha256 of snapshot, used as ETag
+    snapshot_at = db.Column(db.DateTime, nullable=True)
     
     # Relationship
     report = db.relationship('Report', backref=db.backref('shared_links', lazy=True))
@@ -78,3 +99,201 @@ class SharedLink(db.Model):
             'expires_at': self.expires_at.isoformat(),
             'created_at': self.created_at.isoformat()
         }
+
+class InsightsCache(db.Model):
+    __tablename__ = 'insights_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the request parameters
+    report_type = db.Column(db.String(50), nullable=False)  # 'campaign', 'ad_account'
+    bm_id = db.Column(db.String(100), nullable=False)
+    object_id = db.Column(db.String(100), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    insights_data = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<InsightsCache {self.report_type} {self.object_id}>'
+
+class DailyInsight(db.Model):
+    """Campaign-level insights of one ad account and day.
+
+    Keyed by ad account, not BM: Meta returns the same numbers for an account
+    whichever BM token reads them, and the API does not restrict accounts per
+    BM (any caller picks the bm_id), so a per-BM copy would only duplicate rows.
+    """
+    __tablename__ = 'daily_insights'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ad_account_id = db.Column(db.String(100), nullable=False)
+    campaign_id = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    insight_data = db.Column(db.JSON, nullable=False)  # processed row as returned by /api/account-insights
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('ad_account_id', 'date', 'campaign_id', name='uq_daily_insights_account_date_campaign'),
+    )
+    
+    def __repr__(self):
+        return f'<DailyInsight {self.ad_account_id} {self.campaign_id} {self.date}>'
+
+class DailyInsightDay(db.Model):
+    """Marks a day as fetched for an account, even when Meta returned no rows for it"""
+    __tablename__ = 'daily_insight_days'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ad_account_id = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('ad_account_id', 'date', name='uq_daily_insight_days_account_date'),
+    )
+    
+    def __repr__(self):
+        return f'<DailyInsightDay {self.ad_account_id} {self.date}>'
+
+class InsightsJob(db.Model):
+    __tablename__ = 'insights_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    bm_id = db.Column(db.String(100), nullable=False)
+    ad_account_id = db.Column(db.String(100), nullable=False)
+    params = db.Column(db.JSON, nullable=False)  # Graph API insights params
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    report_run_id = db.Column(db.String(100), nullable=True)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<InsightsJob {self.id} {self.status}>'
+    
+    def to_dict(self, include_result=False):
+        data = {
+            'id': self.id,
+            'bm_id': self.bm_id,
+            'ad_account_id': self.ad_account_id,
+            'params': self.params,
+            'status': self.status,
+            'progress': self.progress,
+            'report_run_id': self.report_run_id,
+            'row_count': self.row_count,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+class PdfReport(db.Model):
+    """A PDF render job and, once completed, its output (kept until expires_at)"""
+    __tablename__ = 'pdf_reports'
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    bm_id = db.Column(db.String(100), nullable=False)
+    object_type = db.Column(db.String(50), nullable=False)  # 'campaign', 'ad_account', 'bulk_zip' or 'bulk_merged'
+    object_id = db.Column(db.String(100), nullable=False)  # bulk reports: hash of the requested objects
+    date_range = db.Column(db.String(50), nullable=False)  # date preset or custom:YYYY-MM-DD:YYYY-MM-DD
+    data_hash = db.Column(db.String(64), nullable=True)  # hash of the insights rendered
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    title = db.Column(db.String(255), nullable=True)
+    content = db.deferred(db.Column(db.LargeBinary, nullable=True))  # rendered PDF
+    size = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # heartbeat
+    completed_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_pdf_reports_lookup', 'object_type', 'object_id', 'date_range', 'data_hash'),
+    )
+    
+    def __repr__(self):
+        return f'<PdfReport {self.id} {self.status}>'
+    
+    @property
+    def mimetype(self):
+        return 'application/zip' if self.object_type == 'bulk_zip' else 'application/pdf'
+    
+    @property
+    def filename(self):
+        extension = 'zip' if self.object_type == 'bulk_zip' else 'pdf'
+        return f"{(self.title or 'report').replace(' ', '_')}.{extension}"
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'bm_id': self.bm_id,
+            'object_type': self.object_type,
+            'object_id': self.object_id,
+            'date_range': self.date_range,
+            'status': self.status,
+            'title': self.title,
+            'size': self.size,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'expires_at': self.expires_at.isoformat(),
+            'download_url': f"/api/pdf-jobs/{self.id}/download" if self.status == 'completed' else None
+        }
+
+class AdObject(db.Model):
+    """Cached metadata of a campaign, ad set or ad (kept in sync by updated_time)"""
+    __tablename__ = 'ad_objects'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ad_account_id = db.Column(db.String(100), nullable=False)
+    object_type = db.Column(db.String(20), nullable=False)  # 'campaign', 'adset', 'ad'
+    object_id = db.Column(db.String(100), nullable=False)
+    campaign_id = db.Column(db.String(100), nullable=True)  # ad sets and ads
+    adset_id = db.Column(db.String(100), nullable=True)  # ads
+    name = db.Column(db.String(512), nullable=True)
+    status = db.Column(db.String(50), nullable=True)
+    data = db.Column(db.JSON, nullable=False)  # every field returned by the Graph API
+    updated_time = db.Column(db.DateTime, nullable=True)  # Meta's updated_time (UTC)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('object_type', 'object_id', name='uq_ad_objects_type_id'),
+        db.Index('ix_ad_objects_account_type', 'ad_account_id', 'object_type'),
+    )
+    
+    def __repr__(self):
+        return f'<AdObject {self.object_type} {self.object_id}>'
+
+class AdObjectSync(db.Model):
+    """Sync state of one object type of an ad account"""
+    __tablename__ = 'ad_object_syncs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ad_account_id = db.Column(db.String(100), nullable=False)
+    object_type = db.Column(db.String(20), nullable=False)
+    last_updated_time = db.Column(db.DateTime, nullable=True)  # newest updated_time seen
+    synced_at = db.Column(db.DateTime, nullable=True)  # last delta or full sync
+    full_synced_at = db.Column(db.DateTime, nullable=True)  # last full listing
+    
+    __table_args__ = (
+        db.UniqueConstraint('ad_account_id', 'object_type', name='uq_ad_object_syncs_account_type'),
+    )
+    
+    def __repr__(self):
+        return f'<AdObjectSync {self.ad_account_id} {self.object_type}>'
+
+class ScheduledRun(db.Model):
+    """Last day a scheduled task ran, claimed by one worker (see prewarm.claim_run)"""
+    __tablename__ = 'scheduled_runs'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    run_on = db.Column(db.Date, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<ScheduledRun {self.name} {self.run_on}>'
@@ -0,0 +1,377 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from io import BytesIO
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import zipfile
+
+from insights import sum_insight_metrics, daily_insight_metrics
+from models import db, PdfReport
+from reports import hash_insights
+
+logger = logging.getLogger(__name__)
+
+PDF_TTL = int(os.environ.get('PDF_TTL', 24 * 3600))  # seconds a rendered PDF is kept
+PDF_SYNC_WAIT = float(os.environ.get('PDF_SYNC_WAIT', 30))  # seconds /api/generate-pdf waits for its job
+PDF_JOB_TIMEOUT = int(os.environ.get('PDF_JOB_TIMEOUT', 600))  # seconds without heartbeat before a job is failed
+PDF_HEARTBEAT_INTERVAL = float(os.environ.get('PDF_HEARTBEAT_INTERVAL', 30))  # seconds
+
+PDF_PROCESSES = int(os.environ.get('PDF_PROCESSES', 0)) or os.cpu_count()  # bulk rendering processes
+PDF_BULK_MAX_ITEMS = int(os.environ.get('PDF_BULK_MAX_ITEMS', 100))
+
+# Rendering runs off the request threads, a few PDFs at a time
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('PDF_WORKERS', 2)),
+                               thread_name_prefix='pdf-render')
+
+# Jobs queued or running in this process, kept alive by the heartbeat thread
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+_heartbeat = None
+
+# Bulk reports render their sections on every core (ReportLab is pure Python)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Columns of the daily and per-campaign tables
+SECTION_COLUMNS = [('spend', 'Spend'), ('impressions', 'Impressions'), ('clicks', 'Clicks'),
+                   ('ctr', 'CTR (%)'), ('cpc', 'CPC'), ('cpm', 'CPM')]
+
+
+# ReportLab is imported by the render functions only, keeping it out of worker startup
+@lru_cache(maxsize=None)
+def _table_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+    ])
+
+
+def get_process_pool():
+    """Shared process pool, started on first use (spawned: the app runs threads)"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=PDF_PROCESSES,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _process_pool
+
+
+def render_pdf(title, date_label, insights_data):
+    """Render the Metric/Value report in memory and return the PDF bytes"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+
+    # Create content
+    content = []
+    content.append(Paragraph(title, styles['Title']))
+    content.append(Paragraph(f"Date Range: {date_label}", styles['Heading2']))
+
+    # Create table with insights data
+    table_data = []
+    table_data.append(['Metric', 'Value'])
+    for key, value in insights_data.items():
+        if key not in ['account_name', 'campaign_name']:
+            table_data.append([key, str(value)])
+
+    table = Table(table_data, colWidths=[300, 200])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    content.append(table)
+    doc.build(content)
+    return buffer.getvalue()
+
+
+def report_section(title, date_range, rows, error=None):
+    """Plain (picklable) data of one report section: totals, daily series and per-campaign breakdown"""
+    by_campaign = {}
+    for row in rows:
+        by_campaign.setdefault(row.get('campaign_name') or row.get('campaign_id') or '-', []).append(row)
+    campaigns = [dict(sum_insight_metrics(campaign_rows), campaign=name)
+                 for name, campaign_rows in by_campaign.items()]
+    campaigns.sort(key=lambda campaign: campaign['spend'], reverse=True)
+    
+    return {
+        'title': title,
+        'date_range': date_range,
+        'error': error,
+        'totals': sum_insight_metrics(rows),
+        'daily': daily_insight_metrics(rows),
+        'campaigns': campaigns
+    }
+
+
+def _format_metric(key, value):
+    if key in ('impressions', 'clicks'):
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+
+def _metric_table(label, label_key, entries):
+    from reportlab.platypus import Table
+
+    data = [[label] + [title for _, title in SECTION_COLUMNS]]
+    for entry in entries:
+        data.append([str(entry[label_key])[:45]] + [_format_metric(key, entry[key]) for key, _ in SECTION_COLUMNS])
+    return Table(data, repeatRows=1, style=_table_style())
+
+
+def _section_flowables(section, styles):
+    from reportlab.platypus import Table, Paragraph, Spacer
+
+    content = [Paragraph(section['title'], styles['Title']),
+               Paragraph(f"Date Range: {section['date_range']}", styles['Heading2'])]
+    if section['error']:
+        content.append(Paragraph(f"Could not load insights: {section['error']}", styles['Normal']))
+        return content
+    
+    totals = section['totals']
+    content.append(Table([['Metric', 'Value']] + [[title, _format_metric(key, totals[key])]
+                                                  for key, title in SECTION_COLUMNS],
+                         colWidths=[200, 150], style=_table_style()))
+    content.append(Spacer(1, 12))
+    content.append(Paragraph('Daily', styles['Heading3']))
+    content.append(_metric_table('Date', 'date', section['daily']))
+    content.append(Spacer(1, 12))
+    content.append(Paragraph('Campaigns', styles['Heading3']))
+    content.append(_metric_table('Campaign', 'campaign', section['campaigns']))
+    return content
+
+
+def render_sections(sections):
+    """Render report sections into one multi-page PDF (runs in a pool process)"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    
+    content = []
+    for position, section in enumerate(sections):
+        if position:
+            content.append(PageBreak())
+        content.extend(_section_flowables(section, styles))
+    doc.build(content)
+    return buffer.getvalue()
+
+
+def section_filename(section, position):
+    name = ''.join(char if char.isalnum() or char in '-_' else '_' for char in section['title'])
+    return f"{position + 1:03d}_{name[:80]}.pdf"
+
+
+def render_bulk(sections, output):
+    """Render sections as a zip of one PDF each, or as one merged PDF, on the process pool"""
+    pool = get_process_pool()
+    if output == 'merged':
+        return pool.submit(render_sections, sections).result()
+    
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        documents = pool.map(render_sections, [[section] for section in sections])
+        for position, (section, document) in enumerate(zip(sections, documents)):
+            archive.writestr(section_filename(section, position), document)
+    return buffer.getvalue()
+
+
+def find_cached_pdf(object_type, object_id, date_range, data_hash):
+    """Latest unexpired completed PDF of the same object, range and data, or None"""
+    return PdfReport.query.filter(
+        PdfReport.object_type == object_type,
+        PdfReport.object_id == object_id,
+        PdfReport.date_range == date_range,
+        PdfReport.data_hash == data_hash,
+        PdfReport.status == 'completed',
+        PdfReport.expires_at > datetime.utcnow()
+    ).order_by(PdfReport.completed_at.desc()).first()
+
+
+def create_pdf_job(bm_id, object_type, object_id, date_range):
+    """Persist a new pending PDF job"""
+    report = PdfReport(
+        id=str(uuid.uuid4()),
+        bm_id=bm_id,
+        object_type=object_type,
+        object_id=object_id,
+        date_range=date_range,
+        status='pending',
+        expires_at=datetime.utcnow() + timedelta(seconds=PDF_TTL)
+    )
+    db.session.add(report)
+    db.session.commit()
+    return report
+
+
+def _track_job(app, report_id):
+    """Keep a queued job alive, starting this process's heartbeat thread on first use"""
+    global _heartbeat
+    with _active_jobs_lock:
+        _active_jobs.add(report_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, args=(app,), name='pdf-heartbeat', daemon=True)
+            _heartbeat.start()
+
+
+def _untrack_job(report_id):
+    with _active_jobs_lock:
+        _active_jobs.discard(report_id)
+
+
+def _beat(app):
+    """Touch updated_at of this process's queued/running jobs, so expire_pdf_reports leaves them alone"""
+    while True:
+        time.sleep(PDF_HEARTBEAT_INTERVAL)
+        with _active_jobs_lock:
+            report_ids = list(_active_jobs)
+        if not report_ids:
+            continue
+        try:
+            with app.app_context():
+                PdfReport.query.filter(
+                    PdfReport.id.in_(report_ids),
+                    PdfReport.status.in_(['pending', 'running'])
+                ).update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+        except Exception:
+            logger.exception("Erro no heartbeat dos PDF jobs")
+
+
+def _claim_job(report_id):
+    """Move a pending job to running; None when it is gone or no longer pending (e.g. timed out)"""
+    claimed = PdfReport.query.filter(
+        PdfReport.id == report_id,
+        PdfReport.status == 'pending'
+    ).update({'status': 'running'}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        logger.info(f"PDF job {report_id} skipped: no longer pending")
+        return None
+    return PdfReport.query.get(report_id)
+
+
+def _finish_job(report_id, **values):
+    """Store the outcome of a running job; a job failed meanwhile (timed out) stays failed"""
+    finished = PdfReport.query.filter(
+        PdfReport.id == report_id,
+        PdfReport.status == 'running'
+    ).update(values, synchronize_session=False)
+    db.session.commit()
+    return bool(finished)
+
+
+def start_pdf_job(app, report_id, fetch_rows):
+    """Render the PDF in the background.
+
+    fetch_rows() runs in the worker (inside an app context) and returns
+    (title, rows) for the report.
+    """
+    _track_job(app, report_id)
+    return _executor.submit(run_pdf_job, app, report_id, fetch_rows)
+
+
+def run_pdf_job(app, report_id, fetch_rows):
+    """Fetch the insights, reuse a cached PDF of identical data or render a new one"""
+    with app.app_context():
+        try:
+            report = _claim_job(report_id)
+            if not report:
+                return
+
+            title, rows = fetch_rows()
+            data_hash = hash_insights(rows)
+
+            cached = find_cached_pdf(report.object_type, report.object_id, report.date_range, data_hash)
+            if cached:
+                content = cached.content
+            else:
+                # Single-row reports: later rows overwrite earlier keys, as before
+                insights_data = {}
+                for row in rows:
+                    insights_data.update(row)
+                content = render_pdf(title, report.date_range, insights_data)
+
+            if _finish_job(report_id, title=title, data_hash=data_hash, content=content, size=len(content),
+                           status='completed', completed_at=datetime.utcnow()):
+                logger.info(f"PDF {report_id} completed ({len(content)} bytes{', cached' if cached else ''})")
+        except Exception as e:
+            logger.exception(f"Erro no PDF job {report_id}")
+            db.session.rollback()
+            _finish_job(report_id, status='failed', error=str(e))
+        finally:
+            _untrack_job(report_id)
+
+
+def start_bulk_pdf_job(app, report_id, load_sections, output):
+    """Build a bulk report in the background.
+    
+    load_sections() runs in the worker (inside an app context) and returns
+    (title, sections); output is 'zip' or 'merged'.
+    """
+    _track_job(app, report_id)
+    return _executor.submit(run_bulk_pdf_job, app, report_id, load_sections, output)
+
+
+def run_bulk_pdf_job(app, report_id, load_sections, output):
+    """Fetch every section, reuse a cached bundle of identical data or render a new one"""
+    with app.app_context():
+        try:
+            report = _claim_job(report_id)
+            if not report:
+                return
+            
+            title, sections = load_sections()
+            data_hash = hash_insights(sections)
+            
+            cached = find_cached_pdf(report.object_type, report.object_id, report.date_range, data_hash)
+            content = cached.content if cached else render_bulk(sections, output)
+            
+            if _finish_job(report_id, title=title, data_hash=data_hash, content=content, size=len(content),
+                           status='completed', completed_at=datetime.utcnow()):
+                logger.info(f"Bulk PDF {report_id} completed: {len(sections)} sections, {len(content)} bytes"
+                            f"{', cached' if cached else ''}")
+        except Exception as e:
+            logger.exception(f"Erro no bulk PDF job {report_id}")
+            db.session.rollback()
+            _finish_job(report_id, status='failed', error=str(e))
+        finally:
+            _untrack_job(report_id)
+
+
+def expire_pdf_reports():
+    """Delete expired PDFs and fail jobs whose heartbeat stopped (e.g. the worker restarted)"""
+    now = datetime.utcnow()
+    deleted = PdfReport.query.filter(PdfReport.expires_at < now).delete(synchronize_session=False)
+    PdfReport.query.filter(
+        PdfReport.status.in_(['pending', 'running']),
+        db.func.coalesce(PdfReport.updated_at, PdfReport.created_at) < now - timedelta(seconds=PDF_JOB_TIMEOUT)
+    ).update({'status': 'failed', 'error': 'Job timed out'}, synchronize_session=False)
+    db.session.commit()
+    return deleted
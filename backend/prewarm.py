@@ -0,0 +1,170 @@
+from datetime import date, datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from concurrency import fan_out
+from date_ranges import resolve_date_window
+from graph_client import get_api
+from insights_cache import cache_ttl
+from models import db, BusinessManager, ScheduledRun
+from rate_limits import tracker
+
+logger = logging.getLogger(__name__)
+
+# 'today' is left out by default: a live window keeps its few-minute TTL, so warming it early is wasted
+PREWARM_PRESETS = [preset.strip() for preset in
+                   os.environ.get('PREWARM_PRESETS', 'yesterday,last_7d,last_30d').split(',') if preset.strip()]
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', 3))
+PREWARM_TIMEOUT = float(os.environ.get('PREWARM_TIMEOUT', 1800))  # seconds for a whole BM
+# Stop warming a BM once Meta reports this much of its quota used, leaving the rest for users
+PREWARM_MAX_USAGE_PCT = float(os.environ.get('PREWARM_MAX_USAGE_PCT', 50))
+PREWARM_HOUR = os.environ.get('PREWARM_HOUR')  # local hour (0-23) of the daily background run; unset = off
+# Seconds prewarmed entries stay cached (at least; never past midnight), so they last until the morning peak
+PREWARM_TTL = int(os.environ.get('PREWARM_TTL', 4 * 3600))
+
+
+def prewarm_ttl(date_preset, now=None):
+    """Cache TTL of a prewarmed preset: its usual TTL extended to PREWARM_TTL.
+    
+    The extension stops at midnight, when the preset's dates move. Windows
+    that include today keep their live TTL.
+    """
+    now = now or datetime.now()
+    ttl = cache_ttl(date_preset, today=now.date())
+    window = resolve_date_window(date_preset, today=now.date())
+    if not window or window[1] >= now.date():
+        return ttl
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(ttl, min(timedelta(seconds=PREWARM_TTL), midnight - now))
+
+
+def claim_run(name, run_on=None):
+    """Claim the run_on (default today) run of a scheduled task: True for exactly one caller.
+    
+    Works on any database through a row of scheduled_runs (insert, or a
+    conditional update of an earlier day), unlike advisory_lock, which is a
+    no-op off Postgres.
+    """
+    run_on = run_on or date.today()
+    now = datetime.utcnow()
+    try:
+        db.session.add(ScheduledRun(name=name, run_on=run_on, started_at=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+    
+    claimed = ScheduledRun.query.filter(
+        ScheduledRun.name == name,
+        ScheduledRun.run_on < run_on
+    ).update({'run_on': run_on, 'started_at': now}, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def list_ad_accounts(bm):
+    """Ad accounts owned by a BM, as /api/ad-accounts lists them"""
+    from facebook_business.adobjects.business import Business
+    business = Business(bm.bm_id, api=get_api(bm))
+    return [{'id': account['id'], 'name': account['name']}
+            for account in business.get_owned_ad_accounts(fields=['id', 'name', 'account_status'])]
+
+
+def prewarm_bm(app, bm, load_rows, presets=None, concurrency=None):
+    """Fetch every preset of every ad account of one BM into the cache and daily store.
+
+    load_rows(bm, ad_account_id, date_preset, ttl) does the cached fetch (the same
+    path the dashboard uses), caching for ttl (prewarm_ttl). Returns counts of
+    warmed, skipped and failed fetches.
+    """
+    presets = presets or PREWARM_PRESETS
+    concurrency = concurrency or PREWARM_CONCURRENCY
+    bm_scopes = ['app', f"bm:{bm.bm_id}"]
+    stats = {'warmed': 0, 'skipped': 0, 'failed': 0}
+
+    if tracker.usage_pct(bm_scopes) >= PREWARM_MAX_USAGE_PCT:
+        logger.info(f"Prewarm: skipping BM {bm.bm_id}, rate limit budget used")
+        return stats
+
+    accounts = list_ad_accounts(bm)
+    tasks = [(account['id'], preset) for account in accounts for preset in presets]
+
+    def warm(task):
+        ad_account_id, preset = task
+        if tracker.usage_pct(bm_scopes + [f"ad_account:{ad_account_id}"]) >= PREWARM_MAX_USAGE_PCT:
+            return False
+        with app.app_context():
+            load_rows(bm, ad_account_id, preset, prewarm_ttl(preset))
+        return True
+
+    for (ad_account_id, preset), (warmed, error) in zip(tasks, fan_out(warm, tasks, concurrency, PREWARM_TIMEOUT)):
+        if error:
+            stats['failed'] += 1
+            logger.warning(f"Prewarm: {ad_account_id} {preset} failed: {error}")
+        elif warmed:
+            stats['warmed'] += 1
+        else:
+            stats['skipped'] += 1
+
+    logger.info(f"Prewarm: BM {bm.bm_id}, {len(accounts)} accounts: {stats['warmed']} warmed, "
+                f"{stats['skipped']} skipped (budget), {stats['failed']} failed")
+    return stats
+
+
+def prewarm_all(app, load_rows, presets=None, concurrency=None, bm_id=None):
+    """Warm every registered BM (or just bm_id), one BM at a time. Runs inside an app context."""
+    query = BusinessManager.query
+    if bm_id:
+        query = query.filter_by(bm_id=bm_id)
+
+    totals = {'warmed': 0, 'skipped': 0, 'failed': 0}
+    started = time.time()
+    for bm in query.all():
+        try:
+            stats = prewarm_bm(app, bm, load_rows, presets, concurrency)
+        except Exception:
+            logger.exception(f"Prewarm: BM {bm.bm_id} failed")
+            totals['failed'] += 1
+            continue
+        for key, count in stats.items():
+            totals[key] += count
+
+    logger.info(f"Prewarm finished in {time.time() - started:.1f}s: {totals}")
+    return totals
+
+
+def seconds_until(hour, now=None):
+    """Seconds until the next occurrence of hour:00 local time"""
+    now = now or datetime.now()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def start_prewarm_scheduler(app, load_rows):
+    """Run prewarm_all daily at PREWARM_HOUR on a daemon thread (no-op when unset).
+
+    Set PREWARM_HOUR shortly before the morning peak, within PREWARM_TTL of it.
+    Every worker starts the thread; the one that claims the day's run (claim_run) runs it.
+    """
+    if PREWARM_HOUR is None or PREWARM_HOUR == '':
+        return None
+
+    def loop():
+        while True:
+            time.sleep(seconds_until(int(PREWARM_HOUR)))
+            try:
+                with app.app_context():
+                    if claim_run('prewarm'):
+                        prewarm_all(app, load_rows)
+            except Exception:
+                logger.exception("Prewarm run failed")
+
+    thread = threading.Thread(target=loop, name='insights-prewarm', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from facebook_business.exceptions import FacebookRequestError
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+from metrics import phase, record_phase
+
+# Usage (% of the Meta quota) at which calls start being spaced out / are held
+USAGE_SLOWDOWN_PCT = float(os.environ.get('GRAPH_USAGE_SLOWDOWN_PCT', 75))
+USAGE_PAUSE_PCT = float(os.environ.get('GRAPH_USAGE_PAUSE_PCT', 95))
+SLOWDOWN_MAX_DELAY = float(os.environ.get('GRAPH_SLOWDOWN_MAX_DELAY', 2))  # seconds, at USAGE_PAUSE_PCT
+PAUSE_DELAY = float(os.environ.get('GRAPH_PAUSE_DELAY', 60))  # seconds, when Meta gives no regain time
+USAGE_STALE_AFTER = float(os.environ.get('GRAPH_USAGE_STALE_AFTER', 300))  # seconds
+
+MAX_RETRIES = int(os.environ.get('GRAPH_MAX_RETRIES', 3))
+BACKOFF_BASE = float(os.environ.get('GRAPH_BACKOFF_BASE', 1))  # seconds
+MAX_WAIT = float(os.environ.get('GRAPH_MAX_WAIT', 30))  # longest a call is held before failing with 429
+
+# Graph API error codes for rate limiting (app, user, page, custom and business use case limits)
+THROTTLE_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+TRANSIENT_CODES = {1, 2}
+
+_AD_ACCOUNT_PATTERN = re.compile(r'/(act_\d+)(?:/|$|\?)')
+
+
+class RateLimitError(Exception):
+    """Meta's quota for a scope is exhausted; retry after retry_after seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UsageTracker:
+    """Latest usage reported by Meta per scope ('app', 'bm:<id>', 'ad_account:<id>')"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scopes = {}
+
+    def record(self, scope, usage_pct, regain_seconds=0, details=None):
+        now = time.time()
+        with self._lock:
+            self._scopes[scope] = {
+                'usage_pct': usage_pct,
+                'regain_at': now + regain_seconds if regain_seconds else None,
+                'updated_at': now,
+                'details': details
+            }
+
+    def delay_for(self, scopes):
+        """Seconds a call touching scopes should wait, and the scope that requires it"""
+        now = time.time()
+        delay, limiting_scope = 0.0, None
+        with self._lock:
+            for scope in scopes:
+                entry = self._scopes.get(scope)
+                if not entry or now - entry['updated_at'] > USAGE_STALE_AFTER:
+                    continue
+                if entry['regain_at'] and entry['regain_at'] > now:
+                    wait = entry['regain_at'] - now
+                elif entry['usage_pct'] >= USAGE_PAUSE_PCT:
+                    wait = max(0.0, entry['updated_at'] + PAUSE_DELAY - now)
+                elif entry['usage_pct'] >= USAGE_SLOWDOWN_PCT:
+                    wait = (SLOWDOWN_MAX_DELAY * (entry['usage_pct'] - USAGE_SLOWDOWN_PCT)
+                            / (USAGE_PAUSE_PCT - USAGE_SLOWDOWN_PCT))
+                else:
+                    continue
+                if wait > delay:
+                    delay, limiting_scope = wait, scope
+        return delay, limiting_scope
+
+    def usage_pct(self, scopes):
+        """Highest fresh usage (%) reported for any of scopes"""
+        now = time.time()
+        with self._lock:
+            return max([entry['usage_pct'] for entry in (self._scopes.get(scope) for scope in scopes)
+                        if entry and now - entry['updated_at'] <= USAGE_STALE_AFTER] or [0.0])
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {
+                scope: {
+                    'usage_pct': entry['usage_pct'],
+                    'regain_in': round(max(0.0, entry['regain_at'] - now), 1) if entry['regain_at'] else 0,
+                    'age': round(now - entry['updated_at'], 1),
+                    'stale': now - entry['updated_at'] > USAGE_STALE_AFTER,
+                    'details': entry['details']
+                }
+                for scope, entry in self._scopes.items()
+            }
+
+
+tracker = UsageTracker()
+
+
+def _parse_header(headers, name):
+    value = headers.get(name) if headers else None
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def _usage_pct(entry, keys):
+    return max(float(entry.get(key) or 0) for key in keys)
+
+
+def record_usage(headers, bm_scope, ad_account_id=None):
+    """Update the tracker from the X-App-Usage / X-Business-Use-Case-Usage / X-Ad-Account-Usage headers"""
+    app_usage = _parse_header(headers, 'x-app-usage')
+    if app_usage:
+        tracker.record('app', _usage_pct(app_usage, ('call_count', 'total_cputime', 'total_time')),
+                       details=app_usage)
+
+    business_usage = _parse_header(headers, 'x-business-use-case-usage')
+    if business_usage and bm_scope:
+        entries = [entry for business_entries in business_usage.values() for entry in business_entries]
+        if entries:
+            usage = max(_usage_pct(entry, ('call_count', 'total_cputime', 'total_time')) for entry in entries)
+            regain_minutes = max(float(entry.get('estimated_time_to_regain_access') or 0) for entry in entries)
+            tracker.record(bm_scope, usage, regain_minutes * 60, details=business_usage)
+
+    account_usage = _parse_header(headers, 'x-ad-account-usage')
+    if account_usage and ad_account_id:
+        tracker.record(f"ad_account:{ad_account_id}", float(account_usage.get('acc_id_util_pct') or 0),
+                       float(account_usage.get('reset_time_duration') or 0), details=account_usage)
+
+
+def ad_account_of(path):
+    """act_<id> targeted by a call path (tuple of tokens or full URL), or None"""
+    if isinstance(path, str):
+        match = _AD_ACCOUNT_PATTERN.search(path)
+        return match.group(1) if match else None
+    for token in path:
+        if str(token).startswith('act_'):
+            return str(token)
+    return None
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter around the nominal delay"""
+    return BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _wait_or_fail(delay, scope):
+    if delay > MAX_WAIT:
+        raise RateLimitError(f"Meta API rate limit reached for {scope}, retry in {int(delay)}s", delay)
+    if delay > 0:
+        with phase('rate_limit_wait'):
+            time.sleep(delay)
+
+
+async def _async_wait_or_fail(delay, scope):
+    """_wait_or_fail for asyncio callers: the wait yields to the event loop"""
+    if delay > MAX_WAIT:
+        raise RateLimitError(f"Meta API rate limit reached for {scope}, retry in {int(delay)}s", delay)
+    if delay > 0:
+        await asyncio.sleep(delay)
+        record_phase('rate_limit_wait', delay)
+
+
+def _call_scopes(bm_id, path):
+    """(bm scope, ad account id, usage scopes) a call is budgeted against"""
+    bm_scope = f"bm:{bm_id}" if bm_id else None
+    ad_account_id = ad_account_of(path)
+    scopes = ['app'] + ([bm_scope] if bm_scope else []) + (
+        [f"ad_account:{ad_account_id}"] if ad_account_id else [])
+    return bm_scope, ad_account_id, scopes
+
+
+def _retry_delay(e, idempotent, attempt, scopes):
+    """Seconds to wait before retrying a failed call, or raise when it must not be retried"""
+    throttled = e.api_error_code() in THROTTLE_CODES or e.http_status() == 429
+    # Only idempotent calls are safe to repeat after a failure Meta may have half-processed
+    transient = idempotent and (e.api_transient_error() or e.api_error_code() in TRANSIENT_CODES
+                                or (e.http_status() or 0) >= 500)
+    if not (throttled or transient):
+        raise e
+    if attempt >= MAX_RETRIES:
+        if throttled:
+            raise RateLimitError(f"Meta API rate limit reached: {e.api_error_message()}",
+                                 max(tracker.delay_for(scopes)[0], backoff_delay(attempt))) from e
+        raise e
+    print(f"Graph API {'throttled' if throttled else 'transient error'} "
+          f"(code {e.api_error_code()}), retry {attempt + 1}/{MAX_RETRIES}")
+    return max(backoff_delay(attempt), tracker.delay_for(scopes)[0])
+
+
+def scheduled_call(call, bm_id, method, path, *args, idempotent=None, **kwargs):
+    """Run call(method, path, ...) under the usage budget, retrying throttled and transient errors.
+
+    Transient errors and dropped connections are only retried for idempotent
+    calls: GETs by default, or e.g. a batch POST made only of GETs (idempotent=True).
+    """
+    bm_scope, ad_account_id, scopes = _call_scopes(bm_id, path)
+    if idempotent is None:
+        idempotent = method == 'GET'
+
+    attempt = 0
+    while True:
+        delay, scope = tracker.delay_for(scopes)
+        _wait_or_fail(delay, scope)
+
+        try:
+            response = call(method, path, *args, **kwargs)
+        except FacebookRequestError as e:
+            record_usage(e.http_headers(), bm_scope, ad_account_id)
+            _wait_or_fail(_retry_delay(e, idempotent, attempt, scopes), scope or 'the app')
+            attempt += 1
+            continue
+        except (RequestsConnectionError, Timeout):
+            if not idempotent or attempt >= MAX_RETRIES:
+                raise
+            _wait_or_fail(backoff_delay(attempt), 'the connection')
+            attempt += 1
+            continue
+
+        record_usage(response.headers(), bm_scope, ad_account_id)
+        return response
+
+
+async def async_scheduled_call(call, bm_id, method, path, *args, idempotent=None, **kwargs):
+    """scheduled_call for a coroutine call(method, path, ...): same budget, retries and errors,
+    without blocking the event loop while waiting.
+    """
+    bm_scope, ad_account_id, scopes = _call_scopes(bm_id, path)
+    if idempotent is None:
+        idempotent = method == 'GET'
+
+    attempt = 0
+    while True:
+        delay, scope = tracker.delay_for(scopes)
+        await _async_wait_or_fail(delay, scope)
+
+        try:
+            response = await call(method, path, *args, **kwargs)
+        except FacebookRequestError as e:
+            record_usage(e.http_headers(), bm_scope, ad_account_id)
+            await _async_wait_or_fail(_retry_delay(e, idempotent, attempt, scopes), scope or 'the app')
+            attempt += 1
+            continue
+        except (RequestsConnectionError, Timeout):
+            if not idempotent or attempt >= MAX_RETRIES:
+                raise
+            await _async_wait_or_fail(backoff_delay(attempt), 'the connection')
+            attempt += 1
+            continue
+
+        record_usage(response.headers(), bm_scope, ad_account_id)
+        return response
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+import base64
+import hashlib
+import json
+import os
+
+from metrics import timed
+from models import db, Report, SharedLink
+
+# /api/reports page sizes
+REPORTS_PAGE_SIZE = 50
+REPORTS_MAX_PAGE_SIZE = 200
+
+# Reports older than this are pruned by compact_reports (unless a share link points at them)
+REPORT_RETENTION_DAYS = int(os.environ.get('REPORT_RETENTION_DAYS', 90))
+
+
+def hash_insights(insights_data):
+    """Stable content hash of an insights payload"""
+    payload = json.dumps(insights_data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@timed('db_write')
+def save_report(name, report_type, bm_id, object_id, date_preset, insights_data):
+    """Save report to database, reusing the row for the same parameters.
+
+    Identical content is not written again; changed content updates the
+    existing row in place, so the table grows with distinct reports rather
+    than with page views.
+    """
+    try:
+        content_hash = hash_insights(insights_data)
+        report = Report.query.filter_by(
+            bm_id=bm_id,
+            object_id=object_id,
+            report_type=report_type,
+            date_preset=date_preset
+        ).order_by(Report.created_at.desc()).first()
+        
+        if report and report.content_hash == content_hash:
+            return report
+        
+        if report:
+            report.report_name = name
+            report.insights_data = insights_data
+            report.content_hash = content_hash
+            report.updated_at = datetime.utcnow()
+        else:
+            report = Report(
+                report_name=name,
+                report_type=report_type,
+                bm_id=bm_id,
+                object_id=object_id,
+                date_preset=date_preset,
+                insights_data=insights_data,
+                content_hash=content_hash
+            )
+            db.session.add(report)
+        db.session.commit()
+        return report
+    except Exception as e:
+        print(f"Error saving report: {str(e)}")
+        db.session.rollback()
+        return None
+
+
+def compact_reports(retention_days=None):
+    """Delete duplicate reports (keeping the newest per parameters) and reports
+    past the retention period. Reports referenced by a share link are kept.
+
+    Returns the number of deleted rows.
+    """
+    retention_days = REPORT_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+    shared_ids = {row.report_id for row in SharedLink.query
+                  .with_entities(SharedLink.report_id)
+                  .filter(SharedLink.report_id.isnot(None))}
+
+    rows = Report.query.with_entities(
+        Report.id, Report.bm_id, Report.object_id, Report.report_type,
+        Report.date_preset, Report.created_at
+    ).order_by(Report.created_at.desc(), Report.id.desc()).all()
+
+    seen = set()
+    to_delete = []
+    for row in rows:
+        key = (row.bm_id, row.object_id, row.report_type, row.date_preset)
+        is_duplicate = key in seen
+        seen.add(key)
+        if row.id in shared_ids:
+            continue
+        if is_duplicate or (row.created_at and row.created_at < cutoff):
+            to_delete.append(row.id)
+
+    for start in range(0, len(to_delete), 500):
+        Report.query.filter(Report.id.in_(to_delete[start:start + 500])).delete(synchronize_session=False)
+    db.session.commit()
+
+    return len(to_delete)
+
+
+def encode_cursor(report):
+    """Opaque keyset cursor pointing after the given report"""
+    raw = f"{report.created_at.isoformat()}|{report.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        created_at, report_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(report_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def list_reports(limit=REPORTS_PAGE_SIZE, cursor=None, bm_id=None, include_data=False):
+    """One page of reports, newest first, using (created_at, id) keyset pagination.
+
+    Returns (reports, next_cursor); next_cursor is None on the last page.
+    """
+    query = Report.query
+    if not include_data:
+        query = query.options(db.defer(Report.insights_data))
+    if bm_id:
+        query = query.filter(Report.bm_id == bm_id)
+    if cursor:
+        created_at, report_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            Report.created_at < created_at,
+            db.and_(Report.created_at == created_at, Report.id < report_id)
+        ))
+
+    reports = query.order_by(Report.created_at.desc(), Report.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(reports[limit - 1]) if len(reports) > limit else None
+    return reports[:limit], next_cursor
@@ -0,0 +1,78 @@
+"""Shared fixtures: the app on a scratch SQLite database, talking to benchmarks/fake_graph.py.
+
+The fake Graph API and the environment are set up before the app is imported,
+since app.py reads META_GRAPH_URL and DATABASE_URL at import time.
+
+    cd backend && python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from fake_graph import FakeGraph, FakeGraphConfig  # noqa: E402
+
+GRAPH = FakeGraph()
+WORKDIR = tempfile.mkdtemp(prefix='backend-tests-')
+
+os.environ.update({
+    'META_GRAPH_URL': GRAPH.start(),
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'tests.db')}",
+    'METRICS_LOG': '0',
+    'PREWARM_HOUR': ''
+})
+
+from account_timezones import forget_timezones  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, BusinessManager  # noqa: E402
+from rate_limits import tracker  # noqa: E402
+
+BM_ID = 'bm-test'
+
+
+def pytest_configure(config):
+    # The app uses Query.get() throughout
+    config.addinivalue_line('filterwarnings', 'ignore::sqlalchemy.exc.LegacyAPIWarning')
+
+
+@pytest.fixture(scope='session')
+def app():
+    return create_app()
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    """Empty tables for every test, inside an app context"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture(autouse=True)
+def graph():
+    """The fake Graph API with the default data set, no injected errors and zeroed stats"""
+    GRAPH.config = FakeGraphConfig()
+    GRAPH.reset_stats()
+    tracker._scopes.clear()
+    forget_timezones()
+    yield GRAPH
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def bm(database):
+    bm = BusinessManager(bm_id=BM_ID, access_token='test-token')
+    database.session.add(bm)
+    database.session.commit()
+    return bm
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import date, timedelta
+
+from facebook_business.adobjects.adaccount import AdAccount
+import pytest
+
+from account_timezones import account_today
+from app import fetch_account_insights
+from async_app import FlaskBridge, fetch_account_insights as fetch_account_insights_async
+from async_graph import close_session, get_async_api
+from daily_insights import load_daily_rows
+from graph_client import get_api
+from insights_requests import account_insights_params
+from models import DailyInsightDay
+
+ACCOUNT = 'act_100001'
+PARAMS = account_insights_params('last_14d', None, None)
+
+
+def run_async(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await close_session()
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def bridge(app):
+    bridge = FlaskBridge(app)
+    yield bridge
+    bridge.shutdown()
+
+
+def store_middle_days(bm):
+    """Store 10 to 6 days ago, so last_14d is missing two ranges"""
+    middle = (date.today() - timedelta(days=10)).isoformat(), (date.today() - timedelta(days=6)).isoformat()
+    fetch_account_insights(AdAccount(ACCOUNT, api=get_api(bm)), account_insights_params(None, *middle), *middle)
+
+
+def test_async_fetch_matches_threaded_fetch(graph, bm, bridge):
+    store_middle_days(bm)
+
+    rows = run_async(fetch_account_insights_async(bridge, get_async_api(bm), ACCOUNT, PARAMS))
+
+    assert graph.stats()['calls']['insights'] == 3  # the middle range, then the two missing ones
+    assert rows == fetch_account_insights(AdAccount(ACCOUNT, api=get_api(bm)), PARAMS)
+    assert len(rows) == 14 * graph.config.campaigns
+
+
+def test_async_fetch_stores_the_ranges_that_did_not_fail(graph, bm, bridge, database):
+    store_middle_days(bm)
+    account_today(get_api(bm), ACCOUNT)
+    graph.fail_next(status=400, code=100)
+
+    with pytest.raises(Exception, match='Injected error 100'):
+        run_async(fetch_account_insights_async(bridge, get_async_api(bm), ACCOUNT, PARAMS))
+
+    # The middle days plus the range that was fetched: 5 + 4 or 5 + 5 days
+    database.session.expire_all()
+    assert DailyInsightDay.query.filter_by(ad_account_id=ACCOUNT).count() in (9, 10)
+    assert load_daily_rows(ACCOUNT, date.today() - timedelta(days=14), date.today() - timedelta(days=1))
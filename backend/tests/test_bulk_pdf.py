@@ -0,0 +1,16 @@
+import pytest
+
+
+@pytest.mark.parametrize('items', [
+    [],
+    'act_100001',
+    {'ad_account_id': 'act_100001'},
+    ['act_100001'],
+    [{'ad_account_id': 'act_100001'}, None],
+    [{'name': 'no id'}],
+])
+def test_invalid_items_are_rejected(client, bm, items):
+    response = client.post('/api/bulk-pdf', json={'bm_id': 'bm-test', 'items': items})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Items must each have an ad account ID or a campaign ID'}
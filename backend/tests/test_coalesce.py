@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import coalesce
+from coalesce import advisory_lock, advisory_lock_id, async_coalesced, coalesced, lock_engine
+
+
+class FakeLocks:
+    """The Postgres side of advisory_lock: pg_try_advisory_lock answers and what was released"""
+
+    def __init__(self, answers, pool_exhausted=False):
+        self.answers = list(answers)
+        self.pool_exhausted = pool_exhausted
+        self.attempts = 0
+        self.released = []
+
+    def connection(self, engine):
+        return None if self.pool_exhausted else 'connection'
+
+    def try_lock(self, connection, lock_id):
+        self.attempts += 1
+        return self.answers.pop(0)
+
+    def release(self, connection, lock_id=None):
+        self.released.append(lock_id)
+
+
+@pytest.fixture
+def locks(monkeypatch):
+    def install(answers=(True,), pool_exhausted=False):
+        fake = FakeLocks(answers, pool_exhausted)
+        monkeypatch.setattr(coalesce, 'lock_engine', lambda: 'engine')
+        monkeypatch.setattr(coalesce, '_lock_connection', fake.connection)
+        monkeypatch.setattr(coalesce, '_try_lock', fake.try_lock)
+        monkeypatch.setattr(coalesce, '_release', fake.release)
+        monkeypatch.setattr(coalesce, 'ADVISORY_LOCK_POLL', 0.001)
+        return fake
+    return install
+
+
+async def run_inline(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def test_no_lock_pool_off_postgres():
+    assert lock_engine() is None
+    with advisory_lock('key') as acquired:
+        assert acquired
+
+
+def test_lock_is_polled_until_acquired_then_released(locks):
+    fake = locks([False, False, True])
+
+    with advisory_lock('key') as acquired:
+        assert acquired
+        assert fake.released == []
+
+    assert fake.attempts == 3
+    assert fake.released == [advisory_lock_id('key')]
+
+
+def test_lock_not_acquired_in_time_is_not_unlocked(locks):
+    fake = locks([False] * 1000)
+
+    with advisory_lock('key', timeout=0.01) as acquired:
+        assert not acquired
+
+    assert fake.released == [None]
+
+
+def test_exhausted_lock_pool_fetches_without_the_lock(locks):
+    fake = locks(pool_exhausted=True)
+
+    assert coalesced('key', lambda: 'fetched') == 'fetched'
+    assert fake.attempts == 0 and fake.released == []
+
+
+def test_coalesced_rechecks_once_the_lock_is_held(locks):
+    locks([False, True])
+    fetches = []
+
+    result = coalesced('key', lambda: fetches.append(1) or 'fetched', recheck=lambda: 'stored by another worker')
+
+    assert result == 'stored by another worker'
+    assert fetches == []
+
+
+def test_async_coalesced_takes_the_same_lock(locks):
+    fake = locks([False, True])
+
+    async def fetch():
+        return 'fetched'
+
+    async def recheck():
+        return None
+
+    async def main():
+        return await asyncio.gather(*[async_coalesced('key', fetch, run_inline, recheck=recheck) for _ in range(3)])
+
+    assert asyncio.run(main()) == ['fetched'] * 3
+    # The three requests shared one flight: one lock taken and released
+    assert fake.attempts == 2
+    assert fake.released == [advisory_lock_id('key')]
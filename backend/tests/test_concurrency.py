@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+from concurrency import check_deadline, fan_out, gather_until
+
+
+def test_results_are_aligned_with_items():
+    def square(item):
+        if item == 3:
+            raise ValueError('bad item')
+        return item * item
+
+    assert fan_out(square, [1, 2, 3], max_workers=2) == [(1, None), (4, None), (None, 'bad item')]
+
+
+def test_timed_out_calls_stop_at_their_next_deadline_check():
+    steps = []
+    stopped = threading.Event()
+
+    def work(item):
+        try:
+            while True:
+                check_deadline()
+                steps.append(item)
+                time.sleep(0.01)
+        finally:
+            stopped.set()
+
+    assert fan_out(work, ['a', 'b'], max_workers=1, timeout=0.05) == [(None, 'Timed out after 0.05s')] * 2
+
+    # The running call gave up on its own; the queued one never started
+    assert stopped.wait(1)
+    assert set(steps) == {'a'}
+
+
+def test_nested_calls_keep_the_earliest_deadline():
+    outcome = []
+    finished = threading.Event()
+
+    def inner(item):
+        time.sleep(0.1)
+        try:
+            check_deadline()
+            outcome.append('went on')
+        except TimeoutError:
+            outcome.append('stopped')
+        finished.set()
+        return item
+
+    def outer(item):
+        return fan_out(inner, [item], max_workers=1, timeout=10)
+
+    fan_out(outer, [1], max_workers=1, timeout=0.05)
+    assert finished.wait(1)
+    assert outcome == ['stopped']
+
+
+def test_no_deadline_outside_fan_out():
+    check_deadline()
+    assert fan_out(lambda item: check_deadline() or item, [1], max_workers=1) == [(1, None)]
+
+
+def test_gather_until_isolates_failures_and_cancels_at_the_timeout():
+    cancelled = []
+
+    async def work(item):
+        if item == 'bad':
+            raise ValueError('bad item')
+        if item == 'slow':
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(item)
+                raise
+        return item
+
+    results = asyncio.run(gather_until([work('ok'), work('bad'), work('slow')], timeout=0.05))
+
+    assert results[0] == 'ok'
+    assert isinstance(results[1], ValueError) and str(results[1]) == 'bad item'
+    assert isinstance(results[2], TimeoutError) and str(results[2]) == 'Timed out after 0.05s'
+    assert cancelled == ['slow']
+
+
+def test_gather_until_keeps_the_fan_out_deadline():
+    results = []
+    finished = threading.Event()
+
+    async def work():
+        await asyncio.sleep(10)
+
+    def outer(item):
+        results.extend(asyncio.run(gather_until([work()], timeout=10)))
+        finished.set()
+
+    fan_out(outer, [1], max_workers=1, timeout=0.05)
+    assert finished.wait(1)
+    assert isinstance(results[0], TimeoutError) and str(results[0]) == 'Deadline exceeded'
@@ -0,0 +1,70 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import daily_insights
+from daily_insights import days_to_fetch, load_daily_rows, store_daily_rows
+from models import DailyInsight, DailyInsightDay
+
+ACCOUNT = 'act_100001'
+
+
+def row(day, campaign_id, spend):
+    return {'campaign_id': campaign_id, 'date_start': day.isoformat(), 'date_stop': day.isoformat(), 'spend': spend}
+
+
+@pytest.fixture(params=['on_conflict', 'select_and_write'])
+def upsert(request, monkeypatch):
+    """Store through ON CONFLICT, and through the fallback of databases without it"""
+    if request.param == 'select_and_write':
+        monkeypatch.setattr(daily_insights, '_UPSERT_INSERTS', {})
+    return request.param
+
+
+def test_store_replaces_overlapping_days(upsert):
+    store_daily_rows(ACCOUNT, date(2024, 3, 1), date(2024, 3, 3),
+                     [row(date(2024, 3, day), campaign, 1.0) for day in (1, 2, 3) for campaign in ('c1', 'c2')])
+
+    # c2 stopped delivering: the refetched days no longer have it
+    store_daily_rows(ACCOUNT, date(2024, 3, 2), date(2024, 3, 4),
+                     [row(date(2024, 3, day), 'c1', 2.0) for day in (2, 3, 4)])
+
+    rows = load_daily_rows(ACCOUNT, date(2024, 3, 1), date(2024, 3, 4))
+    assert [(r['date_start'], r['campaign_id'], r['spend']) for r in rows] == [
+        ('2024-03-01', 'c1', 1.0), ('2024-03-01', 'c2', 1.0),
+        ('2024-03-02', 'c1', 2.0), ('2024-03-03', 'c1', 2.0), ('2024-03-04', 'c1', 2.0)]
+    assert DailyInsightDay.query.filter_by(ad_account_id=ACCOUNT).count() == 4
+    assert days_to_fetch(ACCOUNT, date(2024, 3, 1), date(2024, 3, 5), today=date(2024, 6, 1)) == [date(2024, 3, 5)]
+
+
+def test_store_over_rows_it_did_not_delete(upsert):
+    """A concurrent writer's rows for the same days are updated, not a unique constraint violation"""
+    store_daily_rows(ACCOUNT, date(2024, 3, 1), date(2024, 3, 2), [row(date(2024, 3, 1), 'c1', 1.0)])
+
+    # What the second writer meets when the first one inserted after its delete
+    store_daily_rows(ACCOUNT, date(2024, 3, 1), date(2024, 3, 1),
+                     [row(date(2024, 3, 1), 'c1', 3.0), row(date(2024, 3, 1), 'c1', 4.0)])
+
+    assert [r.insight_data['spend'] for r in DailyInsight.query.all()] == [4.0]
+    assert DailyInsightDay.query.count() == 2
+
+
+def test_presets_resolve_in_the_account_timezone(client, graph, bm):
+    # A timezone whose date differs from the server's right now (UTC+14 and UTC-12 are 26 hours apart)
+    for timezone_name in ('Pacific/Kiritimati', 'Etc/GMT+12'):
+        account_today = datetime.now(ZoneInfo(timezone_name)).date()
+        if account_today != date.today():
+            break
+    graph.config.timezone_name = timezone_name
+    yesterday = (account_today - timedelta(days=1)).isoformat()
+
+    response = client.get(f'/api/account-insights?bm_id=bm-test&ad_account_id={ACCOUNT}&date_preset=yesterday')
+
+    assert response.status_code == 200
+    rows = response.get_json()['insights']
+    assert rows and {row['date_start'] for row in rows} == {yesterday}
+    # Stored under the account's yesterday, and its timezone was looked up once
+    assert {day.date.isoformat() for day in DailyInsightDay.query.filter_by(ad_account_id=ACCOUNT)} == {yesterday}
+    client.get(f'/api/account-insights?bm_id=bm-test&ad_account_id={ACCOUNT}&date_preset=last_3d')
+    assert graph.stats()['calls']['object'] == 1
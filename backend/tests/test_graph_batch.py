@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+
+from facebook_business.adobjects.ad import Ad
+from facebook_business.adobjects.adaccount import AdAccount
+from facebook_business.adobjects.campaign import Campaign
+import pytest
+
+import insights
+from ad_previews import PREVIEW_PARAMS, fetch_preview_chunk
+from app import fetch_account_insights, fetch_accounts_insights
+from daily_insights import load_daily_rows
+from graph_client import get_api
+from insights import ACCOUNT_INSIGHT_FIELDS, fetch_insight_dicts, fetch_insight_dicts_batch, sum_insight_metrics
+
+PARAMS = {'level': 'campaign', 'time_increment': 1, 'date_preset': 'last_7d'}
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    # 20 campaigns x 7 days per account: several pages each
+    monkeypatch.setattr(insights, 'INSIGHTS_PAGE_SIZE', 30)
+
+
+def http_calls(graph):
+    return graph.stats()['total']
+
+
+def test_batched_insights_match_unbatched(graph, bm):
+    api = get_api(bm)
+    account_ids = graph.account_ids()
+
+    unbatched = [fetch_insight_dicts(AdAccount(account_id, api=api), ACCOUNT_INSIGHT_FIELDS, PARAMS)
+                 for account_id in account_ids]
+    unbatched_calls = http_calls(graph)
+    graph.reset_stats()
+
+    batched = fetch_insight_dicts_batch(api, [(account_id, PARAMS) for account_id in account_ids],
+                                        ACCOUNT_INSIGHT_FIELDS)
+
+    assert batched == unbatched
+    assert all(len(rows) == 7 * graph.config.campaigns for rows in batched)
+    # One batch call per round of pages instead of one call per page
+    assert http_calls(graph) == graph.stats()['calls']['batch'] == 5 < unbatched_calls
+
+
+def test_batched_previews_match_unbatched(graph, bm):
+    api = get_api(bm)
+    chunk = [(ad['id'], ad['creative']['id']) for ad in graph.ads(graph.account_ids()[0])[:12]]
+
+    unbatched = {ad_id: {'preview_html': Ad(ad_id, api=api).get_pre_views(params=PREVIEW_PARAMS)[0]['body']}
+                 for ad_id, _ in chunk}
+    graph.reset_stats()
+
+    assert fetch_preview_chunk(api, chunk) == unbatched
+    assert http_calls(graph) == graph.stats()['calls']['batch'] == 1
+
+
+def test_batched_campaign_insights_match_unbatched(graph, bm):
+    api = get_api(bm)
+    campaign_ids = [campaign['id'] for campaign in graph.campaigns(graph.account_ids()[0])[:3]]
+
+    unbatched = [fetch_insight_dicts(Campaign(campaign_id, api=api), ACCOUNT_INSIGHT_FIELDS, PARAMS)
+                 for campaign_id in campaign_ids]
+    batched = fetch_insight_dicts_batch(api, [(campaign_id, PARAMS) for campaign_id in campaign_ids],
+                                        ACCOUNT_INSIGHT_FIELDS)
+
+    assert batched == unbatched
+
+
+def test_failed_batch_call_fails_each_request(graph, bm):
+    graph.fail_next(status=400, code=100)
+
+    results = fetch_insight_dicts_batch(get_api(bm), [(account_id, PARAMS) for account_id in graph.account_ids()],
+                                        ACCOUNT_INSIGHT_FIELDS)
+
+    assert len(results) == graph.config.accounts
+    assert all(isinstance(result, Exception) and 'Injected error 100' in str(result) for result in results)
+
+
+def test_accounts_insights_match_unbatched_through_the_daily_store(graph, bm):
+    api = get_api(bm)
+    account_ids = graph.account_ids()
+    # One account already has part of the window stored: only its other days are fetched
+    fetch_account_insights(AdAccount(account_ids[0], api=api), dict(PARAMS, date_preset='last_14d'))
+
+    batched = fetch_accounts_insights(api, account_ids, PARAMS)
+
+    week = (date.today() - timedelta(days=7), date.today() - timedelta(days=1))
+    for account_id, (rows, error) in zip(account_ids, batched):
+        assert error is None
+        assert rows == load_daily_rows(account_id, *week)
+        unbatched = fetch_account_insights(AdAccount(account_id, api=api), dict(PARAMS), refresh=True)
+        assert rows == unbatched
+
+
+def test_bm_insights_route_matches_unbatched(client, graph, bm):
+    response = client.get('/api/bm-insights?bm_id=bm-test&date_preset=last_7d')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert not body['partial']
+    calls = graph.stats()['calls']
+    assert 'insights' not in calls and calls['batch:insights'] >= graph.config.accounts
+
+    api = get_api(bm)
+    for account in body['accounts']:
+        rows = fetch_insight_dicts(AdAccount(account['ad_account_id'], api=api), ACCOUNT_INSIGHT_FIELDS, PARAMS)
+        assert account['totals'] == sum_insight_metrics(rows)
+
+    # Served from the cache the second time, without Graph API calls
+    graph.reset_stats()
+    assert client.get('/api/bm-insights?bm_id=bm-test&date_preset=last_7d').get_json() == body
+    assert 'batch' not in graph.stats()['calls']
@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+from daily_insights import load_daily_rows, store_daily_rows
+from insights import normalize_row, parse_number
+from insights_cache import get_cached_insights, store_cached_insights
+from models import Report
+
+# A row as stored before metrics were parsed
+LEGACY_ROW = {'campaign_id': '1', 'campaign_name': '2024 Sale', 'date_start': '2024-03-01', 'date_stop': '2024-03-01',
+              'spend': '12.30', 'impressions': '1000', 'clicks': '', 'reach': '900', 'frequency': '1.1',
+              'action_link_click': '7', 'action_modelled': '2.5', 'value_purchase': '36.90'}
+PARSED_ROW = dict(LEGACY_ROW, spend=12.3, impressions=1000, clicks=None, reach=900, frequency=1.1,
+                  action_link_click=7, action_modelled=2.5, value_purchase=36.9)
+
+
+def test_normalize_row_parses_legacy_metrics():
+    assert normalize_row(LEGACY_ROW) == PARSED_ROW
+    # Text fields stay strings, parsed rows are returned as they are
+    assert normalize_row(PARSED_ROW) is PARSED_ROW
+
+
+def test_parse_number():
+    assert [parse_number(value, int) for value in ('7', 7, '2.0', '2.5', '', None, 'n/a')] == [7, 7, 2, 2.5, None,
+                                                                                              None, None]
+    assert [parse_number(value, float) for value in ('12.30', 3, '', 'n/a')] == [12.3, 3.0, None, None]
+    assert parse_number('2024 Sale', None) == '2024 Sale'
+
+
+def test_stored_legacy_rows_are_served_as_numbers(database):
+    store_daily_rows('act_1', date(2024, 3, 1), date(2024, 3, 1), [LEGACY_ROW, dict(PARSED_ROW, campaign_id='2')])
+    assert load_daily_rows('act_1', date(2024, 3, 1), date(2024, 3, 1)) == [PARSED_ROW,
+                                                                            dict(PARSED_ROW, campaign_id='2')]
+
+    store_cached_insights('key', 'ad_account', 'bm', 'act_1', {}, [LEGACY_ROW], timedelta(minutes=5))
+    assert get_cached_insights('key') == [PARSED_ROW]
+
+    report = Report(report_name='Legacy', report_type='ad_account', bm_id='bm', object_id='act_1',
+                    date_preset='last_7d', insights_data=[LEGACY_ROW])
+    database.session.add(report)
+    database.session.commit()
+    assert report.to_dict()['insights_data'] == [PARSED_ROW]
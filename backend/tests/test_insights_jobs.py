@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import insights_jobs
+from account_timezones import account_today
+from daily_insights import load_daily_rows
+from graph_client import get_api
+from insights_jobs import create_insights_job, run_insights_job
+from models import InsightsJob
+
+ACCOUNT = 'act_100001'
+LAST_7D = (date.today() - timedelta(days=7), date.today() - timedelta(days=1))
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(insights_jobs, 'JOB_POLL_INTERVAL', 0.01)
+
+
+def wait_for_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/api/insights-jobs/{job_id}").get_json()
+        if job['status'] in ('completed', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def submit(client, **body):
+    response = client.post('/api/insights-jobs', json=dict({'bm_id': 'bm-test', 'ad_account_id': ACCOUNT,
+                                                            'date_preset': 'last_7d'}, **body))
+    assert response.status_code == 202
+    return response.get_json()
+
+
+def sort_rows(rows):
+    return sorted(rows, key=lambda row: (row['date_start'], row['campaign_id']))
+
+
+def test_job_completes_and_stores_daily_rows(client, graph, bm):
+    job = submit(client)
+    assert job['status'] == 'pending'
+
+    job = wait_for_job(client, job['id'])
+
+    assert job['status'] == 'completed'
+    assert job['progress'] == 100
+    assert job['row_count'] == 7 * graph.config.campaigns == len(job['result'])
+    assert job['report_run_id']
+    calls = graph.stats()['calls']
+    assert calls['insights_async'] == 1
+    assert calls['report_run'] == graph.config.async_polls
+
+    # Campaign-level daily rows land in the daily store, as a dashboard fetch would store them
+    assert sort_rows(load_daily_rows(ACCOUNT, *LAST_7D)) == sort_rows(job['result'])
+
+
+def test_job_reports_progress_while_polling(app, database, graph, bm, monkeypatch):
+    graph.config.async_polls = 3
+    job = create_insights_job('bm-test', ACCOUNT, {'level': 'campaign', 'time_increment': 1,
+                                                   'date_preset': 'last_7d'})
+    progress = []
+
+    def sleep(seconds):
+        progress.append(InsightsJob.query.get(job.id).to_dict()['progress'])
+
+    monkeypatch.setattr(insights_jobs, 'time', SimpleNamespace(monotonic=time.monotonic, sleep=sleep))
+    run_insights_job(app, job.id, get_api(bm), LAST_7D)
+
+    assert progress == [50, 50]
+    database.session.expire_all()
+    job = InsightsJob.query.get(job.id)
+    assert (job.status, job.progress) == ('completed', 100)
+
+
+def test_failed_report_run_fails_the_job(client, graph, bm):
+    graph.config.async_result = 'Job Failed'
+
+    job = wait_for_job(client, submit(client)['id'])
+
+    assert job['status'] == 'failed'
+    assert 'Job Failed' in job['error']
+    assert 'result' not in job
+    assert load_daily_rows(ACCOUNT, *LAST_7D) == []
+
+
+def test_submit_error_fails_the_job(client, graph, bm):
+    account_today(get_api(bm), ACCOUNT)  # the route's timezone lookup is not what fails
+    graph.fail_next(status=400, code=100)
+
+    job = wait_for_job(client, submit(client)['id'])
+
+    assert job['status'] == 'failed'
+    assert 'Injected error 100' in job['error']
+    assert 'insights_async' not in graph.stats()['calls']
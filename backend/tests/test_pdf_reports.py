@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import time
+
+import pdf_reports
+from models import PdfReport
+from pdf_reports import create_pdf_job, expire_pdf_reports, run_pdf_job
+
+ROWS = [{'campaign_name': 'Sale', 'spend': 12.3, 'impressions': 1000, 'clicks': 10}]
+
+
+def make_job(database, age=0, heartbeat_age=None, status='pending'):
+    report = create_pdf_job('bm-test', 'campaign', '1', 'last_7d')
+    now = datetime.utcnow()
+    report.status = status
+    report.created_at = now - timedelta(seconds=age)
+    report.updated_at = now - timedelta(seconds=age if heartbeat_age is None else heartbeat_age)
+    database.session.commit()
+    return report.id
+
+
+def status_of(database, report_id):
+    database.session.expire_all()
+    return PdfReport.query.get(report_id).status
+
+
+def test_expiry_goes_by_heartbeat_not_age(database):
+    timeout = pdf_reports.PDF_JOB_TIMEOUT
+    long_running = make_job(database, age=timeout * 3, heartbeat_age=1, status='running')
+    stalled = make_job(database, age=timeout * 3, status='running')
+
+    expire_pdf_reports()
+
+    assert status_of(database, long_running) == 'running'
+    assert status_of(database, stalled) == 'failed'
+
+
+def test_job_failed_while_queued_is_not_run(app, database):
+    report_id = make_job(database, status='failed')
+    calls = []
+
+    run_pdf_job(app, report_id, lambda: calls.append(1) or ('Title', ROWS))
+
+    assert calls == []
+    assert status_of(database, report_id) == 'failed'
+
+
+def test_job_timed_out_while_running_stays_failed(app, database):
+    report_id = make_job(database)
+
+    def fetch_rows():
+        # The heartbeat stopped long enough for another request to expire the job
+        PdfReport.query.filter_by(id=report_id).update({'updated_at': datetime(2000, 1, 1)})
+        expire_pdf_reports()
+        return 'Title', ROWS
+
+    run_pdf_job(app, report_id, fetch_rows)
+
+    assert status_of(database, report_id) == 'failed'
+    assert PdfReport.query.get(report_id).error == 'Job timed out'
+
+
+def test_completed_job(app, database):
+    report_id = make_job(database)
+
+    run_pdf_job(app, report_id, lambda: ('Title', ROWS))
+
+    report = PdfReport.query.get(report_id)
+    assert status_of(database, report_id) == 'completed'
+    assert report.content.startswith(b'%PDF') and report.size == len(report.content)
+
+
+def test_heartbeat_touches_queued_jobs(app, database, monkeypatch):
+    monkeypatch.setattr(pdf_reports, 'PDF_HEARTBEAT_INTERVAL', 0.01)
+    report_id = make_job(database, heartbeat_age=60)
+    stale = PdfReport.query.get(report_id).updated_at
+    pdf_reports._track_job(app, report_id)
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            database.session.expire_all()
+            if PdfReport.query.get(report_id).updated_at > stale:
+                break
+            time.sleep(0.02)
+        assert PdfReport.query.get(report_id).updated_at > stale
+    finally:
+        pdf_reports._untrack_job(report_id)
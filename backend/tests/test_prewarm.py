@@ -0,0 +1,58 @@
+from datetime import date, datetime, timedelta
+import logging
+
+import prewarm
+from app import prewarm_account_insights
+from daily_insights import MUTABLE_REFRESH_AFTER, days_to_fetch, store_daily_rows
+from insights_cache import TTL_LIVE, TTL_RECENT
+from models import InsightsCache
+from prewarm import PREWARM_TTL, claim_run, prewarm_all, prewarm_ttl
+
+
+def test_prewarmed_presets_stay_cached_until_the_peak():
+    early = datetime(2024, 6, 3, 5, 0)
+
+    assert prewarm_ttl('last_7d', now=early) == timedelta(seconds=PREWARM_TTL) > TTL_RECENT
+    # Not extended past midnight, when the preset's dates move
+    assert prewarm_ttl('yesterday', now=datetime(2024, 6, 3, 22, 0)) == timedelta(hours=2)
+    assert prewarm_ttl('yesterday', now=datetime(2024, 6, 3, 23, 55)) == TTL_RECENT
+    # Live windows keep their live TTL
+    assert prewarm_ttl('today', now=early) == TTL_LIVE
+
+
+def test_one_worker_claims_each_days_run(database):
+    assert claim_run('prewarm', date(2024, 6, 3))
+    assert not claim_run('prewarm', date(2024, 6, 3))
+    assert claim_run('prewarm', date(2024, 6, 4))
+    assert not claim_run('prewarm', date(2024, 6, 4))
+    assert claim_run('other', date(2024, 6, 4))
+
+
+def test_recently_fetched_mutable_days_are_not_fetched_again(database):
+    today = date.today()
+    week = (today - timedelta(days=6), today)
+    store_daily_rows('act_1', *week, [])
+
+    assert days_to_fetch('act_1', *week) == []
+
+    later = datetime.utcnow() + timedelta(seconds=MUTABLE_REFRESH_AFTER + 1)
+    mutable = days_to_fetch('act_1', *week, now=later)
+    assert mutable == [today - timedelta(days=offset) for offset in range(3, -1, -1)]
+
+
+def test_morning_loads_are_served_from_the_prewarm(app, client, graph, bm, monkeypatch, caplog):
+    monkeypatch.setattr(prewarm, 'PREWARM_PRESETS', ['last_7d'])
+
+    with caplog.at_level(logging.INFO, logger='prewarm'):
+        totals = prewarm_all(app, prewarm_account_insights, concurrency=1)
+
+    assert totals == {'warmed': graph.config.accounts, 'skipped': 0, 'failed': 0}
+    assert caplog.messages[-1].startswith('Prewarm finished')
+    entry = InsightsCache.query.first()
+    assert abs(entry.expires_at - entry.created_at - prewarm_ttl('last_7d')) < timedelta(seconds=5)
+
+    graph.reset_stats()
+    for account_id in graph.account_ids():
+        response = client.get(f'/api/account-insights?bm_id=bm-test&ad_account_id={account_id}&date_preset=last_7d')
+        assert len(response.get_json()['insights']) == 7 * graph.config.campaigns
+    assert graph.stats()['total'] == 0
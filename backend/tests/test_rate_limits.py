@@ -0,0 +1,163 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from facebook_business.exceptions import FacebookRequestError
+import pytest
+
+import rate_limits
+from async_graph import close_session, get_async_api
+from graph_batch import execute_batch
+from graph_client import get_api
+from rate_limits import BACKOFF_BASE, MAX_RETRIES, MAX_WAIT, RateLimitError, tracker
+
+ACCOUNT = 'act_100001'
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Waits of the scheduler, recorded instead of slept"""
+    waits = []
+    monkeypatch.setattr(rate_limits, 'time', SimpleNamespace(time=time.time, sleep=waits.append))
+    return waits
+
+
+def call_account(bm):
+    return get_api(bm).call('GET', (ACCOUNT, 'campaigns')).json()
+
+
+def assert_jittered_backoff(waits):
+    for attempt, wait in enumerate(waits):
+        assert BACKOFF_BASE * 2 ** attempt * 0.5 <= wait <= BACKOFF_BASE * 2 ** attempt * 1.5
+
+
+def run_async(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await close_session()
+    return asyncio.run(run())
+
+
+def test_usage_headers_are_tracked_per_scope(graph, bm, sleeps):
+    graph.config.app_usage = {'call_count': 40, 'total_cputime': 12, 'total_time': 30}
+    graph.config.business_usage = {'call_count': 20, 'total_cputime': 61, 'total_time': 5,
+                                   'estimated_time_to_regain_access': 0}
+    graph.config.account_usage = {'acc_id_util_pct': 70, 'reset_time_duration': 0}
+
+    call_account(bm)
+
+    usage = tracker.snapshot()
+    assert usage['app']['usage_pct'] == 40
+    assert usage['bm:bm-test']['usage_pct'] == 61
+    assert usage[f'ad_account:{ACCOUNT}']['usage_pct'] == 70
+    assert sleeps == []
+
+
+def test_usage_above_slowdown_spaces_calls_out(graph, bm, sleeps):
+    graph.config.app_usage = {'call_count': 85, 'total_cputime': 0, 'total_time': 0}
+
+    call_account(bm)
+    call_account(bm)
+
+    expected = rate_limits.SLOWDOWN_MAX_DELAY * (85 - rate_limits.USAGE_SLOWDOWN_PCT) / (
+        rate_limits.USAGE_PAUSE_PCT - rate_limits.USAGE_SLOWDOWN_PCT)
+    assert sleeps == [pytest.approx(expected)]
+
+
+@pytest.mark.parametrize('status, code', [(400, 4), (400, 17), (400, 613), (400, 80004), (429, 0)])
+def test_throttled_calls_are_retried_with_jittered_backoff(graph, bm, sleeps, status, code):
+    graph.fail_next(status=status, code=code, count=2)
+
+    assert call_account(bm)['data']
+
+    assert len(sleeps) == 2
+    assert_jittered_backoff(sleeps)
+    assert graph.stats()['calls']['error'] == 2
+
+
+def test_exhausted_retries_raise_rate_limit_error(graph, bm, sleeps):
+    graph.fail_next(status=400, code=17, count=MAX_RETRIES + 1)
+
+    with pytest.raises(RateLimitError) as error:
+        call_account(bm)
+
+    assert len(sleeps) == MAX_RETRIES
+    assert_jittered_backoff(sleeps)
+    assert error.value.retry_after >= BACKOFF_BASE * 2 ** MAX_RETRIES * 0.5
+
+
+def test_other_errors_are_not_retried(graph, bm, sleeps):
+    graph.fail_next(status=400, code=100)
+
+    with pytest.raises(FacebookRequestError):
+        call_account(bm)
+
+    assert sleeps == []
+    assert graph.stats()['calls']['error'] == 1
+
+
+def test_transient_errors_are_retried_for_batches_of_gets_only(graph, bm, sleeps):
+    graph.fail_next(status=500, code=2)
+
+    # A batch call is a POST, but one made only of GETs is as safe to repeat
+    responses = execute_batch(get_api(bm), [((ACCOUNT, 'campaigns'), None), ((ACCOUNT, 'ads'), None)])
+
+    assert all('data' in response for response in responses)
+    assert len(sleeps) == 1
+
+    graph.fail_next(status=500, code=2)
+    with pytest.raises(FacebookRequestError):
+        get_api(bm).call('POST', (ACCOUNT, 'campaigns'), params={'name': 'New campaign'})
+    assert len(sleeps) == 1
+
+
+def test_route_answers_429_with_retry_after_when_retries_run_out(client, graph, bm, sleeps):
+    graph.fail_next(status=400, code=17, count=MAX_RETRIES + 1)
+
+    response = client.get('/api/ad-accounts?bm_id=bm-test')
+
+    assert response.status_code == 429
+    body = response.get_json()
+    assert int(response.headers['Retry-After']) == body['retry_after'] >= 1
+    assert 'rate limit' in body['error']
+
+
+def test_route_answers_429_without_calling_meta_until_access_is_regained(client, graph, bm, sleeps):
+    # Meta asks for a minute off, longer than a request is held (MAX_WAIT)
+    graph.config.business_usage = {'call_count': 100, 'total_cputime': 0, 'total_time': 0,
+                                   'estimated_time_to_regain_access': 1}
+    assert MAX_WAIT < 60
+    assert client.get('/api/ad-accounts?bm_id=bm-test').status_code == 200
+    graph.reset_stats()
+
+    response = client.get('/api/ad-accounts?bm_id=bm-test')
+
+    assert response.status_code == 429
+    assert 55 <= int(response.headers['Retry-After']) <= 60
+    assert graph.stats()['total'] == 0
+    assert sleeps == []
+
+
+def test_async_calls_track_usage_and_retry(graph, bm, monkeypatch):
+    monkeypatch.setattr(rate_limits, 'BACKOFF_BASE', 0.001)
+    graph.config.account_usage = {'acc_id_util_pct': 42, 'reset_time_duration': 0}
+    graph.fail_next(status=400, code=17, count=2)
+
+    body = run_async(get_async_api(bm).get(f'{ACCOUNT}/campaigns'))
+
+    assert body['data']
+    assert graph.stats()['calls']['error'] == 2
+    assert tracker.snapshot()[f'ad_account:{ACCOUNT}']['usage_pct'] == 42
+
+
+def test_async_exhausted_retries_raise_rate_limit_error(graph, bm, monkeypatch):
+    monkeypatch.setattr(rate_limits, 'BACKOFF_BASE', 0.001)
+    graph.fail_next(status=429, code=0, count=MAX_RETRIES + 1)
+
+    with pytest.raises(RateLimitError) as error:
+        run_async(get_async_api(bm).get(f'{ACCOUNT}/campaigns'))
+
+    assert error.value.retry_after > 0
+    assert graph.stats()['calls']['error'] == MAX_RETRIES + 1
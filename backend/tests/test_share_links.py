@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from models import Report, SharedLink
+
+ACCOUNT = 'act_100001'
+OLD_ROWS = [{'campaign_id': '1', 'date_start': '2020-01-01', 'date_stop': '2020-01-01', 'spend': 1.0}]
+
+
+def add_report(database, age):
+    report = Report(report_name='Account Insights', report_type='ad_account', bm_id='bm-test', object_id=ACCOUNT,
+                    date_preset='last_7d', insights_data=OLD_ROWS, created_at=datetime.utcnow() - age)
+    database.session.add(report)
+    database.session.commit()
+    return report
+
+
+def share(client):
+    response = client.post('/api/create-share-link', json={'bm_id': 'bm-test', 'ad_account_id': ACCOUNT,
+                                                           'date_preset': 'last_7d'})
+    assert response.status_code == 200
+    return SharedLink.query.one()
+
+
+def test_share_link_pins_a_current_report(client, graph, bm, database):
+    add_report(database, timedelta(minutes=1))
+
+    shared_link = share(client)
+
+    assert shared_link.snapshot == OLD_ROWS
+    assert 'insights' not in graph.stats()['calls']
+
+
+def test_share_link_does_not_pin_a_stale_report(client, graph, bm, database):
+    # Saved two days ago: last_7d has moved on since
+    report = add_report(database, timedelta(days=2))
+
+    shared_link = share(client)
+
+    assert shared_link.report_id == report.id
+    assert shared_link.snapshot != OLD_ROWS
+    assert len(shared_link.snapshot) == 7 * graph.config.campaigns
+    dashboard = client.get(f'/api/account-insights?bm_id=bm-test&ad_account_id={ACCOUNT}&date_preset=last_7d')
+    assert shared_link.snapshot == dashboard.get_json()['insights']
@@ -1,6 +1,9 @@
-from app import app, db
+from app import create_app, db, run_migrations
+
+app = create_app()
 
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()  # Create tables if they don't exist
+        run_migrations()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -918,7 +918,17 @@ function Dashboard() {
         date_preset: useCustomDates ? `custom:${startDate.toISOString()}:${endDate.toISOString()}` : datePreset
       };
       
-      const response = await axios.post('/api/generate-pdf', params, {
+      // Enfileirar o PDF e aguardar a renderização (servido na hora se já estiver em cache)
+      let { data: job } = await axios.post('/api/pdf-jobs', params);
+      while (job.status === 'pending' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        ({ data: job } = await axios.get(`/api/pdf-jobs/${job.id}`));
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || 'PDF job failed');
+      }
+      
+      const response = await axios.get(job.download_url, {
         responseType: 'blob'
       });
       
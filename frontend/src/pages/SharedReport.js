@@ -42,58 +42,32 @@ function SharedReport() {
   const { token } = useParams();
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-  const [reportParams, setReportParams] = useState(null);
   const [insights, setInsights] = useState(null);
   const [reportTitle, setReportTitle] = useState('');
 
-  // Converter para useCallback e mover para antes dos useEffect
-  const validateToken = useCallback(async () => {
+  // Os dados do link são um snapshot fixo servido pelo backend (sem chamadas à API do Meta)
+  const fetchSharedReport = useCallback(async () => {
     try {
       setLoading(true);
-      const response = await axios.get(`/api/validate-share-link?token=${token}`);
+      const response = await axios.get(`/api/shared/${token}`);
+      const params = response.data.report_params;
       
-      if (response.data.valid) {
-        setReportParams(response.data.report_params);
+      if (params.campaign_id) {
+        setReportTitle(`Relatório da Campanha - ${params.date_preset}`);
       } else {
-        setError('O link de compartilhamento é inválido ou expirou');
-        setLoading(false);
+        setReportTitle(`Relatório da Conta de Anúncio - ${params.date_preset}`);
       }
-    } catch (err) {
-      setError('O link de compartilhamento é inválido ou expirou');
-      setLoading(false);
-    }
-  }, [token, setLoading, setError, setReportParams]);
-
-  const fetchReportData = useCallback(async () => {
-    try {
-      let response;
-      
-      if (reportParams.campaign_id) {
-        response = await axios.get(`/api/campaign-insights?bm_id=${reportParams.bm_id}&campaign_id=${reportParams.campaign_id}&date_preset=${reportParams.date_preset}`);
-        setReportTitle(`Relatório da Campanha - ${reportParams.date_preset}`);
-      } else if (reportParams.ad_account_id) {
-        response = await axios.get(`/api/account-insights?bm_id=${reportParams.bm_id}&ad_account_id=${reportParams.ad_account_id}&date_preset=${reportParams.date_preset}`);
-        setReportTitle(`Relatório da Conta de Anúncio - ${reportParams.date_preset}`);
-      }
-      
       setInsights(response.data.insights || []);
       setLoading(false);
     } catch (err) {
-      setError('Falha ao carregar os dados do relatório');
+      setError('O link de compartilhamento é inválido ou expirou');
       setLoading(false);
     }
-  }, [reportParams, setLoading, setInsights, setReportTitle, setError]);
+  }, [token, setLoading, setError, setReportTitle, setInsights]);
   
-  // Adicionar os useEffects depois das declarau00e7u00f5es das funu00e7u00f5es
   useEffect(() => {
-    validateToken();
-  }, [validateToken]);
-
-  useEffect(() => {
-    if (reportParams) {
-      fetchReportData();
-    }
-  }, [reportParams, fetchReportData]);
+    fetchSharedReport();
+  }, [fetchSharedReport]);
 
   // Prepare data for charts
   const prepareChartData = () => {